@@ -0,0 +1,145 @@
+# ─────────────────────────────────────────────────────────────
+# ייצוא רכישות: זמן, תפוקה וזיכרון שיא לכל פורמט מול SQLite.
+#   python -m benchmarks.bench_export --purchases 1000000
+# materialize – מה שהיה קורה עם .all() על כל הטבלה (בסיס להשוואה)
+# csv / columns / arrow – /admin/export/purchases בזרימה דרך uvicorn
+# זמנים תחת tracemalloc (בשביל זיכרון השיא) – יחסיים, לא מוחלטים.
+# בסוף: watermark – ייצוא שני ריק, ואחרי הוספה רק השורות החדשות.
+# ─────────────────────────────────────────────────────────────
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+
+import httpx
+
+from benchmarks.bench_gateway import free_port
+
+
+async def seed(args):
+    from sqlalchemy import insert
+    from database import AsyncSessionLocal, init_db
+    from models import User, Shop, Card, Purchase
+
+    await init_db()
+    cards = args.shops * 20
+    async with AsyncSessionLocal() as session:
+        await session.execute(insert(User), [{"telegram_id": 10_000 + i} for i in range(args.users)])
+        await session.execute(insert(Shop), [
+            {"owner_id": 1 + i % args.users, "name": f"shop {i}"} for i in range(args.shops)
+        ])
+        await session.execute(insert(Card), [
+            {"shop_id": 1 + i // 20, "title": f"card {i}", "image_path": "-", "price": 39.0}
+            for i in range(cards)
+        ])
+        per_batch = 20_000
+        for start in range(0, args.purchases, per_batch):
+            await add_purchases(session, start, min(args.purchases, start + per_batch), args.users, cards)
+        await session.commit()
+
+
+async def add_purchases(session, start: int, stop: int, users: int, cards: int):
+    from sqlalchemy import insert
+    from models import Purchase
+    await session.execute(insert(Purchase), [
+        {"user_id": 1 + i % users, "card_id": 1 + i % cards, "token": f"t{i}", "amount": 39.0}
+        for i in range(start, stop)
+    ])
+
+
+async def materialize() -> tuple[int, int]:
+    import queries
+    from database import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as session:
+        upto = (await session.execute(queries.purchases_max_id())).scalar()
+        rows = (await session.execute(queries.purchases_export(0, upto))).all()
+        return len(rows), sum(len(str(r)) for r in rows)
+
+
+async def export(client: httpx.AsyncClient, url: str, params: dict) -> tuple[int, int]:
+    size, lines = 0, 0
+    async with client.stream("GET", f"{url}/admin/export/purchases", params=params) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes():
+            size += len(chunk)
+            lines += chunk.count(b"\n")
+    return size, lines
+
+
+async def measured(coro) -> tuple[object, float, float]:
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = await coro
+    seconds = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+async def run(args) -> bool:
+    import uvicorn
+    import dashboard
+    from database import AsyncSessionLocal, engine
+
+    t0 = time.perf_counter()
+    await seed(args)
+    print(f"seeded {args.purchases} purchases in {time.perf_counter() - t0:.1f}s")
+
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    server = uvicorn.Server(uvicorn.Config(dashboard.app, host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    async with httpx.AsyncClient(timeout=None) as client:
+        for _ in range(100):
+            try:
+                await client.get(f"{url}/metrics")
+                break
+            except httpx.HTTPError:
+                await asyncio.sleep(0.05)
+
+        print(f"{'mode':<12}{'seconds':>10}{'rows/s':>12}{'MB out':>10}{'peak MB':>10}")
+        (rows, size), seconds, peak = await measured(materialize())
+        print(f"{'materialize':<12}{seconds:>10.2f}{rows / seconds:>12.0f}{size / 2**20:>10.1f}{peak:>10.1f}")
+        formats = ["csv", "columns"] + (["arrow"] if dashboard.pa is not None else [])
+        for format in formats:
+            (size, _), seconds, peak = await measured(export(client, url, {"format": format}))
+            print(f"{format:<12}{seconds:>10.2f}{args.purchases / seconds:>12.0f}{size / 2**20:>10.1f}{peak:>10.1f}")
+
+        # watermark: מלא → ריק → רק החדשות
+        _, first = await export(client, url, {"format": "csv", "watermark": "bench"})
+        _, empty = await export(client, url, {"format": "csv", "watermark": "bench"})
+        async with AsyncSessionLocal() as session:
+            await add_purchases(session, args.purchases, args.purchases + 10, args.users, args.shops * 20)
+            await session.commit()
+        _, fresh = await export(client, url, {"format": "csv", "watermark": "bench"})
+    server.should_exit = True
+    await serving
+    await engine.dispose()
+
+    # שורות CSV כולל header
+    ok = (first - 1, empty - 1, fresh - 1) == (args.purchases, 0, 10)
+    print(f"watermark: {first - 1} → {empty - 1} → {fresh - 1}", "ok" if ok else "FAIL")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--purchases", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--shops", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("TELEGRAM_TOKEN", "0:export")
+        os.environ.setdefault("ADMIN_ID", "0")
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tmp}/export.db"
+        ok = asyncio.run(run(args))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
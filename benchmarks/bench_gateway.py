@@ -0,0 +1,172 @@
+# ─────────────────────────────────────────────────────────────
+# השוואת polling מול webhook gateway עבור N בוטי חנות מדומים.
+#   python -m benchmarks.bench_gateway --bots 200 --updates 20
+# כל מצב רץ בתהליך נפרד מול stub_bot_api; נמדדים RSS, CPU ו־sockets
+# בזמן סרק, ותפוקת עדכונים (callback → answerCallbackQuery).
+# ─────────────────────────────────────────────────────────────
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+
+import httpx
+
+from benchmarks.stub_bot_api import callback_update
+
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def bench_tokens(n: int) -> list[str]:
+    return [f"{1000000 + i}:BENCH{i:030d}" for i in range(n)]
+
+
+def proc_rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as fp:
+        for line in fp:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def proc_cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as fp:
+        fields = fp.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / CLK_TCK
+
+
+def proc_sockets(pid: int) -> int:
+    count = 0
+    for fd in os.listdir(f"/proc/{pid}/fd"):
+        try:
+            if os.readlink(f"/proc/{pid}/fd/{fd}").startswith("socket:"):
+                count += 1
+        except OSError:
+            pass
+    return count
+
+
+# ─────────────────────────────────────────────────────────────
+# תהליך הבן: מעלה N בוטים דרך bot_manager וממתין
+# ─────────────────────────────────────────────────────────────
+async def child(n: int):
+    import bot_manager
+
+    await asyncio.gather(*(bot_manager.launch_bot(t) for t in bench_tokens(n)))
+    print("READY", flush=True)
+    await asyncio.Event().wait()
+
+
+def run_mode(mode: str, args, stub_url: str) -> dict:
+    gw_port = free_port()
+    env = dict(
+        os.environ,
+        SHOP_BOT_MODE=mode,
+        BOT_API_URL=f"{stub_url}/bot",
+        WEBHOOK_BASE_URL=f"http://127.0.0.1:{gw_port}",
+        WEBHOOK_HOST="127.0.0.1",
+        WEBHOOK_PORT=str(gw_port),
+    )
+    httpx.post(f"{stub_url}/_stub/reset")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.bench_gateway", "--child", "--bots", str(args.bots)],
+        env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+    )
+    try:
+        t0 = time.perf_counter()
+        if proc.stdout.readline().strip() != "READY":
+            raise RuntimeError(f"{mode}: child failed to start")
+        startup = time.perf_counter() - t0
+
+        # סרק: כמה עולה להחזיק N בוטים בלי תנועה
+        time.sleep(1)
+        cpu0 = proc_cpu_seconds(proc.pid)
+        time.sleep(args.idle)
+        idle_cpu = (proc_cpu_seconds(proc.pid) - cpu0) / args.idle
+        idle_rss = proc_rss_mb(proc.pid)
+        sockets = proc_sockets(proc.pid)
+
+        # עומס: updates × bots callbacks
+        total = args.bots * args.updates
+        t0 = time.perf_counter()
+        httpx.post(f"{stub_url}/_stub/push", json={
+            "tokens": bench_tokens(args.bots),
+            "count": args.updates,
+            "update": callback_update(4242, "switch_admin"),
+        }, timeout=60)
+        done = 0
+        while done < total:
+            time.sleep(0.05)
+            calls = httpx.get(f"{stub_url}/_stub/stats").json()["calls"]
+            done = calls.get("answerCallbackQuery", 0)
+            if time.perf_counter() - t0 > args.deadline:
+                break
+        elapsed = time.perf_counter() - t0
+        return {
+            "mode": mode,
+            "startup_s": startup,
+            "idle_cpu_pct": idle_cpu * 100,
+            "idle_rss_mb": idle_rss,
+            "sockets": sockets,
+            "processed": done,
+            "updates_per_s": done / elapsed,
+            "load_rss_mb": proc_rss_mb(proc.pid),
+        }
+    finally:
+        proc.kill()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bots", type=int, default=100)
+    parser.add_argument("--updates", type=int, default=20, help="updates per bot")
+    parser.add_argument("--idle", type=float, default=5.0, help="idle window, seconds")
+    parser.add_argument("--deadline", type=float, default=120.0)
+    parser.add_argument("--modes", default="polling,webhook")
+    parser.add_argument("--child", action="store_true")
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(child(args.bots))
+        return
+
+    stub_port = free_port()
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    stub = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.stub_bot_api", "--port", str(stub_port)],
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(f"{stub_url}/_stub/stats")
+                break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+
+        rows = [run_mode(mode, args, stub_url) for mode in args.modes.split(",")]
+    finally:
+        stub.kill()
+        stub.wait()
+
+    print(f"bots={args.bots} updates/bot={args.updates}")
+    header = ("mode", "startup_s", "idle_cpu_pct", "idle_rss_mb", "sockets",
+              "processed", "updates_per_s", "load_rss_mb")
+    print("".join(f"{h:>15}" for h in header))
+    for row in rows:
+        print("".join(
+            f"{row[h]:>15.2f}" if isinstance(row[h], float) else f"{row[h]:>15}" for h in header
+        ))
+
+
+if __name__ == "__main__":
+    main()
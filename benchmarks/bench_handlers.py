@@ -0,0 +1,241 @@
+# ─────────────────────────────────────────────────────────────
+# Latency של handlers בלי Telegram: עדכונים סינתטיים דרך
+# Application.process_update מול StubRequest שמקליט את היציאות.
+#   python -m benchmarks.bench_handlers --shops 50 --cards 20 --purchases 5000 --iterations 200
+#   python -m benchmarks.bench_handlers --json results.json   # למעקב בין גרסאות
+# ─────────────────────────────────────────────────────────────
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from collections import defaultdict
+
+ADMIN = 1
+BOT_TOKEN = "100:HANDLERS"
+SHOP_TOKEN = "200:SHOPBOT"
+REG_TOKEN = "300:REGISTRATION"
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def setup_env(workdir: str):
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.environ.update(
+        TELEGRAM_TOKEN=REG_TOKEN,
+        ADMIN_ID=str(ADMIN),
+        TELEGRAM_ADMIN_ID=str(ADMIN),
+        DATABASE_URL=f"sqlite+aiosqlite:///{workdir}/bench.db",
+    )
+
+
+async def seed_db(args) -> dict:
+    from sqlalchemy import insert
+    from database import AsyncSessionLocal, init_db
+    from models import User, Shop, Card, Purchase
+    import leaderboard
+
+    await init_db()
+    cards = args.shops * args.cards
+    async with AsyncSessionLocal() as session:
+        await session.execute(insert(User), [
+            {"telegram_id": ADMIN + i, "is_admin": i == 0} for i in range(args.users)
+        ])
+        await session.execute(insert(Shop), [
+            {"owner_id": 1 + i % args.users, "name": f"shop{i}"} for i in range(args.shops)
+        ])
+        await session.execute(insert(Card), [
+            {"shop_id": 1 + i // args.cards, "title": f"card {i}", "image_path": "-", "price": 39.0}
+            for i in range(cards)
+        ])
+        await session.execute(insert(Purchase), [
+            {"user_id": 1 + i % args.users, "card_id": 1 + i % cards, "token": f"seed-{i}", "amount": 39.0}
+            for i in range(args.purchases)
+        ])
+        await leaderboard.rebuild(session)
+        await session.commit()
+    return {"users": args.users, "shops": args.shops, "cards": cards}
+
+
+def seed_fs(args):
+    for s in range(args.shops):
+        cards = os.path.join("shops", f"shop{s}", "cards")
+        os.makedirs(cards, exist_ok=True)
+        for c in range(args.cards):
+            open(os.path.join(cards, f"{c}.jpg"), "wb").close()
+    logs = defaultdict(list)
+    for i in range(args.purchases):
+        shop = f"shop{i % args.shops}"
+        logs[shop].append(f"{ADMIN + i % args.users}\t{i % args.cards}\tseed-{i}\n")
+    for shop, lines in logs.items():
+        with open(os.path.join("shops", shop, "purchases.log"), "w") as fp:
+            fp.writelines(lines)
+
+
+async def build(api, token: str, register):
+    from telegram.ext import ApplicationBuilder
+    from benchmarks.stub_bot_api import StubRequest
+
+    app = (
+        ApplicationBuilder()
+        .token(token)
+        .request(StubRequest(api))
+        .get_updates_request(StubRequest(api))
+        .updater(None)
+        .build()
+    )
+    register(app)
+    await app.initialize()
+    return app
+
+
+async def run(args) -> dict:
+    from telegram import Update
+    import httpx
+    from benchmarks.stub_bot_api import FAKE_JPEG, StubBotAPI, callback_update, message_update
+    from image_store import image_store
+
+    await seed_db(args)
+    seed_fs(args)
+
+    import bot
+    import shop_bot
+    import main as registration
+    import bot_manager
+
+    async def no_launch(token):
+        # הבנצ'מרק מודד את ה־handler, לא את העלאת בוט החנות
+        return None
+    bot_manager.launch_bot = no_launch
+    bot_manager.add_bot = no_launch
+    image_store.client = httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, content=FAKE_JPEG))
+    )
+
+    api = StubBotAPI(record=True)
+    apps = {
+        "bot":  await build(api, BOT_TOKEN, bot.register_handlers),
+        "shop": await build(api, SHOP_TOKEN, shop_bot.register_handlers),
+        "reg":  await build(api, REG_TOKEN, registration.register_handlers),
+    }
+    rnd = random.Random(args.seed)
+    timings: dict[str, list[float]] = defaultdict(list)
+
+    async def drive(label: str, app_name: str, update: dict):
+        app = apps[app_name]
+        update = Update.de_json({"update_id": 1, **update}, app.bot)
+        started = time.perf_counter()
+        await app.process_update(update)
+        timings[label].append(time.perf_counter() - started)
+
+    def customer() -> int:
+        return ADMIN + rnd.randrange(1, args.users)
+
+    for i in range(args.iterations):
+        shop_id = rnd.randrange(1, args.shops + 1)
+        card_id = rnd.randrange(1, args.shops * args.cards + 1)
+        shop = f"shop{shop_id - 1}"
+        uid = customer()
+
+        for data in ("cust_browse", "cust_myshops", "cust_tokens",
+                     f"browse_{shop_id}", f"myshop_{shop_id}", f"buy_{card_id}"):
+            label = data.split("_")[0] + "_" if data[-1].isdigit() else data
+            await drive(f"bot:{label}", "bot", callback_update(uid, data, message_id=i + 1))
+        for data in ("admin_shops", "admin_lb"):
+            await drive(f"bot:{data}", "bot", callback_update(ADMIN, data))
+
+        for data, label in (("cust_browse", "cust_browse"), (f"shop_{shop}", "shop_"),
+                            (f"buy_{shop}_{rnd.randrange(args.cards)}", "buy_"),
+                            ("cust_tokens", "cust_tokens")):
+            await drive(f"shop:{label}", "shop", callback_update(uid, data, message_id=i + 1))
+        await drive("shop:admin_sales", "shop", callback_update(ADMIN, "admin_sales"))
+
+        reg_uid = 10_000_000 + i
+        for label, update in (
+            ("/start",  message_update(reg_uid, text="/start")),
+            ("contact", message_update(reg_uid, contact="+972500000000")),
+            ("token",   message_update(reg_uid, text=f"{900 + i}:REGISTERED")),
+            ("photo",   message_update(reg_uid, photo=f"photo{i}")),
+            ("title",   message_update(reg_uid, text="My shop")),
+            ("price",   message_update(reg_uid, text="49")),
+        ):
+            await drive(f"reg:{label}", "reg", update)
+
+    # סערת לחיצות: אותו buy_ שלוש פעמים במקביל (idempotency → כתיבה אחת)
+    async def storm(label: str, app_name: str, update: dict, presses: int = 3):
+        started = time.perf_counter()
+        await asyncio.gather(*(drive(f"{label}x1", app_name, update) for _ in range(presses)))
+        timings[f"{label}x{presses}"].append(time.perf_counter() - started)
+
+    for i in range(args.iterations // 10):
+        uid, message_id = customer(), 1_000_000 + i
+        card_id = rnd.randrange(1, args.shops * args.cards + 1)
+        await storm("bot:buy_", "bot", callback_update(uid, f"buy_{card_id}", message_id))
+        shop = f"shop{rnd.randrange(args.shops)}"
+        await storm("shop:buy_", "shop", callback_update(uid, f"buy_{shop}_{rnd.randrange(args.cards)}", message_id))
+
+    from purchase_writer import purchase_writer
+    from idempotency import COLLAPSED
+    from catalog import catalog
+    from shop_catalog import shop_catalog
+    await purchase_writer.stop()
+    for app in apps.values():
+        await app.shutdown()
+
+    return {
+        "sizes": {"users": args.users, "shops": args.shops, "cards": args.shops * args.cards,
+                  "purchases": args.purchases},
+        "outgoing": len(api.sent),
+        "caches": {"catalog": catalog.stats(), "shop_catalog": shop_catalog.stats()},
+        "collapsed": {":".join(labels): count for labels, count in COLLAPSED._values.items()},
+        "purchases_written": purchase_writer.written,
+        "handlers": {
+            label: {
+                "n": len(ts),
+                "p50_ms": percentile(ts, 50) * 1000,
+                "p95_ms": percentile(ts, 95) * 1000,
+                "p99_ms": percentile(ts, 99) * 1000,
+            }
+            for label, ts in sorted(timings.items())
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--shops", type=int, default=50)
+    parser.add_argument("--cards", type=int, default=20, help="cards per shop")
+    parser.add_argument("--purchases", type=int, default=5000)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        setup_env(workdir)
+        results = asyncio.run(run(args))
+
+    sizes = results["sizes"]
+    print(f"users={sizes['users']} shops={sizes['shops']} cards={sizes['cards']} "
+          f"purchases={sizes['purchases']} outgoing={results['outgoing']}")
+    for name, stats in results["caches"].items():
+        print(f"{name}: {stats}")
+    print(f"collapsed: {results['collapsed']} purchases_written={results['purchases_written']}")
+    print(f"{'handler':<22}{'n':>6}{'p50_ms':>10}{'p95_ms':>10}{'p99_ms':>10}")
+    for label, r in results["handlers"].items():
+        print(f"{label:<22}{r['n']:>6}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}")
+    if args.json:
+        with open(args.json, "w") as fp:
+            json.dump(results, fp, indent=2)
+
+
+if __name__ == "__main__":
+    main()
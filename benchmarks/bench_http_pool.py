@@ -0,0 +1,121 @@
+# ─────────────────────────────────────────────────────────────
+# HTTP client לכל בוט מול pool משותף (http_pool.py), N בוטי חנות ב־polling.
+#   python -m benchmarks.bench_http_pool --bots 200 --updates 5
+# כל מצב בתהליך נפרד (ה־child של bench_supervisor, staged) מול stub_bot_api:
+# זמן אתחול, RSS, sockets פתוחים, ותפוקה של עדכונים (answerCallbackQuery).
+# ה־stub ב־HTTP רגיל: בלי TLS, כך שהחיסכון ב־handshakes לא נמדד כאן.
+# --latency-ms: RTT מדומה לכל קריאת API (Bot API אמיתי: עשרות ms)
+# ─────────────────────────────────────────────────────────────
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+import httpx
+
+from benchmarks.bench_gateway import free_port, bench_tokens, proc_rss_mb, proc_sockets, proc_cpu_seconds
+from benchmarks.stub_bot_api import callback_update
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def answered(stub_url: str) -> int:
+    return httpx.get(f"{stub_url}/_stub/stats").json()["calls"].get("answerCallbackQuery", 0)
+
+
+def run_mode(shared: bool, args, stub_url: str) -> dict:
+    env = dict(
+        os.environ,
+        PYTHONPATH=REPO,
+        SHOP_BOT_MODE="polling",
+        BOT_API_URL=f"{stub_url}/bot",
+        BOT_START_CONCURRENCY=str(args.concurrency),
+        HTTP_SHARED_POOL="1" if shared else "0",
+        LOG_LEVEL="WARNING",
+    )
+    httpx.post(f"{stub_url}/_stub/reset")
+    tokens = bench_tokens(args.bots)
+    with tempfile.TemporaryDirectory() as tmp:
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.bench_supervisor", "--child", "staged", "--bots", str(args.bots)],
+            cwd=tmp, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+        )
+        try:
+            line = proc.stdout.readline().strip()
+            if not line.startswith("READY "):
+                raise RuntimeError("child failed to start")
+            report = json.loads(line[6:])
+            time.sleep(1)
+            rss, sockets = proc_rss_mb(proc.pid), proc_sockets(proc.pid)
+
+            total = args.bots * args.updates
+            cpu = proc_cpu_seconds(proc.pid)
+            t0 = time.perf_counter()
+            httpx.post(f"{stub_url}/_stub/push", json={
+                "tokens": tokens, "count": args.updates, "update": callback_update(4242, "switch_admin"),
+            }, timeout=60)
+            done = 0
+            while done < total and time.perf_counter() - t0 < args.deadline:
+                time.sleep(0.05)
+                done = answered(stub_url)
+            seconds = time.perf_counter() - t0
+            cpu = proc_cpu_seconds(proc.pid) - cpu
+            return {
+                "pool": "shared" if shared else "per-bot",
+                "boot_s": report["boot_seconds"],
+                "active": report["active"],
+                "rss_mb": rss,
+                "sockets": sockets,
+                "peak_sockets": max(sockets, proc_sockets(proc.pid)),
+                "updates_per_s": done / seconds,
+                "cpu_ms_per_update": cpu * 1000 / max(done, 1),
+            }
+        finally:
+            proc.kill()
+            proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bots", type=int, default=200)
+    parser.add_argument("--updates", type=int, default=5, help="updates per bot")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--deadline", type=float, default=120.0)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--modes", default="per-bot,shared")
+    args = parser.parse_args()
+
+    stub_port = free_port()
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    stub = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.stub_bot_api", "--port", str(stub_port),
+         "--latency-ms", str(args.latency_ms)],
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(f"{stub_url}/_stub/stats")
+                break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        rows = [run_mode(mode == "shared", args, stub_url) for mode in args.modes.split(",")]
+    finally:
+        stub.kill()
+        stub.wait()
+
+    print(f"bots={args.bots} updates/bot={args.updates} concurrency={args.concurrency} "
+          f"latency_ms={args.latency_ms}")
+    header = ("pool", "boot_s", "active", "rss_mb", "sockets", "peak_sockets", "updates_per_s", "cpu_ms_per_update")
+    print("".join(f"{h:>18}" for h in header))
+    for row in rows:
+        print("".join(
+            f"{row[h]:>18.2f}" if isinstance(row[h], float) else f"{row[h]:>18}" for h in header
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# ─────────────────────────────────────────────────────────────
+# ייבוא registrations/ + shops/ ל־DB: תפוקה ואידמפוטנטיות.
+#   python -m benchmarks.bench_import --shops 200 --cards 50 --purchases 100000
+# בונה עצים סינתטיים בתיקייה זמנית, מריץ importer.py, ואז:
+#   • הרצה חוזרת – כל התיקיות מסומנות done ב־IMPORT_STATE
+#   • בלי IMPORT_STATE – סורק הכל שוב, ומספר השורות ב־DB לא משתנה
+#   • c1 בכל חנות נושא את הכותרת של c0 – נכנס קלף אחד, לא שניים
+# ─────────────────────────────────────────────────────────────
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+
+def build_trees(args, rnd: random.Random):
+    for uid in range(args.registrations):
+        folder = os.path.join("registrations", str(100_000 + uid), f"{5_000_000 + uid}:AA{uid:08d}")
+        os.makedirs(folder)
+        with open(os.path.join(folder, "meta.json"), "w", encoding="utf-8") as fp:
+            json.dump({"contact": f"+9725{uid:08d}", "title": f"reg card {uid}", "price": 39.0,
+                       "image": "images/x.jpg", "file_id": "-", "timestamp": "2026-01-01T00:00:00"}, fp)
+    for shop in range(args.shops):
+        cards = os.path.join("shops", f"shop{shop}", "cards")
+        os.makedirs(cards)
+        for card in range(args.cards):
+            open(os.path.join(cards, f"c{card}.jpg"), "wb").close()
+            with open(os.path.join(cards, f"c{card}.json"), "w") as fp:
+                json.dump({"price": 10.0 + card, **({"title": "c0"} if card == 1 else {})}, fp)
+    for i in range(args.purchases):
+        folder = os.path.join("shops", f"shop{rnd.randrange(args.shops)}", "purchases", f"c{rnd.randrange(args.cards)}")
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f"{200_000 + i % args.buyers}.token"), "w") as fp:
+            fp.write(f"tok-{i}")
+
+
+async def table_counts() -> dict:
+    from sqlalchemy import func
+    from sqlalchemy.future import select
+    from database import AsyncSessionLocal
+    from models import User, Shop, Card, Purchase, UserSpend
+
+    async with AsyncSessionLocal() as session:
+        return {model.__tablename__: await session.scalar(select(func.count()).select_from(model))
+                for model in (User, Shop, Card, Purchase, UserSpend)}
+
+
+async def run(args) -> bool:
+    import importer
+    from database import engine
+
+    first = await importer.Importer().run()
+    after_first = await table_counts()
+    again = await importer.Importer().run()
+    os.remove(importer.IMPORT_STATE)
+    rescan = await importer.Importer().run()
+    after_rescan = await table_counts()
+    await engine.dispose()
+
+    for name, report in (("import", first), ("resume", again), ("rescan", rescan)):
+        print(f"{name:<8} {report['seconds']:7.2f}s {report['rows_per_s']:>10.0f} rows/s  "
+              f"skipped_dirs={report['skipped_dirs']}")
+    print("db rows:", after_first)
+    # מספר הרכישות = קבצי .token ייחודיים (קנייה חוזרת של אותו קלף דורסת את הקובץ)
+    ok = after_first == after_rescan and again["skipped_dirs"] == args.registrations + args.shops
+    # כותרת כפולה (c0/c1) בתוך אותה אצווה = קלף אחד
+    ok = ok and after_first["cards"] == args.registrations + args.shops * (args.cards - (args.cards > 1))
+    print("idempotent:", "ok" if ok else f"FAIL {after_rescan}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--registrations", type=int, default=2000)
+    parser.add_argument("--shops", type=int, default=200)
+    parser.add_argument("--cards", type=int, default=50)
+    parser.add_argument("--purchases", type=int, default=100_000)
+    parser.add_argument("--buyers", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        t0 = time.perf_counter()
+        build_trees(args, random.Random(args.seed))
+        print(f"built trees in {time.perf_counter() - t0:.1f}s")
+        os.environ.setdefault("TELEGRAM_TOKEN", "0:import")
+        os.environ.setdefault("ADMIN_ID", "0")
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tmp}/import.db"
+        ok = asyncio.run(run(args))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
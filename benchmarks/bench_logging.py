@@ -0,0 +1,99 @@
+# ─────────────────────────────────────────────────────────────
+# עלות לרשומת לוג בצד הקורא (הלולאה): filter ישן וסינכרוני על
+# ה־root מול LazyQueueHandler + redaction ב־thread של ה־listener.
+#   python -m benchmarks.bench_logging --records 50000 --secrets 1000
+# ─────────────────────────────────────────────────────────────
+import os
+import time
+import queue
+import logging
+import argparse
+from logging.handlers import QueueListener
+
+from logging_config import LazyQueueHandler, RedactTokenFilter, SecretRegistry, LOG_FORMAT
+
+
+class EagerRedactFilter(logging.Filter):
+    # ההתנהגות הקודמת: getMessage לכל רשומה, טוקן יחיד
+    def __init__(self, secret: str):
+        super().__init__()
+        self.secret = secret
+
+    def filter(self, record):
+        record.msg = record.getMessage().replace(self.secret, "<REDACTED>")
+        record.args = None
+        return True
+
+
+def fake_token(n: int) -> str:
+    return f"{600_000_000 + n}:AA{n:034d}"
+
+
+def fake_webhook_secret(n: int) -> str:
+    return f"whsec{n:027x}"
+
+
+def measure(logger: logging.Logger, records: int, level: int) -> float:
+    token = fake_token(7)
+    started = time.perf_counter()
+    for i in range(records):
+        logger.log(level, "update %s from chat %d via %s secret %s", i, 1000 + i, token, fake_webhook_secret(8))
+    return (time.perf_counter() - started) / records * 1e9
+
+
+def isolated_logger(name: str, handler: logging.Handler) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.handlers[:] = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=50_000)
+    parser.add_argument("--secrets", type=int, default=1000, help="כמה סודות רשומים (טוקנים + סודות webhook)")
+    args = parser.parse_args()
+
+    devnull = open(os.devnull, "w")
+    registry = SecretRegistry()
+    for n in range(args.secrets):
+        # חצי טוקנים (מכוסים ע"י TOKEN_SHAPE), חצי סודות webhook (ב־trie)
+        registry.register(fake_token(n) if n % 2 else fake_webhook_secret(n))
+
+    # לפני: StreamHandler סינכרוני + filter eager
+    sync_handler = logging.StreamHandler(devnull)
+    sync_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    sync_handler.addFilter(EagerRedactFilter(fake_token(7)))
+    before = isolated_logger("bench.before", sync_handler)
+
+    # אחרי: LazyQueueHandler בצד הקורא, redaction + פורמט + I/O ב־listener
+    target = logging.StreamHandler(devnull)
+    target.setFormatter(logging.Formatter(LOG_FORMAT))
+    target.addFilter(RedactTokenFilter(registry))
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, target, respect_handler_level=True)
+    after = isolated_logger("bench.after", LazyQueueHandler(log_queue))
+
+    print(f"records={args.records} registered secrets={len(registry)}")
+    for label, logger in (("sync eager filter", before), ("queue + lazy prepare", after)):
+        emitted = measure(logger, args.records, logging.INFO)
+        dropped = measure(logger, args.records, logging.DEBUG)
+        print(f"{label:<22} emitted {emitted:8.0f} ns/record   below level {dropped:6.0f} ns/record")
+
+    # צד ה־listener: כמה זמן לרוקן את מה שנצבר (redaction מול כל הסודות)
+    started = time.perf_counter()
+    listener.start()
+    listener.stop()
+    drained = (time.perf_counter() - started) / args.records * 1e9
+    print(f"{'listener thread':<22} drained {drained:8.0f} ns/record (off the event loop)")
+
+    sample = logging.LogRecord("x", logging.INFO, __file__, 0, "token %s secret %s",
+                               (fake_token(3), fake_webhook_secret(4)), None)
+    RedactTokenFilter(registry).filter(sample)
+    assert sample.getMessage() == "token <REDACTED> secret <REDACTED>", sample.getMessage()
+    devnull.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# ─────────────────────────────────────────────────────────────
+# Scheduler יוצא מול stub שאוכף מגבלות flood (429 + retry_after).
+#   python -m benchmarks.bench_outbound --bots 3 --chats 150 --interactive 30
+# מצב direct: כל בוט שולח ישירות, כמו היום. מצב scheduled: כל הבוטים
+# חולקים OutboundScheduler אחד. יוצא עם קוד 1 אם במצב scheduled
+# ה־stub החזיר 429 או שבקשה נכשלה.
+# ─────────────────────────────────────────────────────────────
+import sys
+import time
+import asyncio
+import argparse
+
+from telegram.error import RetryAfter
+from telegram.ext import ExtBot
+
+import outbound
+from benchmarks.stub_bot_api import FloodLimits, StubBotAPI, StubRequest
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def guarded(coro, failures: list):
+    try:
+        return await coro
+    except RetryAfter as exc:
+        failures.append(exc)
+
+
+async def fan_out(bot: ExtBot, chats: int, failures: list) -> float:
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        guarded(bot.send_message(1_000_000 + i, f"notice {i}",
+                                 rate_limit_args=outbound.lane_args(bot, outbound.NOTIFY)), failures)
+        for i in range(chats)
+    ))
+    return time.perf_counter() - started
+
+
+async def interactive(bot: ExtBot, count: int, latencies: list, failures: list):
+    # משתמשים שלוחצים על כפתור בזמן שההתראות בתור
+    for i in range(count):
+        started = time.perf_counter()
+        await guarded(bot.edit_message_text(f"menu {i}", chat_id=2_000_000 + i, message_id=1), failures)
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.02)
+
+
+async def edit_burst(bot: ExtBot, edits: int, failures: list):
+    # אותה הודעה נערכת שוב ושוב (למשל מונה שמתעדכן)
+    await asyncio.gather(*(
+        guarded(bot.edit_message_text(f"progress {i}", chat_id=3_000_000, message_id=7), failures)
+        for i in range(edits)
+    ))
+
+
+async def run(mode: str, args) -> dict:
+    api = StubBotAPI(limits=FloodLimits(args.chat_rate, args.chat_burst, args.bot_rate))
+    scheduler = outbound.OutboundScheduler(bot_rate=args.bot_rate, chat_rate=args.chat_rate,
+                                           chat_burst=args.chat_burst)
+    bots = []
+    for n in range(args.bots):
+        token = f"{700_000 + n}:bench"
+        limiter = scheduler.limiter_for(token) if mode == "scheduled" else None
+        bot = ExtBot(token, request=StubRequest(api), get_updates_request=StubRequest(api), rate_limiter=limiter)
+        await bot.initialize()
+        bots.append(bot)
+
+    failures, latencies = [], []
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        asyncio.gather(fan_out(bot, args.chats, failures),
+                       interactive(bot, args.interactive, latencies, failures),
+                       edit_burst(bot, args.edits, failures))
+        for bot in bots
+    ))
+    elapsed = time.perf_counter() - started
+    for bot in bots:
+        await bot.shutdown()
+
+    return {
+        "mode": mode,
+        "elapsed_s": elapsed,
+        "fan_out_s": max(r[0] for r in results),
+        "rejected_429": api.rejected,
+        "failed": len(failures),
+        "edits_sent": api.calls["editMessageText"],
+        "interactive_p50_ms": percentile(latencies, 50) * 1000,
+        "interactive_p95_ms": percentile(latencies, 95) * 1000,
+        **({"scheduler": scheduler.stats()} if mode == "scheduled" else {}),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bots", type=int, default=3)
+    parser.add_argument("--chats", type=int, default=150, help="התראות לכל בוט, כל אחת לצ'אט אחר")
+    parser.add_argument("--interactive", type=int, default=30)
+    parser.add_argument("--edits", type=int, default=20)
+    parser.add_argument("--bot-rate", type=float, default=30)
+    parser.add_argument("--chat-rate", type=float, default=1)
+    parser.add_argument("--chat-burst", type=float, default=3)
+    parser.add_argument("--modes", default="direct,scheduled")
+    args = parser.parse_args()
+
+    ok = True
+    for mode in args.modes.split(","):
+        result = asyncio.run(run(mode, args))
+        print(result)
+        if mode == "scheduled" and (result["rejected_429"] or result["failed"]):
+            ok = False
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
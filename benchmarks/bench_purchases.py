@@ -0,0 +1,200 @@
+# ─────────────────────────────────────────────────────────────
+# תפוקת רכישות: commit לכל רכישה מול purchase_writer (group commit),
+# לכל פרופיל אחסון (DB_PROFILE).
+#   python -m benchmarks.bench_purchases --clients 200 --per-client 10
+#   python -m benchmarks.bench_purchases --profiles sqlite,sqlite-wal,postgres
+# כל ריצה בתהליך נפרד מול DB חדש. postgres: --postgres-url לשרת קיים,
+# אחרת מרימים שרת זמני עם initdb/pg_ctl אם הם מותקנים (אחרת מדלגים).
+# ─────────────────────────────────────────────────────────────
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import shutil
+import socket
+import tempfile
+import subprocess
+from glob import glob
+from datetime import datetime
+
+
+async def seed(users: int, cards: int) -> tuple[list[int], list[int]]:
+    from database import AsyncSessionLocal, engine, init_db
+    from models import Base, User, Shop, Card
+
+    if engine.dialect.name != "sqlite":
+        # שרת משותף בין ריצות – מתחילים מטבלאות ריקות
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+    await init_db()
+    async with AsyncSessionLocal() as session:
+        us = [User(telegram_id=10_000 + i) for i in range(users)]
+        session.add_all(us)
+        await session.flush()
+        shop = Shop(owner_id=us[0].id, name="bench")
+        session.add(shop)
+        await session.flush()
+        cs = [Card(shop_id=shop.id, title=f"card {i}", image_path="-", price=39.0) for i in range(cards)]
+        session.add_all(cs)
+        await session.commit()
+        return [u.id for u in us], [c.id for c in cs]
+
+
+async def naive_purchase(user_id: int, card_id: int) -> str:
+    # הנתיב הישן של buy_: session, SELECT, INSERT ו־commit לכל לחיצה
+    from sqlalchemy.future import select
+    from database import AsyncSessionLocal
+    from models import Card, Purchase
+    import leaderboard
+
+    token = str(uuid.uuid4())
+    async with AsyncSessionLocal() as session:
+        card = (await session.execute(select(Card).where(Card.id == card_id))).scalar_one()
+        session.add(Purchase(user_id=user_id, card_id=card.id, token=token,
+                             amount=card.price, created_at=datetime.utcnow()))
+        await leaderboard.record_purchase(session, user_id, card.price)
+        await session.commit()
+    return token
+
+
+async def child(mode: str, args) -> dict:
+    from purchase_writer import purchase_writer
+
+    user_ids, card_ids = await seed(args.clients, 50)
+    buy = naive_purchase if mode == "naive" else purchase_writer.submit
+
+    errors = 0
+
+    async def client(n: int):
+        nonlocal errors
+        for i in range(args.per_client):
+            try:
+                await buy(user_ids[n], card_ids[(n + i) % len(card_ids)])
+            except Exception:
+                errors += 1   # למשל "database is locked" תחת עומס
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(n) for n in range(args.clients)))
+    elapsed = time.perf_counter() - started
+    await purchase_writer.stop()
+    total = args.clients * args.per_client - errors
+    return {
+        "mode": mode,
+        "purchases": total,
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "per_sec": total / elapsed,
+        "batches": purchase_writer.batches,
+    }
+
+
+def run_mode(mode: str, args, extra_env: dict | None = None) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            TELEGRAM_TOKEN=os.getenv("TELEGRAM_TOKEN", "0:bench"),
+            ADMIN_ID=os.getenv("ADMIN_ID", "0"),
+            DATABASE_URL=f"sqlite+aiosqlite:///{tmp}/bench.db",
+            **(extra_env or {}),
+        )
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_purchases", "--child", mode,
+             "--clients", str(args.clients), "--per-client", str(args.per_client)],
+            env=env, capture_output=True, text=True, check=True,
+        )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+# ─────────────────────────────────────────────────────────────
+# PostgreSQL זמני לבנצ'מרק (initdb + pg_ctl בתיקייה זמנית)
+# ─────────────────────────────────────────────────────────────
+def _pg_bin(name: str) -> str | None:
+    found = shutil.which(name)
+    if found:
+        return found
+    candidates = sorted(glob(f"/usr/lib/postgresql/*/bin/{name}"))
+    return candidates[-1] if candidates else None
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LocalPostgres:
+    def __init__(self):
+        self.initdb = _pg_bin("initdb")
+        self.pg_ctl = _pg_bin("pg_ctl")
+        self.tmp = None
+        self.port = None
+
+    @property
+    def available(self) -> bool:
+        return bool(self.initdb and self.pg_ctl)
+
+    def __enter__(self) -> str:
+        self.tmp = tempfile.TemporaryDirectory()
+        data = os.path.join(self.tmp.name, "data")
+        self.port = _free_port()
+        subprocess.run([self.initdb, "-D", data, "-U", "bench", "--auth=trust", "-E", "UTF8"],
+                       check=True, capture_output=True)
+        subprocess.run([self.pg_ctl, "-D", data, "-w", "-l", os.path.join(self.tmp.name, "pg.log"),
+                        "-o", f"-p {self.port} -k {self.tmp.name} -c listen_addresses=127.0.0.1", "start"],
+                       check=True, capture_output=True)
+        return f"postgresql+asyncpg://bench@127.0.0.1:{self.port}/postgres"
+
+    def __exit__(self, *exc):
+        subprocess.run([self.pg_ctl, "-D", os.path.join(self.tmp.name, "data"), "-m", "fast", "stop"],
+                       capture_output=True)
+        self.tmp.cleanup()
+
+
+def run_profile(profile: str, args, url: str | None = None):
+    extra = {"DB_PROFILE": profile}
+    if url:
+        extra["DATABASE_URL"] = url
+    for mode in ("naive", "writer"):
+        r = run_mode(mode, args, extra)
+        print(f"{profile:>10} {r['mode']:>7}: {r['purchases']} purchases in {r['elapsed_s']:.2f}s "
+              f"→ {r['per_sec']:.0f}/s (errors={r['errors']}, batches={r['batches']})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--per-client", type=int, default=10)
+    parser.add_argument("--profiles", default="sqlite,sqlite-wal,postgres")
+    parser.add_argument("--postgres-url", help="שרת קיים במקום שרת זמני")
+    parser.add_argument("--child")
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(child(args.child, args))))
+        return
+
+    for profile in args.profiles.split(","):
+        if profile != "postgres":
+            run_profile(profile, args)
+            continue
+        try:
+            import asyncpg  # noqa: F401
+        except ImportError:
+            print("  postgres: skipped (asyncpg not installed)")
+            continue
+        if args.postgres_url:
+            run_profile(profile, args, args.postgres_url)
+            continue
+        server = LocalPostgres()
+        if not server.available:
+            print("  postgres: skipped (no initdb/pg_ctl; use --postgres-url)")
+            continue
+        with server as url:
+            run_profile(profile, args, url)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# ─────────────────────────────────────────────────────────────
+# הגדלות Score לשנייה: commit לכל אירוע מול score_counter (write-behind).
+#   python -m benchmarks.bench_scores --events 20000 --users 1000 --concurrency 8
+# naive – UPDATE … SET kisses = kisses + 1 + commit לכל תגובה
+#   (ב־SQLite, מעל ~50 כותבים מקבילים נגמר busy_timeout: database is locked)
+# batched – score_counter.incr + flush תקופתי; בסוף stop() ובדיקה שהסכומים זהים
+# ─────────────────────────────────────────────────────────────
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+
+async def naive(events: list[tuple[int, str]], concurrency: int):
+    from sqlalchemy import update
+    from database import AsyncSessionLocal
+    from models import Score
+
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(user_id: int, field: str):
+        async with gate:
+            async with AsyncSessionLocal() as session:
+                await session.execute(
+                    update(Score).where(Score.user_id == user_id).values({field: getattr(Score, field) + 1})
+                )
+                await session.commit()
+
+    await asyncio.gather(*(one(u, f) for u, f in events))
+
+
+async def batched(events: list[tuple[int, str]], concurrency: int):
+    from score_counter import score_counter
+
+    # אותו מספר "handlers" מקבילים; כל אחד מגדיל ומוותר על ה־loop כמו handler אמיתי
+    async def worker(chunk):
+        for user_id, field in chunk:
+            score_counter.incr(user_id, field)
+            await asyncio.sleep(0)
+
+    await asyncio.gather(*(worker(events[i::concurrency]) for i in range(concurrency)))
+    await score_counter.stop()
+
+
+async def totals() -> dict:
+    from sqlalchemy import func
+    from sqlalchemy.future import select
+    from database import AsyncSessionLocal
+    from models import Score
+
+    async with AsyncSessionLocal() as session:
+        row = (await session.execute(select(func.sum(Score.kisses), func.sum(Score.hugs), func.sum(Score.contracts)))).one()
+    return dict(zip(("kisses", "hugs", "contracts"), row))
+
+
+async def run(args) -> bool:
+    from sqlalchemy import delete, insert
+    from database import AsyncSessionLocal, engine, init_db
+    from models import User, Score
+    from score_counter import FIELDS, score_counter
+
+    await init_db()
+    async with AsyncSessionLocal() as session:
+        await session.execute(insert(User), [{"telegram_id": 10_000 + i} for i in range(args.users)])
+        await session.commit()
+
+    rnd = random.Random(args.seed)
+    events = [(1 + rnd.randrange(args.users), rnd.choice(FIELDS)) for _ in range(args.events)]
+    expected = {field: sum(1 for _, f in events if f == field) for field in FIELDS}
+
+    results = {}
+    for name, fn in (("naive", naive), ("batched", batched)):
+        async with AsyncSessionLocal() as session:
+            await session.execute(delete(Score))
+            # naive מעדכן שורות קיימות (UPDATE); batched יוצר אותן בעצמו
+            if name == "naive":
+                await session.execute(insert(Score), [
+                    {"user_id": 1 + i, "kisses": 0, "hugs": 0, "contracts": 0} for i in range(args.users)
+                ])
+            await session.commit()
+        t0 = time.perf_counter()
+        await fn(events, args.concurrency)
+        seconds = time.perf_counter() - t0
+        results[name] = (seconds, await totals())
+
+    # קריאה ממזגת דלתות שעוד לא נכתבו
+    user_id = events[0][0]
+    before = await score_counter.get(user_id)
+    score_counter.incr(user_id, "kisses", 5)
+    merged = await score_counter.get(user_id)
+    await score_counter.stop()
+    await engine.dispose()
+
+    print(f"events={args.events} users={args.users} concurrency={args.concurrency}")
+    for name, (seconds, sums) in results.items():
+        print(f"{name:<8} {seconds:8.2f}s {args.events / seconds:>10.0f} incr/s  totals={sums}")
+    if name == "batched":
+        print(f"flushes={score_counter.flushes} rows_written={score_counter.written}")
+    ok = all(sums == expected for _, sums in results.values()) and merged["kisses"] == before["kisses"] + 5
+    print("totals match, reads merge pending:", "ok" if ok else f"FAIL expected {expected}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=20_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("TELEGRAM_TOKEN", "0:scores")
+        os.environ.setdefault("ADMIN_ID", "0")
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tmp}/scores.db"
+        os.environ.setdefault("SCORE_FLUSH_MS", "100")
+        ok = asyncio.run(run(args))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+# ─────────────────────────────────────────────────────────────
+# Latency של /search ושל דפדוף בעמודים מול SQLite עם 100k קלפים.
+#   python -m benchmarks.bench_search --cards 100000 --shops 500 --queries 500
+# משווה FTS5 (ברירת המחדל ב־SQLite) מול ה־fallback של ILIKE,
+# ובודק שה־triggers מכניסים קלף חדש לאינדקס.
+# ─────────────────────────────────────────────────────────────
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+WORDS = [
+    "dragon", "golden", "rare", "cosmic", "pixel", "ocean", "tiger", "neon", "crystal", "shadow",
+    "phoenix", "retro", "lunar", "forest", "storm", "ruby", "silver", "ghost", "jungle", "arctic",
+    "דרקון", "זהב", "נדיר", "ים", "כוכב", "אריה", "צל", "ירח", "סערה", "יער",
+]
+
+
+SYLLABLES = ["ka", "ro", "mi", "tan", "el", "zu", "vor", "shi", "la", "den", "qua", "ni"]
+
+
+def vocabulary(rnd: random.Random, size: int) -> list[str]:
+    # מילים נדירות לצד הנפוצות, כדי שחלק מהחיפושים יהיו סלקטיביים
+    words = set(WORDS)
+    while len(words) < size:
+        words.add("".join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 4))))
+    return sorted(words)
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def title(rnd: random.Random, words: list[str], i: int) -> str:
+    return f"{' '.join(rnd.sample(words, 3))} #{i}"
+
+
+async def seed(args, rnd: random.Random, words: list[str]):
+    from sqlalchemy import insert
+    from database import AsyncSessionLocal, init_db
+    from models import User, Shop, Card
+
+    await init_db()
+    async with AsyncSessionLocal() as session:
+        await session.execute(insert(User), [{"telegram_id": 10_000 + i} for i in range(args.shops)])
+        await session.execute(insert(Shop), [
+            {"owner_id": 1 + i, "name": f"{rnd.choice(WORDS)} shop {i}"} for i in range(args.shops)
+        ])
+        per_batch = 10_000
+        for start in range(0, args.cards, per_batch):
+            await session.execute(insert(Card), [
+                {"shop_id": 1 + i % args.shops, "title": title(rnd, words, i), "image_path": "-", "price": 39.0}
+                for i in range(start, min(args.cards, start + per_batch))
+            ])
+        await session.commit()
+
+
+async def run(args) -> bool:
+    import queries
+    import search
+    from database import AsyncSessionLocal, engine
+    from models import Card
+
+    rnd = random.Random(args.seed)
+    started = time.perf_counter()
+    words = vocabulary(rnd, args.vocabulary)
+    await seed(args, rnd, words)
+    print(f"seeded {args.cards} cards / {args.shops} shops in {time.perf_counter() - started:.1f}s (triggers on)")
+
+    terms = [" ".join(rnd.sample(words, rnd.choice((1, 2)))) for _ in range(args.queries)]
+    terms += [w[:3] for w in rnd.sample(WORDS, 10)]   # prefix
+    terms += [f"missing{i}" for i in range(10)]       # בלי תוצאות
+
+    results = {}
+    async with AsyncSessionLocal() as session:
+        for mode in ("fts", "like"):
+            timings, hits = [], 0
+            for text in terms:
+                t0 = time.perf_counter()
+                if mode == "fts":
+                    shops, cards = await search.search(session, text, args.limit)
+                else:
+                    pattern = f"%{text}%"
+                    shops = (await session.execute(queries.search_shops_like(pattern, args.limit))).all()
+                    cards = (await session.execute(queries.search_cards_like(pattern, args.limit))).all()
+                timings.append(time.perf_counter() - t0)
+                hits += bool(shops or cards)
+            results[mode] = timings
+            print(f"{mode:<6} n={len(timings):<5} hits={hits:<5} p50={percentile(timings, 50) * 1000:7.2f}ms "
+                  f"p95={percentile(timings, 95) * 1000:7.2f}ms p99={percentile(timings, 99) * 1000:7.2f}ms")
+
+        # דפדוף keyset לעמוד אקראי בחנות
+        timings = []
+        per_shop = args.cards // args.shops
+        for _ in range(args.queries):
+            shop_id = rnd.randrange(1, args.shops + 1)
+            after = rnd.randrange(0, args.cards - per_shop)
+            t0 = time.perf_counter()
+            (await session.execute(queries.cards_after(shop_id, after).limit(21))).all()
+            timings.append(time.perf_counter() - t0)
+        print(f"{'page':<6} n={len(timings):<5} p50={percentile(timings, 50) * 1000:7.2f}ms "
+              f"p95={percentile(timings, 95) * 1000:7.2f}ms")
+
+        # קלף חדש נמצא מיד (trigger ב־INSERT)
+        session.add(Card(shop_id=1, title="zzfreshcard", image_path="-", price=1.0))
+        await session.commit()
+        _, cards = await search.search(session, "zzfresh", args.limit)
+    await engine.dispose()
+
+    ok = [c.title for c in cards] == ["zzfreshcard"]
+    print("sync on insert:", "ok" if ok else "FAIL")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cards", type=int, default=100_000)
+    parser.add_argument("--shops", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--vocabulary", type=int, default=5000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("TELEGRAM_TOKEN", "0:search")
+        os.environ.setdefault("ADMIN_ID", "0")
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tmp}/search.db"
+        ok = asyncio.run(run(args))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# ─────────────────────────────────────────────────────────────
+# Sharding של בוטי החנויות: תפוקה לפי מספר workers + זמן failover.
+#   python -m benchmarks.bench_sharding --bots 200 --shards 1,4 --updates 20
+# ה־runner רץ בתהליך הזה מול stub_bot_api (polling); אחרי העומס
+# נהרג worker אחד (SIGKILL) ונמדד הזמן עד שבוט שלו עונה שוב.
+# ─────────────────────────────────────────────────────────────
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import httpx
+
+from benchmarks.bench_gateway import free_port, bench_tokens
+from benchmarks.stub_bot_api import callback_update
+
+
+async def wait_for(predicate, deadline: float, step: float = 0.05) -> float | None:
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < deadline:
+        if predicate():
+            return time.perf_counter() - t0
+        await asyncio.sleep(step)
+    return None
+
+
+async def answered(client: httpx.AsyncClient, stub_url: str) -> int:
+    return (await client.get(f"{stub_url}/_stub/stats")).json()["calls"].get("answerCallbackQuery", 0)
+
+
+async def run_shards(size: int, args, stub_url: str) -> dict:
+    from sharding import ShardRunner
+
+    tokens = bench_tokens(args.bots)
+    async with httpx.AsyncClient(timeout=60) as client:
+        await client.post(f"{stub_url}/_stub/reset")
+        runner = ShardRunner(size)
+        t0 = time.perf_counter()
+        await runner.start(tokens)
+
+        def all_active():
+            return sum(w.health.get("bots", {}).get("active", 0) for w in runner.workers.values()) == len(tokens)
+
+        await wait_for(all_active, args.deadline)
+        boot = time.perf_counter() - t0
+
+        # עומס: updates × bots
+        total = args.bots * args.updates
+        t0 = time.perf_counter()
+        await client.post(f"{stub_url}/_stub/push", json={
+            "tokens": tokens, "count": args.updates, "update": callback_update(4242, "switch_admin"),
+        })
+        done = 0
+        while done < total and time.perf_counter() - t0 < args.deadline:
+            await asyncio.sleep(0.05)
+            done = await answered(client, stub_url)
+        throughput = done / (time.perf_counter() - t0)
+        spread = sorted(runner.stats()["workers"][i]["assigned"] for i in runner.workers)
+
+        # failover: הורגים את ה־worker של הטוקן הראשון ומחכים לתשובה ממנו
+        victim = runner.owner[tokens[0]]
+        runner.workers[victim].process.kill()
+        before = await answered(client, stub_url)
+        t0 = time.perf_counter()
+        await client.post(f"{stub_url}/_stub/push", json={"tokens": [tokens[0]], "update": callback_update(4242, "switch_admin")})
+        failover = None
+        while time.perf_counter() - t0 < args.deadline:
+            await asyncio.sleep(0.05)
+            if await answered(client, stub_url) > before:
+                failover = time.perf_counter() - t0
+                break
+        restarts = runner.restarts
+        await runner.stop()
+    return {
+        "shards": size,
+        "boot_s": boot,
+        "processed": done,
+        "updates_per_s": throughput,
+        "spread": "/".join(map(str, spread)),
+        "failover_s": failover if failover is not None else float("nan"),
+        "restarts": restarts,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bots", type=int, default=200)
+    parser.add_argument("--shards", default="1,4")
+    parser.add_argument("--updates", type=int, default=20, help="updates per bot")
+    parser.add_argument("--deadline", type=float, default=120.0)
+    args = parser.parse_args()
+
+    stub_port = free_port()
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    stub = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.stub_bot_api", "--port", str(stub_port)],
+        stderr=subprocess.DEVNULL,
+    )
+    os.environ.update(SHOP_BOT_MODE="polling", BOT_API_URL=f"{stub_url}/bot",
+                      SHARD_HEARTBEAT="0.5", SHARD_TIMEOUT="10", LOG_LEVEL="WARNING")
+    os.environ.setdefault("TELEGRAM_TOKEN", "0:shard")
+    os.environ.setdefault("ADMIN_ID", "0")
+    # הבנים יורשים את ה־cwd: registrations/.activity.json זמני
+    os.environ["PYTHONPATH"] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    rows = []
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(f"{stub_url}/_stub/stats")
+                break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            os.makedirs("registrations")
+            for size in map(int, args.shards.split(",")):
+                rows.append(asyncio.run(run_shards(size, args, stub_url)))
+    finally:
+        stub.kill()
+        stub.wait()
+
+    print(f"bots={args.bots} updates/bot={args.updates} cpus={os.cpu_count()}")
+    header = ("shards", "boot_s", "processed", "updates_per_s", "spread", "failover_s", "restarts")
+    print("".join(f"{h:>15}" for h in header))
+    for row in rows:
+        print("".join(
+            f"{row[h]:>15.2f}" if isinstance(row[h], float) else f"{row[h]:>15}" for h in header
+        ))
+
+
+if __name__ == "__main__":
+    main()
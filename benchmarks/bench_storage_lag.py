@@ -0,0 +1,123 @@
+# ─────────────────────────────────────────────────────────────
+# Event-loop lag תחת עומס קבצים: I/O ישיר בלולאה מול storage,
+# דרך אותן מתודות של AsyncStorage שה־handlers קוראים להן.
+#   python -m benchmarks.bench_storage_lag --tasks 64 --ops 20 --disk-delay-ms 5
+# נכשל (קוד 1) אם ה־lag במצב storage עובר את התקציב (max / p99),
+# או אם במצב direct ה־probe לא מזהה את החסימה (הבדיקה עצמה שבורה).
+# ─────────────────────────────────────────────────────────────
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+from storage import AsyncStorage
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def lag_probe(stop: asyncio.Event, samples: list[float], interval: float = 0.005):
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - expected))
+
+
+def slow_disk(fn, delay: float):
+    def wrapper(*args):
+        time.sleep(delay)   # דיסק איטי מדומה
+        return fn(*args)
+    return wrapper
+
+
+class SlowStorage(AsyncStorage):
+    def __init__(self, workers: int, delay: float, direct: bool):
+        super().__init__(workers)
+        self.delay = delay
+        self.direct = direct
+
+    async def run(self, op: str, fn, *args):
+        if self.direct:   # כמו לפני storage: הקריאה החוסמת רצה בתוך הלולאה
+            return slow_disk(fn, self.delay)(*args)
+        return await super().run(op, slow_disk(fn, self.delay), *args)
+
+
+async def task_ops(root: str, n: int, ops: int, storage: AsyncStorage):
+    # אותו רצף כמו שמירת הרשמה ב־main.py + אינדקס התמונות
+    folder = os.path.join(root, f"t{n}")
+    await storage.makedirs(folder)
+    for i in range(ops):
+        await storage.write_text(os.path.join(folder, f"{i}.token"), "x" * 64)
+        await storage.dump_json(os.path.join(folder, "meta.json"), {"n": n, "i": i})
+        await storage.append_text(os.path.join(folder, "index.tsv"), f"{i}\n")
+        await storage.listdir(folder)
+
+
+async def run(mode: str, args) -> dict:
+    storage = SlowStorage(args.workers, args.disk_delay_ms / 1000, direct=mode == "direct")
+    samples: list[float] = []
+    stop = asyncio.Event()
+    with tempfile.TemporaryDirectory() as root:
+        probe = asyncio.create_task(lag_probe(stop, samples))
+        started = time.perf_counter()
+        await asyncio.gather(*(task_ops(root, n, args.ops, storage) for n in range(args.tasks)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await probe
+    storage.shutdown()
+    return {
+        "mode": mode,
+        "elapsed_s": elapsed,
+        "lag_p50_ms": percentile(samples, 50) * 1000,
+        "lag_p99_ms": percentile(samples, 99) * 1000,
+        "lag_max_ms": max(samples) * 1000,
+        "ops": storage.report(),
+    }
+
+
+def check(results: list[dict], args) -> int:
+    direct, pooled = results
+    checks = [
+        ("storage max lag", pooled["lag_max_ms"], "<=", args.max_lag_ms),
+        ("storage p99 lag", pooled["lag_p99_ms"], "<=", args.p99_lag_ms),
+        # בלי זה בדיקה שלא מודדת כלום (probe תקוע, delay=0) הייתה עוברת תמיד
+        ("direct max lag", direct["lag_max_ms"], ">", args.max_lag_ms),
+    ]
+    failures = 0
+    for name, value, op, budget in checks:
+        ok = value <= budget if op == "<=" else value > budget
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {name}: {value:.1f}ms {op} {budget}ms")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=64)
+    parser.add_argument("--ops", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--disk-delay-ms", type=float, default=5.0)
+    parser.add_argument("--max-lag-ms", type=float, default=50.0)
+    parser.add_argument("--p99-lag-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    results = [asyncio.run(run(mode, args)) for mode in ("direct", "storage")]
+    for r in results:
+        print(f"{r['mode']:>8}: elapsed={r['elapsed_s']:.2f}s lag p50={r['lag_p50_ms']:.1f}ms "
+              f"p99={r['lag_p99_ms']:.1f}ms max={r['lag_max_ms']:.1f}ms")
+    for op, stats in results[1]["ops"].items():
+        print(f"    {op:>10}: n={stats['count']} avg={stats['avg_ms']:.1f}ms max={stats['max_ms']:.1f}ms")
+
+    failures = check(results, args)
+    if failures:
+        print(f"{failures} loop lag regression(s)")
+        sys.exit(1)
+    print("OK: loop lag bounded")
+
+
+if __name__ == "__main__":
+    main()
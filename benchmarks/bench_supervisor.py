@@ -0,0 +1,172 @@
+# ─────────────────────────────────────────────────────────────
+# זמן אתחול של N בוטי חנות רשומים מול stub_bot_api.
+#   python -m benchmarks.bench_supervisor --bots 1000
+# gather     – ההתנהגות הקודמת: launch_bot לכולם בבת אחת
+# staged     – supervisor עם BOT_START_CONCURRENCY + דיווח מוכנות
+# hibernated – כולם מעבר לסף הסרק: אתחול רדום, קצב getWebhookInfo
+#              בזמן שכולם רדומים (checks_per_s) + זמן התעוררות בעדכון
+# כל מצב בתהליך נפרד; נמדדים זמן, RSS, sockets וקריאות getMe.
+# ─────────────────────────────────────────────────────────────
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import httpx
+
+from benchmarks.bench_gateway import free_port, bench_tokens, proc_rss_mb, proc_sockets
+from benchmarks.stub_bot_api import callback_update
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# ─────────────────────────────────────────────────────────────
+# תהליך הבן: מעלה את הבוטים (cwd זמני, registrations/ משלו)
+# ─────────────────────────────────────────────────────────────
+async def child(mode: str, n: int):
+    import bot_manager
+    from supervisor import BOT_IDLE_HIBERNATE
+
+    tokens = bench_tokens(n)
+    os.makedirs(bot_manager.REG_ROOT, exist_ok=True)
+    t0 = time.perf_counter()
+    if mode == "gather":
+        results = await asyncio.gather(*(bot_manager.launch_bot(t) for t in tokens), return_exceptions=True)
+        report = {"boot_seconds": time.perf_counter() - t0,
+                  "active": sum(not isinstance(r, Exception) for r in results),
+                  "failed": sum(isinstance(r, Exception) for r in results), "hibernating": 0}
+    else:
+        if mode == "hibernated":
+            stale = time.time() - 2 * BOT_IDLE_HIBERNATE
+            with open(bot_manager.supervisor.activity_path, "w") as fp:
+                json.dump({t: stale for t in tokens}, fp)
+        await bot_manager.supervisor.run(tokens)
+        report = bot_manager.supervisor.readiness()
+    print("READY " + json.dumps(report), flush=True)
+    await asyncio.Event().wait()
+
+
+def wake_latency(stub_url: str, token: str, deadline: float) -> float | None:
+    before = httpx.get(f"{stub_url}/_stub/stats").json()["calls"].get("answerCallbackQuery", 0)
+    t0 = time.perf_counter()
+    httpx.post(f"{stub_url}/_stub/push", json={"tokens": [token], "update": callback_update(4242, "switch_admin")})
+    while time.perf_counter() - t0 < deadline:
+        time.sleep(0.01)
+        if httpx.get(f"{stub_url}/_stub/stats").json()["calls"].get("answerCallbackQuery", 0) > before:
+            return time.perf_counter() - t0
+    return None
+
+
+def run_mode(mode: str, args, stub_url: str) -> dict:
+    gw_port = free_port()
+    env = dict(
+        os.environ,
+        PYTHONPATH=REPO,
+        SHOP_BOT_MODE=args.shop_mode,
+        BOT_API_URL=f"{stub_url}/bot",
+        WEBHOOK_BASE_URL=f"http://127.0.0.1:{gw_port}",
+        WEBHOOK_HOST="127.0.0.1",
+        WEBHOOK_PORT=str(gw_port),
+        BOT_START_CONCURRENCY=str(args.concurrency),
+        BOT_WAKE_SWEEP=str(args.wake_sweep),
+        BOT_WAKE_MAX_INTERVAL=str(args.wake_max),
+        BOT_WAKE_RATE=str(args.wake_rate),
+        LOG_LEVEL="WARNING",
+    )
+    httpx.post(f"{stub_url}/_stub/reset")
+    if mode == "hibernated" and args.shop_mode == "webhook":
+        # webhooks שנרשמו בריצה קודמת (הבוט הרדום לא קורא setWebhook)
+        import webhook_gateway
+        for token in bench_tokens(args.bots):
+            httpx.post(f"{stub_url}/bot{token}/setWebhook", json={
+                "url": f"{env['WEBHOOK_BASE_URL']}{webhook_gateway.webhook_path(token)}",
+                "secret_token": webhook_gateway.secret_token(token),
+            })
+    with tempfile.TemporaryDirectory() as tmp:
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.bench_supervisor", "--child", mode, "--bots", str(args.bots)],
+            cwd=tmp, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+        )
+        try:
+            line = proc.stdout.readline().strip()
+            if not line.startswith("READY "):
+                raise RuntimeError(f"{mode}: child failed to start")
+            report = json.loads(line[6:])
+            time.sleep(1)
+            row = {
+                "mode": mode,
+                "boot_s": report["boot_seconds"],
+                "first_ready_s": report.get("first_ready_seconds") or 0.0,
+                "active": report["active"],
+                "hibernating": report["hibernating"],
+                "failed": report["failed"],
+                "getMe": httpx.get(f"{stub_url}/_stub/stats").json()["calls"].get("getMe", 0),
+                "rss_mb": proc_rss_mb(proc.pid),
+                "sockets": proc_sockets(proc.pid),
+                "checks_per_s": 0.0,
+                "wake_ms": 0.0,
+            }
+            if mode == "hibernated":
+                checks = httpx.get(f"{stub_url}/_stub/stats").json()["calls"].get("getWebhookInfo", 0)
+                time.sleep(args.idle_window)
+                checks = httpx.get(f"{stub_url}/_stub/stats").json()["calls"].get("getWebhookInfo", 0) - checks
+                row["checks_per_s"] = checks / args.idle_window
+                latency = wake_latency(stub_url, bench_tokens(1)[0], args.wake_max + 10)
+                row["wake_ms"] = latency * 1000 if latency is not None else float("nan")
+            return row
+        finally:
+            proc.kill()
+            proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bots", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--modes", default="gather,staged,hibernated")
+    parser.add_argument("--shop-mode", default="polling", help="polling | webhook")
+    parser.add_argument("--wake-sweep", type=float, default=1.0, help="BOT_WAKE_SWEEP לבנצ'מרק")
+    parser.add_argument("--wake-max", type=float, default=30.0, help="BOT_WAKE_MAX_INTERVAL לבנצ'מרק")
+    parser.add_argument("--wake-rate", type=float, default=20.0, help="BOT_WAKE_RATE לבנצ'מרק")
+    parser.add_argument("--idle-window", type=float, default=20.0, help="שניות מדידת getWebhookInfo כשכולם רדומים")
+    parser.add_argument("--child", default="")
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(child(args.child, args.bots))
+        return
+
+    stub_port = free_port()
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    stub = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.stub_bot_api", "--port", str(stub_port)],
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(f"{stub_url}/_stub/stats")
+                break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        rows = [run_mode(mode, args, stub_url) for mode in args.modes.split(",")]
+    finally:
+        stub.kill()
+        stub.wait()
+
+    print(f"bots={args.bots} concurrency={args.concurrency} shop_mode={args.shop_mode}")
+    header = ("mode", "boot_s", "first_ready_s", "active", "hibernating", "failed",
+              "getMe", "rss_mb", "sockets", "checks_per_s", "wake_ms")
+    print("".join(f"{h:>14}" for h in header))
+    for row in rows:
+        print("".join(
+            f"{row[h]:>14.2f}" if isinstance(row[h], float) else f"{row[h]:>14}" for h in header
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# ─────────────────────────────────────────────────────────────
+# רגרסיית query plans: EXPLAIN QUERY PLAN לכל שאילתה ב־queries.py
+# (כולל lookups של ה־importer, rebuild של ה־leaderboard ו־upsert של
+# score_counter) מול SQLite עם נתונים, ונכשל על full table scan.
+#   python -m benchmarks.check_query_plans
+# ─────────────────────────────────────────────────────────────
+import os
+import re
+import sys
+import asyncio
+import inspect
+import tempfile
+
+# SCAN <table> בלי USING INDEX = מעבר על כל הטבלה
+FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+# full scan במכוון: ה־fallback של /search ל־Postgres (ב־SQLite – FTS5)
+ALLOWED_SCANS = {
+    "search_shops_like": {"shops"},
+    "search_cards_like": {"cards"},
+}
+
+SAMPLES = {
+    "user_identity":     (10_001,),
+    "shops_by_owner":    (1,),
+    "cards_after":       (1, 10),
+    "cards_before":      (1, 10),
+    "card_prices":       ([1, 2, 3],),
+    "purchases_by_user": (1,),
+    "top_spenders":      (20,),
+    "score_for":         (1,),
+    "shops_after":       (10,),
+    "shops_before":      (10,),
+    "purchases_after":   (100,),
+    "purchases_max_id":  (),
+    "purchases_export":  (100, 4000),
+    "search_shops":      ('"shop1"*', 20),
+    "search_cards":      ('"card"* "1"*', 20),
+    "search_shops_like": ("%shop1%", 20),
+    "search_cards_like": ("%card 1%", 20),
+    "score_add":            (),
+    "spend_totals":         (),
+    "user_ids_by_telegram": ([10_001, 10_002, 10_003],),
+    "shop_ids_by_name":     (["shop1", "shop2"],),
+    "cards_in_shops":       ([1, 2, 3],),
+    "export_watermarks":    (),
+}
+
+
+async def seed(users=200, shops=50, cards_per_shop=20, purchases=5000):
+    from sqlalchemy import insert, text
+    from database import AsyncSessionLocal, init_db
+    from models import User, Shop, Card, Purchase
+    import leaderboard
+
+    await init_db()
+    async with AsyncSessionLocal() as session:
+        await session.execute(insert(User), [{"telegram_id": 10_000 + i} for i in range(users)])
+        await session.execute(insert(Shop), [
+            {"owner_id": 1 + i % users, "name": f"shop{i}"} for i in range(shops)
+        ])
+        await session.execute(insert(Card), [
+            {"shop_id": 1 + i // cards_per_shop, "title": f"card {i}", "image_path": "-", "price": 39.0}
+            for i in range(shops * cards_per_shop)
+        ])
+        await session.execute(insert(Purchase), [
+            {"user_id": 1 + i % users, "card_id": 1 + i % (shops * cards_per_shop),
+             "token": f"t{i}", "amount": 39.0}
+            for i in range(purchases)
+        ])
+        await leaderboard.rebuild(session)
+        await session.commit()
+        await session.execute(text("ANALYZE"))
+
+
+async def explain(conn, stmt) -> list[str]:
+    compiled = stmt.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    result = await conn.exec_driver_sql("EXPLAIN QUERY PLAN " + compiled.string, params)
+    return [row[-1] for row in result.all()]
+
+
+async def check() -> int:
+    import queries
+    from database import engine
+
+    await seed()
+    names = [
+        name for name, fn in inspect.getmembers(queries, inspect.isfunction)
+        if fn.__module__ == queries.__name__
+    ]
+    failures = 0
+    async with engine.connect() as conn:
+        for name in names:
+            if name not in SAMPLES:
+                print(f"FAIL {name}: no sample arguments in check_query_plans.SAMPLES")
+                failures += 1
+                continue
+            try:
+                plan = await explain(conn, getattr(queries, name)(*SAMPLES[name]))
+            except Exception as e:
+                # למשל upsert בלי unique index שמתאים ל־ON CONFLICT
+                print(f"FAIL {name}: {e}")
+                failures += 1
+                continue
+            scans = {m.group(1) for line in plan if (m := FULL_SCAN.match(line))}
+            bad = scans - ALLOWED_SCANS.get(name, set())
+            status = "FAIL" if bad else "ok  "
+            failures += bool(bad)
+            print(f"{status} {name}: {' | '.join(plan)}")
+    return failures
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("TELEGRAM_TOKEN", "0:plans")
+        os.environ.setdefault("ADMIN_ID", "0")
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tmp}/plans.db"
+        failures = asyncio.run(check())
+    if failures:
+        print(f"{failures} query plan regression(s)")
+        sys.exit(1)
+    print("OK: no unexpected full table scans")
+
+
+if __name__ == "__main__":
+    main()
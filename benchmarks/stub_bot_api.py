@@ -0,0 +1,299 @@
+# ─────────────────────────────────────────────────────────────
+# Stub מקומי של Bot API – מחקה את Telegram לצורך בנצ'מרקים.
+#   python -m benchmarks.stub_bot_api --port 8081
+# בוטים מכוונים אליו עם BOT_API_URL=http://127.0.0.1:8081/bot,
+# או בתוך התהליך עם StubRequest (בלי רשת בכלל).
+# ─────────────────────────────────────────────────────────────
+import json
+import math
+import time
+import asyncio
+import argparse
+from collections import Counter, defaultdict, deque
+from urllib.parse import parse_qsl
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from telegram.request import BaseRequest
+
+# קריאות יוצאות שנשמרות ב־StubBotAPI.sent
+RECORDED = {"sendMessage", "editMessageText", "sendPhoto", "sendDocument"}
+FAKE_JPEG = b"\xff\xd8\xff\xe0stub-jpeg\xff\xd9"
+
+
+def callback_update(user_id: int, data: str, message_id: int = 1) -> dict:
+    return {
+        "callback_query": {
+            "id": f"{user_id}-{time.monotonic_ns()}",
+            "from": {"id": user_id, "is_bot": False, "first_name": "bench"},
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "text": "menu",
+            },
+        }
+    }
+
+
+def message_update(user_id: int, text: str = None, contact: str = None, photo: str = None) -> dict:
+    message = {
+        "message_id": int(time.monotonic_ns() % 1_000_000_000),
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "bench"},
+    }
+    if text is not None:
+        message["text"] = text
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    if contact is not None:
+        message["contact"] = {"phone_number": contact, "first_name": "bench", "user_id": user_id}
+    if photo is not None:
+        message["photo"] = [{"file_id": photo, "file_unique_id": f"u-{photo}", "width": 512, "height": 512}]
+    return {"message": message}
+
+
+# ─────────────────────────────────────────────────────────────
+# אכיפת מגבלות flood כמו Telegram: token bucket לכל צ'אט ולכל בוט,
+# חריגה → 429 עם retry_after
+# ─────────────────────────────────────────────────────────────
+class _Bucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1 - 1e-6:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class FloodLimits:
+    def __init__(self, chat_rate: float = 1, chat_burst: float = 3, bot_rate: float = 30):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.bot_rate = bot_rate
+        self._chats: dict[tuple[str, object], _Bucket] = {}
+        self._bots: dict[str, _Bucket] = {}
+
+    def check(self, token: str, params: dict) -> float:
+        chat_id = params.get("chat_id")
+        if chat_id is not None:
+            bucket = self._chats.get((token, chat_id))
+            if bucket is None:
+                bucket = self._chats[(token, chat_id)] = _Bucket(self.chat_rate, self.chat_burst)
+            wait = bucket.take()
+            if wait:
+                return wait
+        bucket = self._bots.get(token)
+        if bucket is None:
+            bucket = self._bots[token] = _Bucket(self.bot_rate, self.bot_rate)
+        return bucket.take()
+
+    def reset(self):
+        self._chats.clear()
+        self._bots.clear()
+
+
+class StubBotAPI:
+    def __init__(self, record: bool = False, limits: FloodLimits | None = None, latency: float = 0.0):
+        self.record = record
+        self.limits = limits
+        self.latency = latency   # שניות לכל קריאה – RTT של Bot API אמיתי
+        self.rejected = 0
+        self.sent: list[tuple[str, str, dict]] = []
+        self.calls = Counter()
+        self._updates = defaultdict(deque)
+        self._wakeups = defaultdict(asyncio.Event)
+        self._update_ids = defaultdict(int)
+        self._webhooks: dict[str, tuple[str, str]] = {}
+        self._client: httpx.AsyncClient | None = None
+
+    def reset(self):
+        self.rejected = 0
+        if self.limits is not None:
+            self.limits.reset()
+        self.calls.clear()
+        self.sent.clear()
+        self._updates.clear()
+        self._webhooks.clear()
+
+    # ── Telegram → bot ──────────────────────────────────────
+    def push(self, token: str, update: dict):
+        self._update_ids[token] += 1
+        update = {"update_id": self._update_ids[token], **update}
+        if token in self._webhooks:
+            asyncio.create_task(self._deliver(token, update))
+        else:
+            self._updates[token].append(update)
+            self._wakeups[token].set()
+
+    async def _deliver(self, token: str, update: dict):
+        url, secret = self._webhooks[token]
+        if self._client is None:
+            self._client = httpx.AsyncClient(limits=httpx.Limits(max_connections=64))
+        headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+        await self._client.post(url, json=update, headers=headers)
+
+    # ── bot → Telegram ──────────────────────────────────────
+    async def call(self, token: str, method: str, params: dict):
+        self.calls[method] += 1
+        if self.latency and method != "getUpdates":
+            await asyncio.sleep(self.latency)
+        if self.limits is not None and method in RECORDED:
+            wait = self.limits.check(token, params)
+            if wait:
+                self.rejected += 1
+                retry_after = max(1, math.ceil(wait))
+                return 429, {"ok": False, "error_code": 429,
+                             "description": f"Too Many Requests: retry after {retry_after}",
+                             "parameters": {"retry_after": retry_after}}
+        if self.record and method in RECORDED:
+            self.sent.append((token, method, params))
+        handler = getattr(self, f"_m_{method}", None)
+        result = await handler(token, params) if handler else True
+        return 200, {"ok": True, "result": result}
+
+    async def _m_getMe(self, token, params):
+        bot_id = int(token.split(":")[0])
+        return {"id": bot_id, "is_bot": True, "first_name": "Stub", "username": f"stub{bot_id}_bot"}
+
+    async def _m_getUpdates(self, token, params):
+        queue = self._updates[token]
+        offset = int(params.get("offset") or 0)
+        while queue and queue[0]["update_id"] < offset:
+            queue.popleft()
+        timeout = float(params.get("timeout") or 0)
+        if not queue and timeout:
+            wakeup = self._wakeups[token]
+            wakeup.clear()
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        limit = int(params.get("limit") or 100)
+        return list(queue)[:limit]
+
+    async def _m_setWebhook(self, token, params):
+        self._webhooks[token] = (params["url"], params.get("secret_token", ""))
+        return True
+
+    async def _m_deleteWebhook(self, token, params):
+        self._webhooks.pop(token, None)
+        return True
+
+    async def _m_getWebhookInfo(self, token, params):
+        url = self._webhooks.get(token, ("", ""))[0]
+        return {"url": url, "has_custom_certificate": False, "pending_update_count": len(self._updates[token])}
+
+    async def _m_sendMessage(self, token, params):
+        return self._message(params)
+
+    async def _m_editMessageText(self, token, params):
+        return self._message(params)
+
+    async def _m_getFile(self, token, params):
+        file_id = params["file_id"]
+        return {"file_id": file_id, "file_unique_id": f"u-{file_id}", "file_path": f"photos/{file_id}.jpg"}
+
+    def _message(self, params):
+        chat_id = int(params.get("chat_id") or 0)
+        return {
+            "message_id": int(params.get("message_id") or 1),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": params.get("text", ""),
+        }
+
+
+# ─────────────────────────────────────────────────────────────
+# Transport בתוך התהליך: Bot(request=StubRequest(api))
+# ─────────────────────────────────────────────────────────────
+class StubRequest(BaseRequest):
+    def __init__(self, api: StubBotAPI):
+        self.api = api
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        if "/file/bot" in url:
+            return 200, FAKE_JPEG
+        prefix, api_method = url.rsplit("/", 1)
+        token = prefix.split("/bot", 1)[1]
+        params = request_data.parameters if request_data else {}
+        status, payload = await self.api.call(token, api_method, params)
+        return status, json.dumps(payload).encode()
+
+
+def _parse_params(body: bytes, content_type: str) -> dict:
+    if not body:
+        return {}
+    if content_type.startswith("application/json"):
+        return json.loads(body)
+    params = {}
+    for key, value in parse_qsl(body.decode()):
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+    return params
+
+
+def create_app(api: StubBotAPI) -> FastAPI:
+    app = FastAPI(title="Stub Bot API")
+
+    @app.post("/bot{token}/{method}")
+    async def bot_method(token: str, method: str, request: Request):
+        params = _parse_params(await request.body(), request.headers.get("content-type", ""))
+        status, payload = await api.call(token, method, params)
+        return JSONResponse(payload, status_code=status)
+
+    # ── ממשק שליטה לבנצ'מרק ──────────────────────────────────
+    @app.post("/_stub/push")
+    async def push(request: Request):
+        body = await request.json()
+        for token in body["tokens"]:
+            for _ in range(body.get("count", 1)):
+                api.push(token, body["update"])
+        return {"ok": True}
+
+    @app.get("/_stub/stats")
+    async def stats():
+        return {"calls": dict(api.calls), "rejected": api.rejected}
+
+    @app.post("/_stub/reset")
+    async def reset():
+        api.reset()
+        return {"ok": True}
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--flood-limits", action="store_true", help="לאכוף מגבלות flood (429)")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="RTT מדומה לכל קריאה (חוץ מ־getUpdates)")
+    args = parser.parse_args()
+    limits = FloodLimits() if args.flood_limits else None
+    api = StubBotAPI(limits=limits, latency=args.latency_ms / 1000)
+    uvicorn.run(create_app(api), host=args.host, port=args.port, log_level="warning")
@@ -1,5 +1,3 @@
-import os
-import uuid
 import logging
 from datetime import datetime
 
@@ -22,15 +20,30 @@ from telegram.ext import (
 )
 
 from config import settings
-from database import AsyncSessionLocal, init_db
-from models import User, Shop, Card, Purchase, Score
-from sqlalchemy.future import select
+from database import AsyncSessionLocal, init_db, upsert
+from models import User, Card
+import leaderboard
+import queries
+from identity_cache import CachedUser, user_cache
+from image_store import image_store
+from purchase_writer import purchase_writer
+from score_counter import score_counter
+from outbound import scheduler
+from http_pool import with_shared_pool
+from catalog import catalog, parse_id
+from idempotency import SingleFlight
+import search
+import metrics
+import profiling
+import logging_config
 
 # ─────────────────────────────────────────────────────────────
-logging.basicConfig(format="%(asctime)s - %(levelname)s - %(message)s",
-                    level=logging.INFO)
+logging_config.setup()
+logging_config.register_secret(settings.TELEGRAM_TOKEN)
 logger = logging.getLogger("bot")
 
+ADMIN_SHOPS_LIMIT = 100
+
 # ─────────────────────────────────────────────────────────────
 # Conversation states
 # ─────────────────────────────────────────────────────────────
@@ -45,20 +58,42 @@ logger = logging.getLogger("bot")
 # ─────────────────────────────────────────────────────────────
 # Helpers
 # ─────────────────────────────────────────────────────────────
-async def get_or_create_user(telegram_id: int, phone: str = None):
+async def get_or_create_user(telegram_id: int, phone: str = None) -> CachedUser:
+    if phone is None:
+        cached = user_cache.get(telegram_id)
+        if cached is not None:
+            return cached
+
+    identity = queries.user_identity(telegram_id)
     async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(User).where(User.telegram_id == telegram_id))
-        user = result.scalar_one_or_none()
-        if not user:
-            user = User(
-                telegram_id=telegram_id,
-                phone=phone,
-                is_admin=(telegram_id == settings.ADMIN_ID)
+        if phone is not None:
+            # עדכון טלפון (או יצירה) ב־upsert אחד
+            user_cache.invalidate(telegram_id)
+            stmt = upsert(User).values(_new_user_values(telegram_id, phone))
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[User.telegram_id],
+                set_={"phone": stmt.excluded.phone},
             )
-            session.add(user)
+            await session.execute(stmt)
+            await session.commit()
+
+        row = (await session.execute(identity)).one_or_none()
+        if row is None:
+            # לחיצות ראשונות מקבילות: רק אחת מכניסה, השאר מדלגות
+            stmt = upsert(User).values(_new_user_values(telegram_id, phone))
+            await session.execute(stmt.on_conflict_do_nothing(index_elements=[User.telegram_id]))
             await session.commit()
-        return user
+            row = (await session.execute(identity)).one()
+
+    return user_cache.put(row.id, telegram_id, row.is_admin)
+
+def _new_user_values(telegram_id: int, phone: str = None) -> dict:
+    return {
+        "telegram_id": telegram_id,
+        "phone":       phone,
+        "is_admin":    telegram_id == settings.ADMIN_ID,
+        "created_at":  datetime.utcnow(),
+    }
 
 # ─────────────────────────────────────────────────────────────
 # /start → ברוך הבא
@@ -86,11 +121,12 @@ async def contact_handler(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 # ─────────────────────────────────────────────────────────────
 # /dashboard → תפריט ראשי (Admin vs Customer)
 # ─────────────────────────────────────────────────────────────
-def dashboard_menu(user: User):
+def dashboard_menu(user: CachedUser):
     if user.is_admin:
         return InlineKeyboardMarkup([
             [InlineKeyboardButton("📊 כל החנויות", callback_data="admin_shops")],
             [InlineKeyboardButton("🏆 Leaderboard", callback_data="admin_lb")],
+            [InlineKeyboardButton("🔥 פרופיילינג", callback_data="admin_prof")],
         ])
     else:
         return InlineKeyboardMarkup([
@@ -109,9 +145,34 @@ async def dashboard(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         reply_markup=dashboard_menu(user)
     )
 
+# ─────────────────────────────────────────────────────────────
+# /search <טקסט> → חנויות וקלפים לפי שם/כותרת
+# ─────────────────────────────────────────────────────────────
+async def search_command(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    text = " ".join(ctx.args)
+    if not text:
+        return await update.message.reply_text("שימוש: /search <שם חנות או קלף>")
+    async with AsyncSessionLocal() as session:
+        shops, cards = await search.search(session, text, settings.SEARCH_LIMIT)
+    kb = [
+        *[[InlineKeyboardButton(f"🏬 {s.name}", callback_data=f"browse_{s.id}")] for s in shops],
+        *[[InlineKeyboardButton(f"{c.title} — ₪{c.price}", callback_data=f"buy_{c.id}")] for c in cards],
+    ]
+    if not kb:
+        return await update.message.reply_text("לא נמצאו תוצאות.")
+    await update.message.reply_text("תוצאות חיפוש:", reply_markup=InlineKeyboardMarkup(kb))
+
 # ─────────────────────────────────────────────────────────────
 # CallbackQueryHandler → ניתוב לפי data
 # ─────────────────────────────────────────────────────────────
+CALLBACK_PREFIXES = (
+    "admin_shops", "admin_lb", "admin_prof", "cust_new_full", "cust_new_single", "cust_browse", "cust_myshops",
+    "cust_tokens", "bs:", "bc:", "bm:", "browse_", "buy_", "myshop_", "addcard_",
+)
+
+purchase_flight = SingleFlight("platform", "buy")
+
+@metrics.timed_callback("platform", CALLBACK_PREFIXES)
 async def callback_router(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     data = query.data
@@ -121,22 +182,29 @@ async def callback_router(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     # Admin: רישום כל החנויות
     if data == "admin_shops" and user.is_admin:
+        # עמוד ראשון בלבד; הרשימה המלאה ב־/admin/shops של ה־dashboard
         async with AsyncSessionLocal() as session:
-            shops = (await session.execute(select(Shop))).scalars().all()
-        text = "\n".join([f"{s.id}. {s.name} (בעלים: {s.owner_id})" for s in shops]) or "אין חנויות עדיין."
+            rows = await session.execute(queries.shops_after(0).limit(ADMIN_SHOPS_LIMIT + 1))
+            shops = rows.all()
+        text = "\n".join([f"{s.id}. {s.name} (בעלים: {s.owner_id})" for s in shops[:ADMIN_SHOPS_LIMIT]]) or "אין חנויות עדיין."
+        if len(shops) > ADMIN_SHOPS_LIMIT:
+            text += "\n…"
         return await query.edit_message_text(text)
 
     # Admin: Leaderboard
     if data == "admin_lb" and user.is_admin:
         async with AsyncSessionLocal() as session:
-            purchases = (await session.execute(select(Purchase))).scalars().all()
-            totals = {}
-            for p in purchases:
-                totals[p.user_id] = totals.get(p.user_id, 0) + p.amount
-        sorted_lb = sorted(totals.items(), key=lambda x: x[1], reverse=True)
-        text = "\n".join([f"{uid}: ₪{amt}" for uid, amt in sorted_lb]) or "אין פעילות."
+            top = await leaderboard.top_spenders(session, settings.LEADERBOARD_SIZE)
+        text = "\n".join([f"{row.user_id}: ₪{row.total_spent}" for row in top]) or "אין פעילות."
         return await query.edit_message_text(text)
 
+    # Admin: פרופיל דגימה של התהליך (ברקע, כדי לא לעכב עדכונים אחרים)
+    if data == "admin_prof" and user.is_admin:
+        if profiling.profiler.running:
+            return await query.edit_message_text("⏳ פרופיל כבר רץ.")
+        ctx.application.create_task(send_profile(ctx.bot, query.message.chat_id))
+        return await query.edit_message_text(f"⏱ דוגם {settings.PROFILE_SECONDS:g} שניות…")
+
     # Customer: יצירת חנות חדשה
     if data in ("cust_new_full", "cust_new_single"):
         ctx.user_data["full"] = (data == "cust_new_full")
@@ -145,23 +213,29 @@ async def callback_router(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     # Customer: דפדוף חנויות
     if data == "cust_browse":
-        async with AsyncSessionLocal() as session:
-            shops = (await session.execute(select(Shop))).scalars().all()
-        kb = [[InlineKeyboardButton(s.name, callback_data=f"browse_{s.id}")] for s in shops]
-        return await query.edit_message_text("בחר/י חנות לדפדף:", reply_markup=InlineKeyboardMarkup(kb))
+        return await query.edit_message_text("בחר/י חנות לדפדף:", reply_markup=await catalog.browse_keyboard())
+
+    # דפדוף בין עמודים: bs:<cursor> חנויות, bc/bm:<shop>:<cursor> קלפים
+    if data.startswith("bs:"):
+        return await query.edit_message_text("בחר/י חנות לדפדף:", reply_markup=await catalog.browse_keyboard(data[3:]))
+    if data.startswith(("bc:", "bm:")) and data.count(":") == 2:
+        kind, shop, cursor = data.split(":", 2)
+        shop_id = parse_id(shop)
+        if shop_id is None:
+            return await query.edit_message_text("לא מזוהה.")
+        cards = await catalog.shop_cards(shop_id, cursor)
+        if kind == "bc":
+            return await query.edit_message_text("בחר/י קלף לרכישה:", reply_markup=cards.buy)
+        return await query.edit_message_text("נהל קלפים:", reply_markup=cards.manage)
 
     # Customer: החנויות שלי
     if data == "cust_myshops":
-        async with AsyncSessionLocal() as session:
-            rows = await session.execute(select(Shop).where(Shop.owner_id == user.id))
-            myshops = rows.scalars().all()
-        kb = [[InlineKeyboardButton(s.name, callback_data=f"myshop_{s.id}")] for s in myshops]
-        return await query.edit_message_text("החנויות שלך:", reply_markup=InlineKeyboardMarkup(kb))
+        return await query.edit_message_text("החנויות שלך:", reply_markup=await catalog.owner_keyboard(user.id))
 
     # Customer: הצגת ה-NFT tokens
     if data == "cust_tokens":
         async with AsyncSessionLocal() as session:
-            rows = await session.execute(select(Purchase).where(Purchase.user_id == user.id))
+            rows = await session.execute(queries.purchases_by_user(user.id))
             ps = rows.scalars().all()
         lines = [f"{p.token} (₪{p.amount})" for p in ps]
         return await query.edit_message_text("\n".join(lines) or "אין לך tokens.")
@@ -169,38 +243,25 @@ async def callback_router(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     # דפדוף לקנייה
     if data.startswith("browse_"):
         shop_id = int(data.split("_")[1])
-        async with AsyncSessionLocal() as session:
-            cards = (await session.execute(select(Card).where(Card.shop_id == shop_id))).scalars().all()
-        kb = [[InlineKeyboardButton(f"{c.title} — ₪{c.price}", callback_data=f"buy_{c.id}")] for c in cards]
-        return await query.edit_message_text("בחר/י קלף לרכישה:", reply_markup=InlineKeyboardMarkup(kb))
+        cards = await catalog.shop_cards(shop_id)
+        return await query.edit_message_text("בחר/י קלף לרכישה:", reply_markup=cards.buy)
 
-    # בצע רכישה
+    # בצע רכישה (נכתבת ב־batch משותף, ה־commit כבר בוצע כשחוזרים)
     if data.startswith("buy_"):
         card_id = int(data.split("_")[1])
-        token = str(uuid.uuid4())
-        async with AsyncSessionLocal() as session:
-            card = (await session.execute(select(Card).where(Card.id == card_id))).scalar_one()
-            purchase = Purchase(
-                user_id=user.id,
-                card_id=card.id,
-                token=token,
-                amount=card.price,
-                created_at=datetime.utcnow()
-            )
-            session.add(purchase)
-            await session.commit()
+        # לחיצות חוזרות על אותו כפתור באותה הודעה → רכישה אחת
+        message = query.message.message_id if query.message else query.inline_message_id
+        token, first = await purchase_flight.run((user.id, card_id, message),
+                                                 lambda: purchase_writer.submit(user.id, card_id))
+        if not first:
+            return   # הלחיצה הראשונה כבר מעדכנת את ההודעה (עריכה זהה = BadRequest)
         return await query.edit_message_text(f"✅ רכישה בוצעה!\nYour NFT-Token: `{token}`", parse_mode="Markdown")
 
     # הצגת קלפים בחנות הפרטית שלי
     if data.startswith("myshop_"):
         shop_id = int(data.split("_")[1])
-        async with AsyncSessionLocal() as session:
-            cards = (await session.execute(select(Card).where(Card.shop_id == shop_id))).scalars().all()
-        kb = [
-            [InlineKeyboardButton("➕ הוסף קלף", callback_data=f"addcard_{shop_id}")],
-            *[[InlineKeyboardButton(f"{c.title}", callback_data=f"viewcard_{c.id}")] for c in cards]
-        ]
-        return await query.edit_message_text("נהל קלפים:", reply_markup=InlineKeyboardMarkup(kb))
+        cards = await catalog.shop_cards(shop_id)
+        return await query.edit_message_text("נהל קלפים:", reply_markup=cards.manage)
 
     # מעבר לטיפול בוספת קלף
     if data.startswith("addcard_"):
@@ -209,11 +270,24 @@ async def callback_router(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     return await query.edit_message_text("לא מזוהה.")
 
+async def send_profile(bot, chat_id: int):
+    profile = await profiling.profiler.profile(settings.PROFILE_SECONDS)
+    top = "\n".join(f"{count:>5}  {frame}" for frame, count in profile.top(10))
+    stalls = "\n".join(f"{s['lag_ms']:.0f}ms  {s['handler']}" for s in list(profiling.monitor.stalls)[-5:])
+    await bot.send_document(
+        chat_id,
+        document=profile.folded().encode(),
+        filename="profile.folded",
+        caption=f"{profile.samples} samples / {profile.seconds:g}s\n\n{top}\n\nstalls:\n{stalls or '-'}"[:1024],
+    )
+
 # ─────────────────────────────────────────────────────────────
 # Conversation: ADD_CARD → צילום, כותרת, מחיר
 # ─────────────────────────────────────────────────────────────
 async def add_card_photo(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    ctx.user_data["file_id"] = update.message.photo[-1].file_id
+    photo = update.message.photo[-1]
+    ctx.user_data["file_id"] = photo.file_id
+    ctx.user_data["file_unique_id"] = photo.file_unique_id
     await update.message.reply_text("הכנס/י כותרת לקלף:")
     return CREATE_TITLE
 
@@ -232,12 +306,8 @@ async def add_card_price(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     # שמירת קלף DB
     async with AsyncSessionLocal() as session:
-        # הורדת תמונה
-        file = await ctx.bot.get_file(ctx.user_data["file_id"])
-        folder = f"shops/{shop_id}"
-        os.makedirs(folder, exist_ok=True)
-        path = f"{folder}/{uuid.uuid4()}.jpg"
-        await file.download_to_drive(path)
+        # הורדת תמונה (מדולגת אם התמונה כבר ב־store)
+        path = await image_store.fetch(ctx.bot, ctx.user_data["file_id"], ctx.user_data["file_unique_id"])
 
         card = Card(
             shop_id=shop_id,
@@ -247,7 +317,7 @@ async def add_card_price(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
             created_at=datetime.utcnow()
         )
         session.add(card)
-        await session.commit()
+        await session.commit()   # ה־commit פוסל את קלפי החנות ב־catalog
 
     await update.message.reply_text("✅ קלף נוסף בהצלחה!")
     return ConversationHandler.END
@@ -255,17 +325,39 @@ async def add_card_price(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 # ─────────────────────────────────────────────────────────────
 # Registration & Polling
 # ─────────────────────────────────────────────────────────────
+async def on_startup(app):
+    profiling.monitor.start()
+    if settings.BOT_METRICS_PORT:
+        # ה־histograms של ה־handlers וזמני ה־SQL חיים בתהליך הזה
+        import dashboard as dashboard_server
+        dashboard_server.ensure_server(settings.BOT_METRICS_PORT)
+
+async def on_shutdown(app):
+    # רכישות ו־scores שעוד בזיכרון נכתבים לפני היציאה
+    await purchase_writer.stop()
+    await score_counter.stop()
+
 def main():
     # init DB
     import asyncio
     asyncio.run(init_db())
 
-    app = ApplicationBuilder().token(settings.TELEGRAM_TOKEN).build()
+    builder = (
+        ApplicationBuilder()
+        .token(settings.TELEGRAM_TOKEN)
+        .rate_limiter(scheduler.limiter_for(settings.TELEGRAM_TOKEN))
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    app = with_shared_pool(builder, settings.TELEGRAM_TOKEN).build()
+    register_handlers(app)
+    app.run_polling()
 
-    # handlers
+def register_handlers(app):
     app.add_handler(CommandHandler("start", start))
     app.add_handler(MessageHandler(filters.CONTACT, contact_handler))
     app.add_handler(CommandHandler("dashboard", dashboard))
+    app.add_handler(CommandHandler("search", search_command))
     app.add_handler(CallbackQueryHandler(callback_router))
 
     conv = ConversationHandler(
@@ -279,7 +371,5 @@ def main():
     )
     app.add_handler(conv)
 
-    app.run_polling()
-
 if __name__ == "__main__":
     main()
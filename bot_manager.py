@@ -3,43 +3,133 @@ import asyncio
 import logging
 from telegram.ext import ApplicationBuilder
 from shop_bot import register_handlers  # וודאו שקיים shop_bot.py עם register_handlers
+import webhook_gateway
+import logging_config
+from logging_config import register_secret
+from outbound import scheduler
+from http_pool import with_shared_pool
+import metrics
+import profiling
+from supervisor import ShopBotSupervisor
+from sharding import ShardRunner
 
-logging.basicConfig(
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    level=logging.INFO,
-)
+logging_config.setup()
 logger = logging.getLogger("bot_manager")
 
 ADMIN_ID = int(os.getenv("TELEGRAM_ADMIN_ID", "0"))
 REG_ROOT = "registrations"
 
-async def launch_bot(token: str):
-    logger.info(f"Launching Shop Bot for token: {token[:8]}…")
-    app = ApplicationBuilder().token(token).build()
+# polling – לולאת long-poll לכל בוט; webhook – שרת HTTP אחד לכל הבוטים
+SHOP_BOT_MODE = os.getenv("SHOP_BOT_MODE", "polling")
+BOT_API_URL   = os.getenv("BOT_API_URL", "https://api.telegram.org/bot")
+# >0: בוטי החנויות רצים ב־N תהליכי worker (sharding), לא בלולאה של התהליך הזה
+SHOP_BOT_SHARDS = int(os.getenv("SHOP_BOT_SHARDS", "0"))
+# 0 = בלי dashboard בתהליך הבוטים (ה־gauges של /metrics חיים רק כאן)
+DASHBOARD_PORT = int(os.getenv("DASHBOARD_PORT", "0"))
+
+# token → Application של כל Shop Bot שעלה בתהליך הזה
+running: dict[str, object] = {}
+
+metrics.Gauge("shop_bots_running", "Shop bots started in this process", fn=lambda: len(running))
+
+def build_app(token: str):
+    # כל הבוטים חולקים scheduler יוצא אחד (מגבלות flood לכל בוט ולכל צ'אט)
+    # ו־pool חיבורים אחד ל־Bot API (SSL context ו־sockets משותפים)
+    builder = ApplicationBuilder().token(token).base_url(BOT_API_URL).rate_limiter(scheduler.limiter_for(token))
+    builder = with_shared_pool(builder, token)
+    if SHOP_BOT_MODE == "webhook":
+        # העדכונים מגיעים מה־gateway, אין צורך ב־Updater
+        builder = builder.updater(None)
+    app = builder.build()
     register_handlers(app)
-    await app.initialize()
+    return app
+
+async def launch_bot(token: str, wake: bool = False):
+    register_secret(token)
+    logger.info(f"Launching Shop Bot for token: {token[:8]}…")
+    app = build_app(token)
+    supervisor.track(app, token)
+    await app.initialize()   # initialize כבר קורא ל־get_me
     await app.start()
-    await app.updater.start_polling()
-    me = await app.bot.get_me()
-    logger.info(f"✅ Shop Bot launched as @{me.username}")
+    if SHOP_BOT_MODE == "webhook":
+        # בהתעוררות ה־webhook עדיין רשום אצל Telegram
+        await webhook_gateway.attach(app, token, set_webhook=not wake)
+    else:
+        await app.updater.start_polling()
+    running[token] = app
+    profiling.monitor.start()
+    if DASHBOARD_PORT:
+        import dashboard
+        dashboard.ensure_server(DASHBOARD_PORT)
+    logger.info(f"✅ Shop Bot launched as @{app.bot.username}")
     return app
 
-async def main():
-    if not os.path.isdir(REG_ROOT):
-        os.makedirs(REG_ROOT, exist_ok=True)
+async def stop_bot(token: str):
+    # hibernate: ב־webhook ה־route נשאר רדום ומעיר את הבוט בעדכון הבא
+    if SHOP_BOT_MODE == "webhook":
+        webhook_gateway.park(token, lambda: supervisor.wake(token))
+    app = running.pop(token, None)
+    if app is None:
+        return
+    if app.updater is not None:
+        await app.updater.stop()
+    await app.stop()
+    await app.shutdown()
 
-    tasks = []
+supervisor = ShopBotSupervisor(launch_bot, stop_bot, SHOP_BOT_MODE, BOT_API_URL,
+                               os.path.join(REG_ROOT, ".activity.json"))
+
+metrics.Gauge("shop_bots", "Registered shop bots by supervisor state", ("state",), fn=supervisor.counts)
+
+runner: ShardRunner | None = None
+
+metrics.Gauge("shard_worker_cpu", "CPU fraction used by each shard worker", ("worker",),
+              fn=lambda: runner.worker_health("cpu") if runner else {})
+metrics.Gauge("shard_worker_updates_per_second", "Updates handled per second by each shard worker", ("worker",),
+              fn=lambda: runner.worker_health("updates_per_s") if runner else {})
+metrics.Gauge("shard_worker_loop_lag_ms", "Last event-loop lag reported by each shard worker", ("worker",),
+              fn=lambda: runner.worker_health("loop_lag_ms") if runner else {})
+metrics.Counter("shard_worker_restarts_total", "Shard workers respawned after dying",
+                fn=lambda: runner.restarts if runner else 0)
+
+def registered_tokens() -> list[str]:
+    os.makedirs(REG_ROOT, exist_ok=True)
+    tokens = []
     for user_id in os.listdir(REG_ROOT):
         user_path = os.path.join(REG_ROOT, user_id)
         if not os.path.isdir(user_path):
             continue
-        for bot_token in os.listdir(user_path):
-            tasks.append(launch_bot(bot_token))
+        tokens.extend(os.listdir(user_path))
+    return tokens
+
+async def start_shards():
+    global runner
+    runner = ShardRunner(SHOP_BOT_SHARDS, SHOP_BOT_MODE)
+    await runner.start(registered_tokens())
+    if DASHBOARD_PORT:
+        import dashboard
+        dashboard.ensure_server(DASHBOARD_PORT)
 
-    if tasks:
-        await asyncio.gather(*tasks, return_exceptions=True)
+async def stop_shards():
+    if runner is not None:
+        await runner.stop()
+
+async def add_bot(token: str):
+    # הרשמה חדשה (main.price1): ל־worker לפי הטבעת, או בתהליך הזה
+    if runner is not None:
+        runner.add(token)
+    else:
+        await supervisor.add(token)
+
+async def main():
+    if SHOP_BOT_SHARDS:
+        await start_shards()
     else:
-        logger.info("No registered shop bots found.")
+        tokens = registered_tokens()
+        if tokens:
+            await supervisor.run(tokens)
+        else:
+            logger.info("No registered shop bots found.")
 
     # משאירים את הלולאה פתוחה
     await asyncio.Event().wait()
@@ -0,0 +1,238 @@
+from collections import OrderedDict
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from config import settings
+from database import AsyncSessionLocal
+from models import Shop, Card
+import metrics
+import queries
+
+PAGE_SIZE = settings.CATALOG_PAGE_SIZE
+FIRST_PAGE = ">0"
+
+# ─────────────────────────────────────────────────────────────
+# Cursor קומפקטי ל־callback_data (תקרה של 64 בתים):
+#   ">k" – העמוד שאחרי id k, "<k" – העמוד שלפני id k, k ב־base36
+# ─────────────────────────────────────────────────────────────
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+def b36(n: int) -> str:
+    out = ""
+    while True:
+        n, r = divmod(n, 36)
+        out = _DIGITS[r] + out
+        if not n:
+            return out
+
+def parse_id(text: str) -> int | None:
+    # callback_data מגיע מהלקוח: רק ספרות base36 ב־ASCII (isalnum מקבל גם "é")
+    if not text or len(text) > 13 or not all(c in _DIGITS for c in text.lower()):
+        return None
+    return int(text, 36)
+
+def parse_cursor(cursor: str) -> tuple[str, int]:
+    direction, ref = cursor[:1], parse_id(cursor[1:])
+    if direction not in "<>" or ref is None:
+        return ">", 0
+    return direction, ref
+
+async def _load_page(after_stmt, before_stmt, cursor: str) -> tuple[list, list[tuple[str, str]]]:
+    # keyset: עמוד אחד + שורה אחת כדי לדעת אם יש עוד
+    direction, ref = parse_cursor(cursor)
+    stmt = after_stmt(ref) if direction == ">" else before_stmt(ref)
+    async with AsyncSessionLocal() as session:
+        rows = (await session.execute(stmt.limit(PAGE_SIZE + 1))).all()
+    more = len(rows) > PAGE_SIZE
+    rows = rows[:PAGE_SIZE]
+    if direction == "<":
+        rows.reverse()
+        has_prev, has_next = more, True
+    else:
+        has_prev, has_next = ref > 0, more
+    nav = []
+    if rows and has_prev:
+        nav.append(("◀️", "<" + b36(rows[0].id)))
+    if rows and has_next:
+        nav.append(("▶️", ">" + b36(rows[-1].id)))
+    return rows, nav
+
+def _nav_row(prefix: str, nav: list[tuple[str, str]]) -> list[list[InlineKeyboardButton]]:
+    return [[InlineKeyboardButton(label, callback_data=prefix + cursor) for label, cursor in nav]] if nav else []
+
+# ─────────────────────────────────────────────────────────────
+# עמוד קלפים של חנות – שתי המקלדות נבנות מאותה שאילתה
+# ─────────────────────────────────────────────────────────────
+class ShopCards:
+    __slots__ = ("buy", "manage")
+
+    def __init__(self, shop_id: int, cards, nav: list[tuple[str, str]]):
+        shop = b36(shop_id)
+        self.buy = InlineKeyboardMarkup([
+            *[[InlineKeyboardButton(f"{c.title} — ₪{c.price}", callback_data=f"buy_{c.id}")] for c in cards],
+            *_nav_row(f"bc:{shop}:", nav),
+        ])
+        self.manage = InlineKeyboardMarkup([
+            [InlineKeyboardButton("➕ הוסף קלף", callback_data=f"addcard_{shop_id}")],
+            *[[InlineKeyboardButton(f"{c.title}", callback_data=f"viewcard_{c.id}")] for c in cards],
+            *_nav_row(f"bm:{shop}:", nav),
+        ])
+
+# ─────────────────────────────────────────────────────────────
+# Snapshot של הקטלוג בזיכרון עם מקלדות מוכנות, עמוד לכל cursor.
+# LRU אחד על כל העמודים (ה־cursor מגיע מ־callback_data – כל לקוח יכול
+# לשלוח כל cursor), מפתח = קבוצה + cursor; קבוצה = מה שנפסל יחד:
+# ("browse",), ("cards", shop_id), ("owned", owner_id).
+# נפסל חלקית אחרי commit שנגע ב־Shop/Card (ראו listeners למטה)
+# ─────────────────────────────────────────────────────────────
+class Catalog:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._entries: OrderedDict[tuple, object] = OrderedDict()
+        self._groups: dict[tuple, set[tuple]] = {}
+        # טעינה שהתחילה לפני פסילה לא נשמרת (אחרת נשמר snapshot ישן)
+        self._generation = 0
+
+    def _get(self, key: tuple):
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def _put(self, generation: int, key: tuple, value):
+        if generation != self._generation:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        self._groups.setdefault(key[:-1], set()).add(key)
+        while len(self._entries) > self.maxsize:
+            old, _ = self._entries.popitem(last=False)
+            group = self._groups[old[:-1]]
+            group.discard(old)
+            if not group:
+                del self._groups[old[:-1]]
+            self.evicted += 1
+
+    def _drop(self, group: tuple):
+        for key in self._groups.pop(group, ()):
+            del self._entries[key]
+
+    async def browse_keyboard(self, cursor: str = FIRST_PAGE) -> InlineKeyboardMarkup:
+        key = ("browse", cursor)
+        kb = self._get(key)
+        if kb is not None:
+            return kb
+        generation = self._generation
+        shops, nav = await _load_page(queries.shops_after, queries.shops_before, cursor)
+        kb = InlineKeyboardMarkup([
+            *[[InlineKeyboardButton(s.name, callback_data=f"browse_{s.id}")] for s in shops],
+            *_nav_row("bs:", nav),
+        ])
+        self._put(generation, key, kb)
+        return kb
+
+    async def owner_keyboard(self, owner_id: int) -> InlineKeyboardMarkup:
+        key = ("owned", owner_id, FIRST_PAGE)
+        kb = self._get(key)
+        if kb is not None:
+            return kb
+        generation = self._generation
+        async with AsyncSessionLocal() as session:
+            shops = (await session.execute(queries.shops_by_owner(owner_id))).scalars().all()
+        kb = InlineKeyboardMarkup([[InlineKeyboardButton(s.name, callback_data=f"myshop_{s.id}")] for s in shops])
+        self._put(generation, key, kb)
+        return kb
+
+    async def shop_cards(self, shop_id: int, cursor: str = FIRST_PAGE) -> ShopCards:
+        key = ("cards", shop_id, cursor)
+        entry = self._get(key)
+        if entry is not None:
+            return entry
+        generation = self._generation
+        cards, nav = await _load_page(
+            lambda ref: queries.cards_after(shop_id, ref),
+            lambda ref: queries.cards_before(shop_id, ref),
+            cursor,
+        )
+        entry = ShopCards(shop_id, cards, nav)
+        self._put(generation, key, entry)
+        return entry
+
+    # ─────────────────────────────────────────────────────────
+    # פסילה חלקית
+    # ─────────────────────────────────────────────────────────
+    def shop_changed(self, shop_id: int, owner_id: int | None):
+        self._generation += 1
+        self._drop(("browse",))
+        self._drop(("cards", shop_id))
+        if owner_id is not None:
+            self._drop(("owned", owner_id))
+
+    def card_changed(self, shop_id: int):
+        self._generation += 1
+        self._drop(("cards", shop_id))
+
+    def clear(self):
+        self._generation += 1
+        self._entries.clear()
+        self._groups.clear()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "pages": len(self._entries), "evicted": self.evicted}
+
+catalog = Catalog(settings.CATALOG_CACHE_SIZE)
+
+metrics.Counter("catalog_cache_requests_total", "Catalog keyboard lookups by result", ("result",),
+                fn=lambda: {"hit": catalog.hits, "miss": catalog.misses})
+metrics.Gauge("catalog_cache_pages", "Catalog keyboard pages held in memory", fn=lambda: len(catalog._entries))
+metrics.Counter("catalog_cache_evictions_total", "Catalog pages dropped by the CATALOG_CACHE_SIZE cap",
+                fn=lambda: catalog.evicted)
+
+# ─────────────────────────────────────────────────────────────
+# שינויים דרך ה־ORM נאספים ב־session.info ומוחלים רק אחרי commit,
+# כך שקורא מקביל לא טוען ושומר מצב שעוד לא נכתב
+# ─────────────────────────────────────────────────────────────
+def _pending(target) -> set | None:
+    session = Session.object_session(target)
+    return session.info.setdefault("catalog_changes", set()) if session is not None else None
+
+@event.listens_for(Shop, "after_insert")
+@event.listens_for(Shop, "after_update")
+@event.listens_for(Shop, "after_delete")
+def _shop_changed(mapper, connection, target):
+    pending = _pending(target)
+    if pending is not None:
+        pending.add(("shop", target.id, target.owner_id))
+        # העברת בעלות – גם המקלדת של הבעלים הקודם
+        for owner_id in inspect(target).attrs.owner_id.history.deleted:
+            pending.add(("shop", target.id, owner_id))
+
+@event.listens_for(Card, "after_insert")
+@event.listens_for(Card, "after_update")
+@event.listens_for(Card, "after_delete")
+def _card_changed(mapper, connection, target):
+    pending = _pending(target)
+    if pending is not None:
+        pending.add(("card", target.shop_id, None))
+        for shop_id in inspect(target).attrs.shop_id.history.deleted:
+            pending.add(("card", shop_id, None))
+
+@event.listens_for(Session, "after_commit")
+def _apply_changes(session):
+    for kind, key, owner_id in session.info.pop("catalog_changes", ()):
+        if kind == "shop":
+            catalog.shop_changed(key, owner_id)
+        else:
+            catalog.card_changed(key)
+
+@event.listens_for(Session, "after_rollback")
+def _drop_changes(session):
+    session.info.pop("catalog_changes", None)
@@ -5,8 +5,30 @@ class Settings(BaseSettings):
     TELEGRAM_TOKEN: str
     ADMIN_ID: int
     DATABASE_URL: str = "sqlite+aiosqlite:///./app.db"
+    # auto | sqlite (ברירות המחדל של SQLite) | sqlite-wal | postgres
+    DB_PROFILE: str = "auto"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_RECYCLE: int = 1800
+    DB_STATEMENT_CACHE_SIZE: int = 100   # 0 מאחורי pgbouncer במצב transaction
     FULL_SHOP_PRICE: float = 2490.0
     SINGLE_CARD_PRICE: float = 39.0
+    LEADERBOARD_SIZE: int = 20
+    USER_CACHE_SIZE: int = 10000
+    USER_CACHE_TTL: float = 300.0
+    PURCHASE_BATCH_SIZE: int = 64
+    PURCHASE_FLUSH_MS: float = 5.0
+    SCORE_FLUSH_MS: float = 1000.0
+    SCORE_MAX_PENDING: int = 10000   # משתמשים עם דלתות בזיכרון לפני flush מוקדם
+    CATALOG_PAGE_SIZE: int = 20
+    CATALOG_CACHE_SIZE: int = 5000   # עמודי מקלדת ב־catalog (LRU)
+    SEARCH_LIMIT: int = 20
+    PROFILE_SECONDS: float = 10.0
+    BOT_METRICS_PORT: int = 0   # dashboard + /metrics בתהליך של bot.py; 0 = כבוי
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from storage import storage
+import metrics
+
+# ─────────────────────────────────────────────────────────────
+# הגדרות מה־env
+# ─────────────────────────────────────────────────────────────
+CONVERSATION_TTL = float(os.getenv("CONVERSATION_TTL", "3600"))
+CONVERSATION_MAX = int(os.getenv("CONVERSATION_MAX", "10000"))
+CONVERSATION_DB  = os.getenv("CONVERSATION_DB", "")   # ריק = בזיכרון בלבד
+
+# ─────────────────────────────────────────────────────────────
+# Backend על SQLite – חיבור אחד, כל הקריאות דרך ה־thread pool של storage
+# ─────────────────────────────────────────────────────────────
+class SQLiteBackend:
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS sessions (
+                store TEXT NOT NULL, key TEXT NOT NULL, data TEXT NOT NULL, expires REAL NOT NULL,
+                PRIMARY KEY (store, key));
+            CREATE TABLE IF NOT EXISTS conversations (
+                name TEXT NOT NULL, key TEXT NOT NULL, state TEXT NOT NULL, expires REAL NOT NULL,
+                PRIMARY KEY (name, key));
+            CREATE TABLE IF NOT EXISTS user_data (
+                user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL);
+        """)
+
+    def execute(self, sql: str, params: tuple = ()) -> list[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            for table in ("sessions", "conversations", "user_data"):
+                self._conn.execute(f"DELETE FROM {table} WHERE expires < ?", (now,))
+
+_backend: SQLiteBackend | None = None
+
+def backend() -> SQLiteBackend | None:
+    global _backend
+    if _backend is None and CONVERSATION_DB:
+        _backend = SQLiteBackend(CONVERSATION_DB)
+    return _backend
+
+# ─────────────────────────────────────────────────────────────
+# מצב שיחה בזיכרון: TTL, תקרת רשומות ורשומות __slots__ קומפקטיות.
+# עם backend – write-through לדיסק וטעינה עצלה אחרי restart/פינוי
+# ─────────────────────────────────────────────────────────────
+class _Entry:
+    __slots__ = ("data", "expires")
+
+    def __init__(self, data: dict, expires: float):
+        self.data = data
+        self.expires = expires
+
+stores: dict[str, "ConversationStore"] = {}
+
+class ConversationStore:
+    def __init__(self, name: str, ttl: float = CONVERSATION_TTL,
+                 max_entries: int = CONVERSATION_MAX, backend: SQLiteBackend | None = None):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.backend = backend
+        self.evicted = 0
+        # כל כתיבה מזיזה לסוף, כך שהראש הוא (בקירוב) הבא לפוג
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        stores[name] = self
+
+    def _evict(self):
+        now = time.time()
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.expires >= now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[key]
+            self.evicted += 1
+
+    async def get(self, key: int) -> dict | None:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires >= time.time():
+            return entry.data
+        if entry is not None:
+            del self._entries[key]
+        if self.backend is None:
+            return None
+        rows = await storage.run("session_load", self.backend.execute,
+                                 "SELECT data, expires FROM sessions WHERE store = ? AND key = ? AND expires >= ?",
+                                 (self.name, str(key), time.time()))
+        if not rows:
+            return None
+        data = json.loads(rows[0][0])
+        self._entries[key] = _Entry(data, rows[0][1])
+        self._evict()
+        return data
+
+    async def set(self, key: int, data: dict):
+        expires = time.time() + self.ttl
+        self._entries.pop(key, None)
+        self._entries[key] = _Entry(data, expires)
+        self._evict()
+        if self.backend is not None:
+            await storage.run("session_save", self.backend.execute,
+                              "INSERT OR REPLACE INTO sessions (store, key, data, expires) VALUES (?, ?, ?, ?)",
+                              (self.name, str(key), json.dumps(data, ensure_ascii=False), expires))
+
+    async def update(self, key: int, **fields) -> dict | None:
+        data = await self.get(key)
+        if data is None:
+            return None
+        data.update(fields)
+        await self.set(key, data)
+        return data
+
+    async def pop(self, key: int) -> dict | None:
+        data = await self.get(key)
+        self._entries.pop(key, None)
+        if self.backend is not None:
+            await storage.run("session_delete", self.backend.execute,
+                              "DELETE FROM sessions WHERE store = ? AND key = ?", (self.name, str(key)))
+        return data
+
+    def __len__(self):
+        return len(self._entries)
+
+metrics.Gauge("conversation_sessions_open", "In-memory conversation sessions per store", ("store",),
+              fn=lambda: {name: len(store) for name, store in stores.items()})
+metrics.Counter("conversation_sessions_evicted_total", "Sessions dropped by TTL or size cap", ("store",),
+                fn=lambda: {name: store.evicted for name, store in stores.items()})
+
+# ─────────────────────────────────────────────────────────────
+# Persistence ל־ConversationHandler: מצבי שיחה + user_data, רק לא־פגים
+# ─────────────────────────────────────────────────────────────
+class SQLitePersistence(BasePersistence):
+    def __init__(self, backend: SQLiteBackend, ttl: float = CONVERSATION_TTL, update_interval: float = 60):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.backend = backend
+        self.ttl = ttl
+
+    async def _run(self, sql: str, params: tuple = ()):
+        return await storage.run("persistence", self.backend.execute, sql, params)
+
+    async def get_conversations(self, name):
+        await storage.run("persistence_purge", self.backend.purge_expired)
+        rows = await self._run("SELECT key, state FROM conversations WHERE name = ?", (name,))
+        return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+
+    async def update_conversation(self, name, key, new_state):
+        if new_state is None:
+            await self._run("DELETE FROM conversations WHERE name = ? AND key = ?", (name, json.dumps(key)))
+            return
+        await self._run(
+            "INSERT OR REPLACE INTO conversations (name, key, state, expires) VALUES (?, ?, ?, ?)",
+            (name, json.dumps(key), json.dumps(new_state), time.time() + self.ttl),
+        )
+
+    async def get_user_data(self):
+        rows = await self._run("SELECT user_id, data FROM user_data WHERE expires >= ?", (time.time(),))
+        return {user_id: json.loads(data) for user_id, data in rows}
+
+    async def update_user_data(self, user_id, data):
+        await self._run(
+            "INSERT OR REPLACE INTO user_data (user_id, data, expires) VALUES (?, ?, ?)",
+            (user_id, json.dumps(data, ensure_ascii=False), time.time() + self.ttl),
+        )
+
+    async def drop_user_data(self, user_id):
+        await self._run("DELETE FROM user_data WHERE user_id = ?", (user_id,))
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    # chat_data / bot_data / callback_data לא נשמרים
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        await storage.run("persistence_purge", self.backend.purge_expired)
+
+def conversation_persistence() -> SQLitePersistence | None:
+    db = backend()
+    return SQLitePersistence(db) if db is not None else None
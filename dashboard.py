@@ -1,35 +1,234 @@
-from fastapi import FastAPI, Depends
-from database import AsyncSessionLocal
-from models import User, Shop, Card, Purchase, Score
-from sqlalchemy.future import select
+import io
+import csv
+import json
+import asyncio
+from datetime import datetime
+
+import uvicorn
+from fastapi import FastAPI, Depends, Response
+from fastapi.responses import StreamingResponse
+from database import AsyncSessionLocal, upsert
+from models import Purchase, ExportWatermark
+from sqlalchemy import func
+import leaderboard as leaderboard_store
+import queries
+import metrics
+import profiling
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:   # format=arrow זמין רק עם pyarrow מותקן
+    pa = None
 
 app = FastAPI(title="NFTII Exchange Dashboard")
 
+PAGE_LIMIT   = 1000   # תקרה לעמוד JSON אחד
+STREAM_CHUNK = 500    # שורות לכל fetch מה־cursor בצד השרת
+EXPORT_CHUNK = 5000   # שורות לכל chunk בייצוא (CSV / עמודות / Arrow batch)
+DASHBOARD_HOST = "0.0.0.0"
+
+_server_task: asyncio.Task | None = None
+
 async def get_session():
     async with AsyncSessionLocal() as session:
         yield session
 
+# ─────────────────────────────────────────────────────────────
+# Keyset pagination על id + מצב NDJSON בזרימה
+# ─────────────────────────────────────────────────────────────
+async def _page(session, response: Response, stmt, limit: int):
+    limit = max(1, min(limit, PAGE_LIMIT))
+    rows = (await session.execute(stmt.limit(limit))).mappings().all()
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = str(rows[-1]["id"])
+    return [dict(r) for r in rows]
+
+async def _ndjson(stmt):
+    # session משלו: ה־dependency נסגר לפני שה־body נשלח
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(stmt.execution_options(yield_per=STREAM_CHUNK))
+        async for rows in result.mappings().partitions():
+            yield "".join(json.dumps(dict(r), ensure_ascii=False) + "\n" for r in rows)
+
+async def _listing(stmt, limit: int, format: str, session, response: Response):
+    if format == "ndjson":
+        return StreamingResponse(_ndjson(stmt), media_type="application/x-ndjson")
+    return await _page(session, response, stmt, limit)
+
 @app.get("/admin/shops")
-async def list_shops(session=Depends(get_session)):
-    result = await session.execute(select(Shop))
-    shops = result.scalars().all()
-    return [{"id": s.id, "name": s.name, "owner_id": s.owner_id} for s in shops]
+async def list_shops(response: Response, after_id: int = 0, limit: int = 100,
+                     format: str = "json", session=Depends(get_session)):
+    return await _listing(queries.shops_after(after_id), limit, format, session, response)
 
 @app.get("/admin/purchases")
-async def list_purchases(session=Depends(get_session)):
-    result = await session.execute(select(Purchase))
-    ps = result.scalars().all()
-    return [{"user_id": p.user_id, "card_id":p.card_id, "token":p.token, "amount":p.amount} for p in ps]
+async def list_purchases(response: Response, after_id: int = 0, limit: int = 100,
+                         format: str = "json", session=Depends(get_session)):
+    return await _listing(queries.purchases_after(after_id), limit, format, session, response)
+
+# ─────────────────────────────────────────────────────────────
+# ייצוא רכישות לאנליטיקה: purchases ⨝ cards ⨝ shops בזרימה, בזיכרון קבוע.
+#   csv     – שורה לכל רכישה
+#   columns – NDJSON, כל שורה chunk של עמודות: {"id": [...], "amount": [...]}
+#   arrow   – Arrow IPC stream, RecordBatch לכל chunk (אם pyarrow מותקן)
+# snapshot: max(id) נקבע בהתחלה, כך שרכישות חדשות לא נכנסות באמצע.
+# watermark=<name>: ממשיך מאיפה שהייצוא הקודם באותו שם נגמר, ומתקדם
+# רק כשהזרם נשלח עד הסוף (ניתוק באמצע = אותו טווח בפעם הבאה)
+# ─────────────────────────────────────────────────────────────
+EXPORT_COLUMNS = ("id", "created_at", "user_id", "card_id", "card_title", "shop_id", "shop_name", "amount")
+EXPORT_MEDIA = {"csv": "text/csv", "columns": "application/x-ndjson",
+                "arrow": "application/vnd.apache.arrow.stream"}
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+def _csv_chunk(rows, header: bool) -> str:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    writer.writerows((r[0], _iso(r[1]), *r[2:]) for r in rows)
+    return out.getvalue()
+
+def _columns_chunk(rows) -> str:
+    columns = dict(zip(EXPORT_COLUMNS, map(list, zip(*rows))))
+    columns["created_at"] = [_iso(v) for v in columns["created_at"]]
+    return json.dumps(columns, ensure_ascii=False) + "\n"
+
+class _ArrowChunks:
+    # ה־writer כותב ל־buffer שמתרוקן אחרי כל batch
+    def __init__(self):
+        self.schema = pa.schema([
+            ("id", pa.int64()), ("created_at", pa.timestamp("us")), ("user_id", pa.int64()),
+            ("card_id", pa.int64()), ("card_title", pa.string()), ("shop_id", pa.int64()),
+            ("shop_name", pa.string()), ("amount", pa.float64()),
+        ])
+        self._sink = io.BytesIO()
+        self._writer = pa.ipc.new_stream(self._sink, self.schema)
+
+    def _drain(self) -> bytes:
+        data = self._sink.getvalue()
+        self._sink.seek(0)
+        self._sink.truncate()
+        return data
+
+    def chunk(self, rows) -> bytes:
+        columns = dict(zip(EXPORT_COLUMNS, map(list, zip(*rows))))
+        self._writer.write_batch(pa.RecordBatch.from_pydict(columns, schema=self.schema))
+        return self._drain()
+
+    def close(self) -> bytes:
+        self._writer.close()
+        return self._drain()
+
+async def _save_watermark(name: str, last_id: int, last_created_at, rows: int):
+    stmt = upsert(ExportWatermark).values(
+        name=name, last_id=last_id, last_created_at=last_created_at, rows=rows, updated_at=datetime.utcnow(),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ExportWatermark.name],
+        set_={
+            "last_id":         stmt.excluded.last_id,
+            "last_created_at": func.coalesce(stmt.excluded.last_created_at, ExportWatermark.last_created_at),
+            "rows":            stmt.excluded.rows,
+            "updated_at":      stmt.excluded.updated_at,
+        },
+    )
+    async with AsyncSessionLocal() as session:
+        await session.execute(stmt)
+        await session.commit()
+
+async def _export(stmt, format: str, watermark: str | None, upto_id: int):
+    arrow = _ArrowChunks() if format == "arrow" else None
+    rows_sent, last_created_at = 0, None
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(stmt.execution_options(yield_per=EXPORT_CHUNK))
+        async for rows in result.tuples().partitions():
+            if format == "csv":
+                yield _csv_chunk(rows, header=not rows_sent)
+            elif format == "columns":
+                yield _columns_chunk(rows)
+            else:
+                yield arrow.chunk(rows)
+            rows_sent += len(rows)
+            last_created_at = rows[-1][1]
+    if format == "csv" and not rows_sent:
+        yield _csv_chunk((), header=True)
+    elif arrow is not None:
+        yield arrow.close()
+    if watermark:
+        await _save_watermark(watermark, upto_id, last_created_at, rows_sent)
+
+@app.get("/admin/export/purchases")
+async def export_purchases(format: str = "csv", since_id: int = 0, since: datetime | None = None,
+                           watermark: str | None = None, session=Depends(get_session)):
+    if format not in EXPORT_MEDIA:
+        return Response(f"format must be one of {', '.join(EXPORT_MEDIA)}", status_code=400)
+    if format == "arrow" and pa is None:
+        return Response("format=arrow requires pyarrow", status_code=501)
+    if watermark:
+        mark = await session.get(ExportWatermark, watermark)
+        if mark is not None:
+            since_id = max(since_id, mark.last_id)
+    upto_id = (await session.execute(queries.purchases_max_id())).scalar() or 0
+    stmt = queries.purchases_export(since_id, upto_id)
+    if since is not None:
+        stmt = stmt.where(Purchase.created_at >= since)
+    headers = {"X-Export-Since-Id": str(since_id), "X-Export-Upto-Id": str(upto_id)}
+    return StreamingResponse(_export(stmt, format, watermark, max(upto_id, since_id)),
+                             media_type=EXPORT_MEDIA[format], headers=headers)
+
+@app.get("/admin/export/watermarks")
+async def export_watermarks(session=Depends(get_session)):
+    marks = (await session.execute(queries.export_watermarks())).scalars()
+    return [{"name": m.name, "last_id": m.last_id, "last_created_at": m.last_created_at,
+             "rows": m.rows, "updated_at": m.updated_at} for m in marks]
 
 @app.get("/leaderboard")
-async def leaderboard(session=Depends(get_session)):
-    result = await session.execute(select(User))
-    users = result.scalars().all()
-    # בניית דירוג על פי סכום הרכישות
-    ranking = []
-    for u in users:
-        total = await session.execute(select(Purchase).where(Purchase.user_id==u.id))
-        amt = sum(p.amount for p in total.scalars().all())
-        ranking.append({"user_id":u.telegram_id, "total_spent":amt})
-    ranking.sort(key=lambda x: x["total_spent"], reverse=True)
-    return ranking
+async def leaderboard(limit: int = 100, session=Depends(get_session)):
+    # דירוג מתוך המצטבר user_spend – Top-K באינדקס
+    top = await leaderboard_store.top_spenders(session, limit)
+    return [{"user_id": row.telegram_id, "total_spent": row.total_spent} for row in top]
+
+# ─────────────────────────────────────────────────────────────
+# Prometheus: handlers, זמני SQL, בוטים רצים וסשנים פתוחים
+# ─────────────────────────────────────────────────────────────
+@app.get("/metrics")
+async def metrics_endpoint():
+    # כולל את ה־workers של SHOP_BOT_SHARDS (label shard) כשהם רצים מהתהליך הזה
+    return Response(await metrics.render_all(), media_type=metrics.CONTENT_TYPE)
+
+# ─────────────────────────────────────────────────────────────
+# פרופיל דגימה לפי דרישה (collapsed stacks) + ה־stalls האחרונים של הלולאה
+# ─────────────────────────────────────────────────────────────
+@app.get("/admin/profile")
+async def profile(seconds: float = 10, all_threads: bool = False):
+    try:
+        result = await profiling.profiler.profile(seconds, all_threads)
+    except RuntimeError as e:
+        return Response(str(e), status_code=409)
+    return Response(result.folded(), media_type="text/plain")
+
+@app.get("/admin/loop-stalls")
+async def loop_stalls():
+    return list(profiling.monitor.stalls)
+
+@app.get("/admin/bots")
+async def bots_readiness():
+    # מצב ה־supervisor של בוטי החנויות (רלוונטי כשה־dashboard רץ בתהליך שלהם)
+    import bot_manager
+    if bot_manager.runner is not None:
+        return bot_manager.runner.stats()
+    return bot_manager.supervisor.readiness()
+
+# ─────────────────────────────────────────────────────────────
+# הרצה בתוך הלולאה של תהליך הבוטים, כדי ש־/metrics יראה את המצב שלהם
+# ─────────────────────────────────────────────────────────────
+async def serve(port: int):
+    server = uvicorn.Server(uvicorn.Config(app, host=DASHBOARD_HOST, port=port, log_level="warning"))
+    await server.serve()
+
+def ensure_server(port: int):
+    global _server_task
+    if _server_task is None or _server_task.done():
+        _server_task = asyncio.create_task(serve(port))
@@ -1,9 +1,54 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 
 from config import settings
+import metrics
 
-engine = create_async_engine(settings.DATABASE_URL, echo=False)
+# ─────────────────────────────────────────────────────────────
+# פרופילי אחסון: נבחרים ב־DB_PROFILE, auto = לפי DATABASE_URL
+# ─────────────────────────────────────────────────────────────
+PROFILES = {"sqlite": "sqlite", "sqlite-wal": "sqlite", "postgres": "postgresql"}
+
+def resolve_profile(url: str, profile: str) -> str:
+    backend = make_url(url).get_backend_name()
+    if profile == "auto":
+        return "sqlite-wal" if backend == "sqlite" else "postgres"
+    if PROFILES.get(profile) != backend:
+        raise ValueError(f"DB_PROFILE={profile} does not match DATABASE_URL backend {backend}")
+    return profile
+
+def engine_options(profile: str) -> dict:
+    if profile != "postgres":
+        return {}
+    return {
+        "pool_size":     settings.DB_POOL_SIZE,
+        "max_overflow":  settings.DB_MAX_OVERFLOW,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_recycle":  settings.DB_POOL_RECYCLE,
+        # cache של prepared statements: של asyncpg ושל ה־dialect של SQLAlchemy
+        "connect_args":  {
+            "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+            "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        },
+    }
+
+def _sqlite_pragmas(dbapi_conn, connection_record):
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+    cursor.close()
+
+DB_PROFILE = resolve_profile(settings.DATABASE_URL, settings.DB_PROFILE)
+engine = create_async_engine(settings.DATABASE_URL, echo=False, **engine_options(DB_PROFILE))
+if DB_PROFILE == "sqlite-wal":
+    event.listen(engine.sync_engine, "connect", _sqlite_pragmas)
+metrics.instrument_engine(engine.sync_engine)
+metrics.Gauge("db_connections_checked_out", "Pooled DB connections currently in use (open sessions)",
+              fn=lambda: getattr(engine.sync_engine.pool, "checkedout", lambda: 0)())
 AsyncSessionLocal = sessionmaker(
     bind=engine,
     class_=AsyncSession,
@@ -12,5 +57,22 @@ AsyncSessionLocal = sessionmaker(
 
 async def init_db():
     import models
+    import search
     async with engine.begin() as conn:
         await conn.run_sync(models.Base.metadata.create_all)
+        await conn.run_sync(_migrate_indexes, models.Base.metadata)
+        await conn.run_sync(search.create_index)
+
+def _migrate_indexes(conn, metadata):
+    # create_all לא מוסיף אינדקסים לטבלאות שכבר קיימות ב־DB ישן
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+def upsert(model):
+    # INSERT … ON CONFLICT בדיאלקט של ה־engine הפעיל
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
@@ -0,0 +1,196 @@
+import os
+import time
+import zlib
+import asyncio
+import logging
+import contextlib
+from importlib.util import find_spec
+
+import httpx
+from telegram.request import HTTPXRequest
+
+import metrics
+
+logger = logging.getLogger("http_pool")
+
+# ─────────────────────────────────────────────────────────────
+# הגדרות מה־env
+# ─────────────────────────────────────────────────────────────
+# 1 = client משותף לכל הבוטים: RSS ואתחול נמוכים בהרבה (200 בוטים: 65MB/1.9s מול 391MB/16s),
+# אבל ~1ms CPU יותר לעדכון ב־localhost. ב־RTT של 50ms שווה רק עם HTTP_POOL_SIZE=32 ומעלה.
+HTTP_SHARED_POOL  = os.getenv("HTTP_SHARED_POOL", "0") == "1"     # 0 = HTTPXRequest נפרד לכל בוט (כמו קודם)
+HTTP_POOL_SIZE    = int(os.getenv("HTTP_POOL_SIZE", "32"))         # חיבורים לקריאות API רגילות, לכל הבוטים
+# חיבורים לכל httpx client: httpcore סורק את כל החיבורים של ה־pool בכל בקשה,
+# אז HTTP_POOL_SIZE מחולק לכמה clients קטנים (בוט → client לפי hash)
+HTTP_CLIENT_CONNECTIONS = int(os.getenv("HTTP_CLIENT_CONNECTIONS", "8"))
+# קריאות API במקביל בתהליך (לא כולל long-poll). לא מעל HTTP_POOL_SIZE:
+# תור בתוך httpcore סורק את כל החיבורים בכל שחרור, תור ב־Semaphore לא
+HTTP_MAX_INFLIGHT = int(os.getenv("HTTP_MAX_INFLIGHT", str(HTTP_POOL_SIZE)))
+HTTP_KEEPALIVE    = float(os.getenv("HTTP_KEEPALIVE", "30"))
+# auto = HTTP/2 אם h2 מותקן (long-polls של כל הבוטים על חיבור אחד)
+HTTP_VERSION      = os.getenv("HTTP_VERSION", "auto")
+
+API, POLL = "api", "poll"
+
+REQUESTS = metrics.Counter("bot_api_requests_total", "Bot API requests per bot, method and outcome",
+                           ("bot", "method", "outcome"))
+REQUEST_SECONDS = metrics.Histogram("bot_api_request_seconds", "Bot API request latency (excluding long-polls)",
+                                    ("bot",))
+
+def _http2() -> bool:
+    if HTTP_VERSION == "auto":
+        return find_spec("h2") is not None
+    return HTTP_VERSION == "2"
+
+# ─────────────────────────────────────────────────────────────
+# Pool משותף: HTTP_POOL_SIZE חיבורים לקריאות API של כל הבוטים, ב־clients
+# של HTTP_CLIENT_CONNECTIONS (בוט קבוע ל־client אחד), SSL context אחד.
+# long-poll: ב־HTTP/2 client משותף אחד (streams על חיבור אחד); ב־HTTP/1.1
+# client קטן לכל בוט על אותו SSL context – כל getUpdates תופס חיבור בכל
+# מקרה, ו־pool אחד עם מאות חיבורים עולה O(n) בכל בקשה (בדיקת expiry ב־httpcore).
+# ה־client המשותף נסגר כשהבוט האחרון עושה shutdown
+# ─────────────────────────────────────────────────────────────
+class SharedPool:
+    def __init__(self):
+        self.http2 = _http2()
+        self._ssl = None
+        self._clients: dict[tuple[str, int], httpx.AsyncClient] = {}
+        self._per_client = max(1, min(HTTP_CLIENT_CONNECTIONS, HTTP_POOL_SIZE))
+        self._slots = -(-HTTP_POOL_SIZE // self._per_client)
+        self._users: set = set()
+        self._gate: asyncio.Semaphore | None = None
+        self.inflight = 0
+
+    def _new_client(self, size: int | None) -> httpx.AsyncClient:
+        if self._ssl is None:
+            # טעינת ה־CA bundle היא החלק היקר ביצירת client – פעם אחת לתהליך
+            self._ssl = httpx.create_ssl_context()
+        return httpx.AsyncClient(
+            verify=self._ssl, http1=True, http2=self.http2,
+            timeout=httpx.Timeout(5.0, pool=30.0),   # ההמתנה בפועל היא ב־gate, לא ב־pool
+            limits=httpx.Limits(max_connections=size, max_keepalive_connections=size,
+                                keepalive_expiry=HTTP_KEEPALIVE),
+        )
+
+    def client(self, kind: str, key: str = "") -> httpx.AsyncClient:
+        if kind == POLL and not self.http2:
+            return self._new_client(1)
+        slot = zlib.crc32(key.encode()) % self._slots if kind == API else 0
+        client = self._clients.get((kind, slot))
+        if client is None or client.is_closed:
+            client = self._clients[(kind, slot)] = self._new_client(self._per_client if kind == API else None)
+            logger.info(f"Shared Bot API {kind} client #{slot} (http2={self.http2})")
+        return client
+
+    def shared(self, client: httpx.AsyncClient) -> bool:
+        return any(client is c for c in self._clients.values())
+
+    def gate(self) -> asyncio.Semaphore:
+        if self._gate is None:
+            self._gate = asyncio.Semaphore(HTTP_MAX_INFLIGHT)
+        return self._gate
+
+    def attach(self, user):
+        self._users.add(user)
+
+    async def detach(self, user):
+        self._users.discard(user)
+        if self._users:
+            return
+        clients, self._clients = self._clients, {}
+        self._gate = None   # Semaphore קשור ללולאה; הלולאה הבאה מקבלת חדש
+        for client in clients.values():
+            await client.aclose()
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        # קריאות מחוץ ל־Application (בדיקות wake של בוטים רדומים) – אותו client ו־gate
+        async with self.gate():
+            self.inflight += 1
+            try:
+                return await self.client(API, url).request(method, url, **kwargs)
+            finally:
+                self.inflight -= 1
+
+    @contextlib.asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs):
+        # הורדות (קבצים של Telegram) על אותו client ו־gate של קריאות ה־API
+        async with self.gate():
+            self.inflight += 1
+            try:
+                async with self.client(API, url).stream(method, url, **kwargs) as response:
+                    yield response
+            finally:
+                self.inflight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "bots": len(self._users), "http2": self.http2, "inflight": self.inflight,
+            "clients": {f"{kind}#{slot}": not client.is_closed for (kind, slot), client in self._clients.items()},
+        }
+
+pool = SharedPool()
+
+metrics.Gauge("bot_api_requests_inflight", "Bot API requests in flight through the shared pool",
+              fn=lambda: pool.inflight)
+metrics.Gauge("bot_api_pool_bots", "Bot request objects attached to the shared pool",
+              fn=lambda: len(pool._users))
+
+# ─────────────────────────────────────────────────────────────
+# BaseRequest של PTB מעל ה־pool המשותף: אותו do_request של HTTPXRequest
+# (timeouts, מיפוי שגיאות), רק שה־client משותף, shutdown לא סוגר אותו,
+# וקריאות API עוברות Semaphore גלובלי + metrics לכל בוט
+# ─────────────────────────────────────────────────────────────
+class SharedHTTPXRequest(HTTPXRequest):
+    __slots__ = ("_kind", "_bot")
+
+    def __init__(self, token: str, kind: str = API):
+        self._kind = kind
+        self._bot = token.split(":", 1)[0]
+        super().__init__(http_version="2" if pool.http2 else "1.1")
+
+    def _build_client(self) -> httpx.AsyncClient:
+        return pool.client(self._kind, self._bot)
+
+    async def initialize(self):
+        pool.attach(self)
+        await super().initialize()
+
+    async def shutdown(self):
+        if not pool.shared(self._client) and not self._client.is_closed:
+            await self._client.aclose()
+        await pool.detach(self)
+
+    async def do_request(self, url: str, method: str, request_data=None,
+                         read_timeout=HTTPXRequest.DEFAULT_NONE, write_timeout=HTTPXRequest.DEFAULT_NONE,
+                         connect_timeout=HTTPXRequest.DEFAULT_NONE, pool_timeout=HTTPXRequest.DEFAULT_NONE):
+        if self._client.is_closed:
+            self._client = self._build_client()
+        api_method = url.rsplit("/", 1)[-1]
+        kwargs = dict(read_timeout=read_timeout, write_timeout=write_timeout,
+                      connect_timeout=connect_timeout, pool_timeout=pool_timeout)
+        if self._kind == POLL:
+            # long-poll מחזיק חיבור לאורך כל ה־timeout – לא נספר ב־gate ולא ב־latency
+            return await self._request(url, method, request_data, api_method, kwargs)
+        async with pool.gate():
+            pool.inflight += 1
+            started = time.perf_counter()
+            try:
+                return await self._request(url, method, request_data, api_method, kwargs)
+            finally:
+                pool.inflight -= 1
+                REQUEST_SECONDS.observe(time.perf_counter() - started, self._bot)
+
+    async def _request(self, url, method, request_data, api_method, kwargs):
+        try:
+            code, payload = await super().do_request(url, method, request_data, **kwargs)
+        except Exception as e:
+            REQUESTS.inc(self._bot, api_method, type(e).__name__)
+            raise
+        REQUESTS.inc(self._bot, api_method, str(code))
+        return code, payload
+
+def with_shared_pool(builder, token: str):
+    # request + get_updates_request של ה־builder על ה־pool המשותף
+    if not HTTP_SHARED_POOL:
+        return builder
+    return builder.request(SharedHTTPXRequest(token, API)).get_updates_request(SharedHTTPXRequest(token, POLL))
@@ -0,0 +1,69 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+
+import metrics
+
+# ─────────────────────────────────────────────────────────────
+# הגדרות מה־env
+# ─────────────────────────────────────────────────────────────
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "60"))     # שניות שתוצאה נשמרת אחרי שהסתיימה
+IDEMPOTENCY_MAX = int(os.getenv("IDEMPOTENCY_MAX", "10000"))
+
+COLLAPSED = metrics.Counter("idempotent_requests_collapsed_total",
+                            "Repeated requests served from an in-flight or recent result",
+                            ("bot", "action", "state"))
+INFLIGHT = "inflight"
+COMPLETED = "completed"
+
+class _Flight:
+    __slots__ = ("task", "expires")
+
+    def __init__(self, task: asyncio.Task, expires: float):
+        self.task = task
+        self.expires = expires
+
+# ─────────────────────────────────────────────────────────────
+# Single-flight לפי מפתח: לחיצות חוזרות (או מקבילות) על אותו כפתור
+# מחכות לאותה כתיבה ומקבלות את אותה תוצאה. כישלון לא נשמר –
+# הלחיצה הבאה מנסה שוב. TTL + תקרה, הישן ביותר נזרק ראשון
+# ─────────────────────────────────────────────────────────────
+class SingleFlight:
+    def __init__(self, bot: str, action: str, ttl: float = IDEMPOTENCY_TTL, max_entries: int = IDEMPOTENCY_MAX):
+        self.bot = bot
+        self.action = action
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._flights: OrderedDict[tuple, _Flight] = OrderedDict()
+
+    def _evict(self, now: float):
+        while self._flights:
+            key, flight = next(iter(self._flights.items()))
+            if len(self._flights) <= self.max_entries and (not flight.task.done() or flight.expires >= now):
+                break
+            del self._flights[key]
+
+    async def run(self, key: tuple, fn) -> tuple[object, bool]:
+        # מחזיר (תוצאה, האם זו הקריאה שביצעה בפועל)
+        now = time.monotonic()
+        flight = self._flights.get(key)
+        if flight is not None and (not flight.task.done() or flight.expires >= now):
+            COLLAPSED.inc(self.bot, self.action, COMPLETED if flight.task.done() else INFLIGHT)
+            return await asyncio.shield(flight.task), False
+
+        flight = self._flights[key] = _Flight(asyncio.create_task(fn()), float("inf"))
+        flight.task.add_done_callback(lambda task: self._landed(key, flight))
+        self._evict(now)
+        # shield: ביטול של הלחיצה הראשונה לא מבטל את הכתיבה שהאחרות מחכות לה
+        return await asyncio.shield(flight.task), True
+
+    def _landed(self, key: tuple, flight: _Flight):
+        if flight.task.cancelled() or flight.task.exception() is not None:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        else:
+            flight.expires = time.monotonic() + self.ttl
+
+    def __len__(self) -> int:
+        return len(self._flights)
@@ -0,0 +1,69 @@
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+
+from config import settings
+from models import User
+
+# ─────────────────────────────────────────────────────────────
+# רשומת זהות קומפקטית – רק מה שה־handlers צריכים
+# ─────────────────────────────────────────────────────────────
+class CachedUser:
+    __slots__ = ("id", "telegram_id", "is_admin", "expires")
+
+    def __init__(self, id: int, telegram_id: int, is_admin: bool, expires: float):
+        self.id = id
+        self.telegram_id = telegram_id
+        self.is_admin = is_admin
+        self.expires = expires
+
+# ─────────────────────────────────────────────────────────────
+# LRU + TTL לפי telegram_id
+# ─────────────────────────────────────────────────────────────
+class IdentityCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[int, CachedUser] = OrderedDict()
+
+    def get(self, telegram_id: int) -> CachedUser | None:
+        entry = self._entries.get(telegram_id)
+        if entry is None or entry.expires < time.monotonic():
+            if entry is not None:
+                del self._entries[telegram_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(telegram_id)
+        self.hits += 1
+        return entry
+
+    def put(self, id: int, telegram_id: int, is_admin: bool) -> CachedUser:
+        entry = CachedUser(id, telegram_id, bool(is_admin), time.monotonic() + self.ttl)
+        self._entries[telegram_id] = entry
+        self._entries.move_to_end(telegram_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, telegram_id: int):
+        self._entries.pop(telegram_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+user_cache = IdentityCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL)
+
+# ─────────────────────────────────────────────────────────────
+# שינוי phone / is_admin דרך ה־ORM → פינוי מה־cache
+# ─────────────────────────────────────────────────────────────
+@event.listens_for(User.phone, "set")
+@event.listens_for(User.is_admin, "set")
+def _invalidate_on_change(target, value, oldvalue, initiator):
+    if target.telegram_id is not None:
+        user_cache.invalidate(target.telegram_id)
@@ -0,0 +1,176 @@
+import os
+import json
+import uuid
+import asyncio
+import hashlib
+import logging
+
+import httpx
+
+from storage import storage
+import http_pool
+
+logger = logging.getLogger("image_store")
+
+IMAGES_ROOT = os.getenv("IMAGES_ROOT", "images")
+INDEX_NAME  = "index.jsonl"
+CHUNK_SIZE  = 64 * 1024
+DOWNLOAD_TIMEOUT = 60.0
+
+# ─────────────────────────────────────────────────────────────
+# תמונה שמורה: נתיב לפי sha256 + file_id לכל בוט (file_id תלוי בוט)
+# ─────────────────────────────────────────────────────────────
+class StoredImage:
+    __slots__ = ("sha256", "path", "file_ids")
+
+    def __init__(self, sha256: str, path: str):
+        self.sha256 = sha256
+        self.path = path
+        self.file_ids: dict[int, str] = {}
+
+# ─────────────────────────────────────────────────────────────
+# Content-addressed store: file_unique_id מוכר → בלי הורדה;
+# תוכן זהה תחת unique id אחר → קובץ אחד על הדיסק
+# ─────────────────────────────────────────────────────────────
+class ImageStore:
+    def __init__(self, root: str = IMAGES_ROOT):
+        self.root = root
+        self.client: httpx.AsyncClient | None = None   # None = ה־pool המשותף של http_pool
+        self.downloads = 0
+        self.skipped = 0
+        self._by_unique: dict[str, StoredImage] = {}
+        self._by_hash: dict[str, StoredImage] = {}
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.root, INDEX_NAME)
+
+    async def _ensure_loaded(self):
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if not self._loaded:
+                await storage.run("images_load", self._load)
+                self._loaded = True
+
+    def _load(self):
+        if not os.path.isfile(self.index_path):
+            return
+        with open(self.index_path, encoding="utf-8") as fp:
+            for line in fp:
+                rec = json.loads(line)
+                self._remember(rec["u"], rec["h"], rec["p"], rec["b"], rec["f"])
+
+    def _remember(self, unique_id: str, sha256: str, path: str, bot_id: int, file_id: str) -> StoredImage:
+        entry = self._by_hash.get(sha256)
+        if entry is None:
+            entry = self._by_hash[sha256] = StoredImage(sha256, path)
+        entry.file_ids[bot_id] = file_id
+        self._by_unique[unique_id] = entry
+        return entry
+
+    async def fetch(self, bot, file_id: str, file_unique_id: str) -> str:
+        await self._ensure_loaded()
+        entry = self._by_unique.get(file_unique_id)
+        if entry is not None and await storage.isfile(entry.path):
+            self.skipped += 1
+            if bot.id not in entry.file_ids:
+                await self._append(file_unique_id, entry, bot.id, file_id)
+            return entry.path
+
+        # העלאות מקבילות של אותה תמונה → הורדה אחת
+        pending = self._inflight.get(file_unique_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[file_unique_id] = future
+        try:
+            path = await self._download(bot, file_id, file_unique_id)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            future.exception()   # המחכים מקבלים אותה; לא להשאיר "never retrieved"
+            raise
+        else:
+            future.set_result(path)
+            return path
+        finally:
+            del self._inflight[file_unique_id]
+
+    async def _download(self, bot, file_id: str, file_unique_id: str) -> str:
+        tg_file = await bot.get_file(file_id)
+        if not tg_file.file_path:
+            # Telegram לא מחזיר נתיב לקבצים מעל מגבלת ההורדה של ה־Bot API
+            raise ValueError(f"Telegram returned no file_path for {file_unique_id} (file too large to download?)")
+        ext = os.path.splitext(tg_file.file_path)[1] or ".jpg"
+        tmp_dir = os.path.join(self.root, "tmp")
+        await storage.makedirs(tmp_dir)
+        tmp_path = os.path.join(tmp_dir, uuid.uuid4().hex)
+
+        try:
+            if os.path.isabs(tg_file.file_path):
+                # local Bot API server: הקובץ כבר על הדיסק
+                sha256 = await storage.run("image_copy", _copy_hashed, tg_file.file_path, tmp_path)
+            else:
+                sha256 = await self._stream(tg_file.file_path, tmp_path)
+            self.downloads += 1
+
+            existing = self._by_hash.get(sha256)
+            if existing is not None and await storage.isfile(existing.path):
+                path = existing.path
+            else:
+                path = os.path.join(self.root, sha256[:2], sha256 + ext)
+                await storage.run("image_commit", _move_into_place, tmp_path, path)
+        finally:
+            # הורדה שנכשלה / בוטלה, או תוכן שכבר שמור: לא להשאיר קבצים ב־tmp/
+            await storage.run("remove", _discard, tmp_path)
+        entry = self._remember(file_unique_id, sha256, path, bot.id, file_id)
+        await self._append(file_unique_id, entry, bot.id, file_id)
+        return path
+
+    async def _stream(self, url: str, tmp_path: str) -> str:
+        if self.client is None and not http_pool.HTTP_SHARED_POOL:
+            self.client = httpx.AsyncClient(timeout=DOWNLOAD_TIMEOUT)
+        stream = self.client.stream if self.client is not None else http_pool.pool.stream
+        digest = hashlib.sha256()
+        fp = await storage.run("open", open, tmp_path, "wb")
+        try:
+            async with stream("GET", url, timeout=DOWNLOAD_TIMEOUT) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    digest.update(chunk)
+                    await storage.run("image_chunk", fp.write, chunk)
+        finally:
+            await storage.run("close", fp.close)
+        return digest.hexdigest()
+
+    async def _append(self, unique_id: str, entry: StoredImage, bot_id: int, file_id: str):
+        entry.file_ids[bot_id] = file_id
+        line = json.dumps({"u": unique_id, "h": entry.sha256, "p": entry.path, "b": bot_id, "f": file_id})
+        await storage.makedirs(self.root)
+        await storage.append_text(self.index_path, line + "\n")
+
+def _copy_hashed(src: str, dst: str) -> str:
+    digest = hashlib.sha256()
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        while chunk := fin.read(CHUNK_SIZE):
+            digest.update(chunk)
+            fout.write(chunk)
+    return digest.hexdigest()
+
+def _discard(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _move_into_place(tmp_path: str, path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(tmp_path, path)
+
+image_store = ImageStore()
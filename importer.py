@@ -0,0 +1,307 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+from datetime import datetime
+
+from database import AsyncSessionLocal, init_db, upsert
+from models import User, Shop, Card, Purchase
+from storage import storage
+from catalog import catalog
+from purchase_index import SHOPS_ROOT
+import leaderboard
+import queries
+import logging_config
+
+logger = logging.getLogger("importer")
+
+# ─────────────────────────────────────────────────────────────
+# הגדרות מה־env
+# ─────────────────────────────────────────────────────────────
+IMPORT_BATCH = int(os.getenv("IMPORT_BATCH", "5000"))   # שורות לכל executemany / טרנזקציה
+IMPORT_SCANS = int(os.getenv("IMPORT_SCANS", "8"))      # תיקיות שנסרקות במקביל (ב־pool של storage)
+IMPORT_STATE = os.getenv("IMPORT_STATE", "import_state.json")
+REG_ROOT     = "registrations"
+SHOP_OWNER_ID = int(os.getenv("TELEGRAM_ADMIN_ID", "0"))   # בעל החנויות בעץ shops/ (ה־admin של shop_bot)
+
+# ─────────────────────────────────────────────────────────────
+# סריקת העצים (חוסם, רץ ב־thread pool). יחידת עבודה = תיקייה אחת:
+#   reg/<uid>   – registrations/<uid>/<token>/meta.json → User + Shop + Card
+#   shop/<name> – shops/<name>/cards + purchases/<card>/<uid>.token
+# ─────────────────────────────────────────────────────────────
+def _mtime(path: str) -> datetime:
+    return datetime.utcfromtimestamp(os.path.getmtime(path))
+
+def _scan_registration(root: str, uid: str) -> dict:
+    unit = {"users": {}, "shops": {}, "cards": {}, "purchases": []}
+    folder = os.path.join(root, uid)
+    for token in sorted(os.listdir(folder)):
+        path = os.path.join(folder, token, "meta.json")
+        try:
+            with open(path, encoding="utf-8") as fp:
+                meta = json.load(fp)
+            created = datetime.fromisoformat(meta["timestamp"]) if meta.get("timestamp") else _mtime(path)
+            card = {"title": str(meta["title"]), "price": float(meta["price"]),
+                    "image_path": meta.get("image") or "", "created_at": created}
+        except FileNotFoundError:
+            continue
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            # הרשמה שבורה לא עוצרת את השאר; התיקייה מסומנת כגמורה בלי הקלף הזה
+            logger.warning(f"Skipping {path}: {type(e).__name__}: {e}")
+            continue
+        user = unit["users"].setdefault(int(uid), {"telegram_id": int(uid), "phone": None, "created_at": created})
+        user["phone"] = meta.get("contact") or user["phone"]
+        # שם החנות לפי ה־id הציבורי של הבוט (החלק שלפני ':'), לא הטוקן עצמו
+        shop = f"bot{token.split(':', 1)[0]}"
+        unit["shops"][shop] = {"name": shop, "owner": int(uid), "created_at": created}
+        unit["cards"][(shop, card["title"])] = card
+    return unit
+
+def _scan_shop(root: str, shop: str) -> dict:
+    unit = {"users": {}, "shops": {}, "cards": {}, "purchases": []}
+    folder = os.path.join(root, shop)
+    unit["users"][SHOP_OWNER_ID] = {"telegram_id": SHOP_OWNER_ID, "phone": None, "created_at": _mtime(folder)}
+    unit["shops"][shop] = {"name": shop, "owner": SHOP_OWNER_ID, "created_at": _mtime(folder)}
+
+    cards_root = os.path.join(folder, "cards")
+    names = os.listdir(cards_root) if os.path.isdir(cards_root) else []
+    for name in names:
+        if name.endswith(".json"):
+            continue
+        # כמו shop_catalog: מזהה הקלף = שם הקובץ בלי סיומת; מחיר/כותרת מ־<card>.json אם יש
+        card = name.split(".")[0]
+        side = {}
+        sidecar = os.path.join(cards_root, f"{card}.json")
+        if f"{card}.json" in names:
+            try:
+                with open(sidecar, encoding="utf-8") as fp:
+                    side = json.load(fp)
+            except (OSError, ValueError):
+                pass
+        path = os.path.join(cards_root, name)
+        unit["cards"][(shop, card)] = {
+            "title": side.get("title") or card, "price": float(side.get("price") or 0),
+            "image_path": path, "created_at": _mtime(path),
+        }
+
+    sales_root = os.path.join(folder, "purchases")
+    for card in os.listdir(sales_root) if os.path.isdir(sales_root) else []:
+        unit["cards"].setdefault((shop, card), {
+            "title": card, "price": 0.0, "image_path": "", "created_at": _mtime(os.path.join(sales_root, card)),
+        })
+        for name in os.listdir(os.path.join(sales_root, card)):
+            if not name.endswith(".token") or not name[:-len(".token")].isdigit():
+                continue
+            path = os.path.join(sales_root, card, name)
+            try:
+                with open(path, encoding="utf-8") as fp:
+                    token = fp.read().strip()
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping {path}: {type(e).__name__}: {e}")
+                continue
+            uid = int(name[:-len(".token")])
+            unit["users"].setdefault(uid, {"telegram_id": uid, "phone": None, "created_at": _mtime(path)})
+            unit["purchases"].append({"token": token, "buyer": uid, "card": (shop, card), "created_at": _mtime(path)})
+    return unit
+
+def _units(reg_root: str, shops_root: str) -> list[tuple[str, str, str]]:
+    units = []
+    if os.path.isdir(reg_root):
+        units += [("reg", reg_root, uid) for uid in sorted(os.listdir(reg_root))
+                  if uid.isdigit() and os.path.isdir(os.path.join(reg_root, uid))]
+    if os.path.isdir(shops_root):
+        units += [("shop", shops_root, shop) for shop in sorted(os.listdir(shops_root))
+                  if os.path.isdir(os.path.join(shops_root, shop))]
+    return units
+
+def _scan(kind: str, root: str, name: str) -> dict:
+    return _scan_registration(root, name) if kind == "reg" else _scan_shop(root, name)
+
+def _rows(unit: dict) -> int:
+    return len(unit["users"]) + len(unit["shops"]) + len(unit["cards"]) + len(unit["purchases"])
+
+def _write_state(path: str, done: list[str]):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fp:
+        json.dump({"done": done}, fp)
+    os.replace(tmp, path)
+
+def _chunks(rows: list, size: int = IMPORT_BATCH):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+# ─────────────────────────────────────────────────────────────
+# כתיבה: INSERT … ON CONFLICT DO NOTHING על המפתחות הטבעיים
+# (telegram_id, שם חנות, token של רכישה; קלף = (shop_id, title)),
+# כך שהרצה חוזרת לא משכפלת. אצווה = טרנזקציה אחת, ורק אחרי
+# ה־commit היחידות שבה נרשמות ב־IMPORT_STATE
+# ─────────────────────────────────────────────────────────────
+class Importer:
+    def __init__(self, reg_root: str = REG_ROOT, shops_root: str = SHOPS_ROOT, state_path: str = IMPORT_STATE):
+        self.reg_root = reg_root
+        self.shops_root = shops_root
+        self.state_path = state_path
+        self.done: set[str] = set()
+        self.counts = dict.fromkeys(("users", "shops", "cards", "purchases"), 0)
+        self.skipped = 0
+        self.failed: list[str] = []
+
+    async def _load_state(self):
+        try:
+            self.done = set(json.loads(await storage.read_text(self.state_path))["done"])
+        except (OSError, ValueError, KeyError):
+            self.done = set()
+
+    async def _ids(self, session, query, values) -> dict:
+        found = {}
+        for chunk in _chunks(list(values)):
+            found.update((await session.execute(query(chunk))).all())
+        return found
+
+    async def _insert(self, session, model, rows: list[dict], key):
+        if not rows:
+            return
+        stmt = upsert(model).on_conflict_do_nothing(index_elements=[key])
+        for chunk in _chunks(rows):
+            await session.execute(stmt, chunk)
+
+    async def _flush(self, units: list[tuple[str, dict]]):
+        users, shops, cards, purchases = {}, {}, {}, []
+        for _, unit in units:
+            for telegram_id, row in unit["users"].items():
+                if users.get(telegram_id, {}).get("phone") is None:
+                    users[telegram_id] = row
+            shops.update(unit["shops"])
+            cards.update(unit["cards"])
+            purchases += unit["purchases"]
+
+        async with AsyncSessionLocal() as session:
+            await self._insert(session, User, list(users.values()), User.telegram_id)
+            user_ids = await self._ids(session, queries.user_ids_by_telegram, users)
+
+            await self._insert(session, Shop, [
+                {"name": s["name"], "owner_id": user_ids[s["owner"]], "created_at": s["created_at"]}
+                for s in shops.values()
+            ], Shop.name)
+            shop_ids = await self._ids(session, queries.shop_ids_by_name, shops)
+
+            # לקלפים אין unique ב־DB: מה שכבר קיים (shop_id, title) לא נכנס שוב
+            existing = {}
+            for chunk in _chunks(list(set(shop_ids.values()))):
+                rows = await session.execute(queries.cards_in_shops(chunk))
+                existing.update(((shop_id, title), (card_id, price)) for shop_id, title, card_id, price in rows)
+            # גם בתוך האצווה: שני קבצים עם אותה כותרת (sidecar) באותה חנות = קלף אחד
+            new_cards = {}
+            for (shop, _), card in cards.items():
+                key = (shop_ids[shop], card["title"])
+                if key not in existing:
+                    new_cards.setdefault(key, {"shop_id": key[0], **card})
+            new_cards = list(new_cards.values())
+            for chunk in _chunks(new_cards):
+                await session.execute(Card.__table__.insert(), chunk)
+            if new_cards:
+                for chunk in _chunks(list({c["shop_id"] for c in new_cards})):
+                    rows = await session.execute(queries.cards_in_shops(chunk))
+                    existing.update(((shop_id, title), (card_id, price)) for shop_id, title, card_id, price in rows)
+
+            purchase_rows = []
+            for p in purchases:
+                shop, _ = p["card"]
+                card_id, price = existing[(shop_ids[shop], cards[p["card"]]["title"])]
+                purchase_rows.append({"user_id": user_ids[p["buyer"]], "card_id": card_id, "token": p["token"],
+                                      "amount": price, "created_at": p["created_at"]})
+            await self._insert(session, Purchase, purchase_rows, Purchase.token)
+            await session.commit()
+
+        self.counts["users"] += len(users)
+        self.counts["shops"] += len(shops)
+        self.counts["cards"] += len(cards)
+        self.counts["purchases"] += len(purchases)
+        self.done.update(key for key, _ in units)
+        await storage.run("import_state", _write_state, self.state_path, sorted(self.done))
+
+    async def run(self) -> dict:
+        await init_db()
+        await self._load_state()
+        started = time.perf_counter()
+        units = await storage.run("import_walk", _units, self.reg_root, self.shops_root)
+        todo = [u for u in units if f"{u[0]}/{u[2]}" not in self.done]
+        self.skipped = len(units) - len(todo)
+        logger.info(f"Importing {len(todo)} directories ({self.skipped} already done)")
+
+        # סריקה מקבילה ב־pool, כתיבה סדרתית באצוות – התור חוסם כשה־DB מאחור
+        queue: asyncio.Queue = asyncio.Queue(maxsize=IMPORT_SCANS * 2)
+        gate = asyncio.Semaphore(IMPORT_SCANS)
+
+        async def scan(kind, root, name):
+            async with gate:
+                try:
+                    unit = await storage.run("import_scan", _scan, kind, root, name)
+                except Exception:
+                    # תיקייה שלא נסרקה לא נרשמת ב־IMPORT_STATE – הרצה הבאה מנסה שוב
+                    logger.exception(f"Skipping {kind}/{name}: scan failed")
+                    self.failed.append(f"{kind}/{name}")
+                    return
+            await queue.put((f"{kind}/{name}", unit))
+
+        async def produce():
+            # ה־sentinel נכנס גם כשהסריקה נופלת – אחרת הצרכן מחכה לנצח;
+            # השגיאה עצמה עולה ב־await producer
+            try:
+                await asyncio.gather(*(scan(*u) for u in todo))
+            finally:
+                await queue.put(None)
+
+        producer = asyncio.create_task(produce())
+        batch, rows = [], 0
+        try:
+            while (item := await queue.get()) is not None:
+                batch.append(item)
+                rows += _rows(item[1])
+                if rows >= IMPORT_BATCH:
+                    await self._flush(batch)
+                    logger.info(f"Imported {len(self.done)}/{len(units)} directories, "
+                                f"{self._throughput(started):.0f} rows/s")
+                    batch, rows = [], 0
+            if batch:
+                await self._flush(batch)
+            await producer
+        finally:
+            producer.cancel()
+
+        # ה־INSERTs עוקפים את ה־ORM: המצטבר ו־cache הקטלוג לא התעדכנו בדרך.
+        # catalog.clear() מנקה רק את התהליך הזה – bot.py שרץ צריך restart
+        async with AsyncSessionLocal() as session:
+            await leaderboard.rebuild(session)
+            await session.commit()
+        catalog.clear()
+
+        seconds = time.perf_counter() - started
+        return {**self.counts, "skipped_dirs": self.skipped, "failed_dirs": self.failed, "seconds": seconds,
+                "rows_per_s": self._throughput(started)}
+
+    def _throughput(self, started: float) -> float:
+        return sum(self.counts.values()) / max(time.perf_counter() - started, 1e-6)
+
+async def main():
+    report = await Importer().run()
+    print(f"✅ imported in {report['seconds']:.1f}s ({report['rows_per_s']:.0f} rows/s): "
+          f"{report['users']} users, {report['shops']} shops, {report['cards']} cards, "
+          f"{report['purchases']} purchases; {report['skipped_dirs']} directories already done")
+    print("ℹ️ a running bot.py keeps its catalog cache: restart it to list the imported shops and cards")
+    if report["failed_dirs"]:
+        print(f"⚠️ {len(report['failed_dirs'])} directories failed and will be retried on the next run "
+              f"(see log)")
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["run"]:
+        sys.exit("usage: python importer.py run")
+    if not SHOP_OWNER_ID:
+        # אחרת כל עץ shops/ נרשם על User(telegram_id=0) שלא קיים
+        sys.exit("usage: TELEGRAM_ADMIN_ID=<owner telegram id> python importer.py run "
+                 "(the owner of the shops/ tree, as in shop_bot)")
+    # שמות התיקיות הם טוקנים של בוטים – הלוג עובר דרך ה־redaction
+    logging_config.setup()
+    asyncio.run(main())
@@ -0,0 +1,61 @@
+import sys
+import asyncio
+from datetime import datetime
+
+from sqlalchemy import delete, func, insert
+from sqlalchemy.future import select
+
+from database import AsyncSessionLocal, init_db, upsert
+from models import UserSpend
+import queries
+
+# ─────────────────────────────────────────────────────────────
+# עדכון המצטבר באותה טרנזקציה של ה־Purchase (ה־commit אצל הקורא)
+# ─────────────────────────────────────────────────────────────
+async def record_purchase(session, user_id: int, amount: float, count: int = 1):
+    stmt = upsert(UserSpend).values(
+        user_id=user_id,
+        total_spent=amount,
+        purchases=count,
+        updated_at=datetime.utcnow(),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserSpend.user_id],
+        set_={
+            "total_spent": UserSpend.total_spent + stmt.excluded.total_spent,
+            "purchases":   UserSpend.purchases + stmt.excluded.purchases,
+            "updated_at":  stmt.excluded.updated_at,
+        },
+    )
+    await session.execute(stmt)
+
+# ─────────────────────────────────────────────────────────────
+# Top-K – סריקת אינדקס על total_spent, לא תלוי בהיסטוריית הרכישות
+# ─────────────────────────────────────────────────────────────
+async def top_spenders(session, limit: int):
+    rows = await session.execute(queries.top_spenders(limit))
+    return rows.all()
+
+# ─────────────────────────────────────────────────────────────
+# בנייה מחדש מתוך purchases (חד־פעמי, לנתונים קיימים)
+# ─────────────────────────────────────────────────────────────
+async def rebuild(session):
+    await session.execute(delete(UserSpend))
+    await session.execute(
+        insert(UserSpend).from_select(
+            ["user_id", "total_spent", "purchases", "updated_at"], queries.spend_totals()
+        )
+    )
+
+async def main():
+    await init_db()
+    async with AsyncSessionLocal() as session:
+        await rebuild(session)
+        await session.commit()
+        count = await session.scalar(select(func.count()).select_from(UserSpend))
+    print(f"✅ leaderboard rebuilt: {count} users")
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python leaderboard.py rebuild")
+    asyncio.run(main())
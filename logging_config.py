@@ -1,33 +1,136 @@
 import os
+import re
+import queue
+import atexit
 import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
 
 # קבלו את הטוקן מה־env
 TOKEN = os.getenv("TELEGRAM_TOKEN", "")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 
-# 1. הפכו את ה־root logger לפורמט עם שם המודול
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO,
-    handlers=[logging.StreamHandler()],
-)
+REDACTED = "<REDACTED>"
+# כל מה שנראה כמו טוקן בוט, גם אם עוד לא נרשם (למשל טוקן שמשתמש הקליד בהרשמה)
+TOKEN_SHAPE = r"\d{5,}:[A-Za-z0-9_-]{30,}"
 
-# 2. השביתו לוגינג HTTP של ה־telegram-wrapper
-for lg in ("telegram._request", "telegram.ext.updater", "telegram.bot"):
-    logging.getLogger(lg).setLevel(logging.WARNING)
+# ─────────────────────────────────────────────────────────────
+# 1. רשימת הסודות: regex אחד מקומפל, נבנה מחדש רק כשנרשם סוד חדש.
+#    הסודות נדחסים ל־trie (alternation שטוח של אלפי טוקנים איטי מאוד);
+#    טוקנים בצורה הרגילה כבר מכוסים ע"י TOKEN_SHAPE
+# ─────────────────────────────────────────────────────────────
+def _trie_pattern(words) -> str:
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
 
-# 3. הוסיפו Filter שמחליף כל מקום שבו מופיע הטוקן במחרוזת "<REDACTED>"
+    def build(node: dict) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        if "" in node:
+            return "(?:" + "|".join(branches) + ")?"
+        return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+
+    return build(trie)
+
+class SecretRegistry:
+    def __init__(self):
+        self._secrets: set[str] = set()
+        self._lock = threading.Lock()
+        self._pattern = re.compile(TOKEN_SHAPE)
+        self._dirty = False
+
+    def register(self, secret: str):
+        if not secret or secret in self._secrets:
+            return
+        with self._lock:
+            self._secrets.add(secret)
+            self._dirty = True   # הקומפילציה בפעם הבאה שה־listener צריך אותה
+
+    def _compile(self):
+        with self._lock:
+            extra = [s for s in self._secrets if not re.fullmatch(TOKEN_SHAPE, s)]
+            self._pattern = re.compile(TOKEN_SHAPE + ("|" + _trie_pattern(extra) if extra else ""))
+            self._dirty = False
+
+    def redact(self, text: str) -> str:
+        if self._dirty:
+            self._compile()
+        return self._pattern.sub(REDACTED, text)
+
+    def __len__(self):
+        return len(self._secrets)
+
+secrets = SecretRegistry()
+
+def register_secret(secret: str):
+    secrets.register(secret)
+
+# ─────────────────────────────────────────────────────────────
+# 2. Filter על ה־handler של ה־listener: רץ רק על רשומות שנכתבות בפועל,
+#    ב־thread של ה־listener ולא בלולאה
+# ─────────────────────────────────────────────────────────────
 class RedactTokenFilter(logging.Filter):
-    def __init__(self, secret: str):
+    def __init__(self, registry: SecretRegistry = secrets):
         super().__init__()
-        self.secret = secret
+        self.registry = registry
 
     def filter(self, record: logging.LogRecord) -> bool:
-        if self.secret and hasattr(record, "msg"):
-            record.msg = record.getMessage().replace(self.secret, "<REDACTED>")
+        record.msg = self.registry.redact(record.getMessage())
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        if record.exc_text:
+            record.exc_text = self.registry.redact(record.exc_text)
+        if record.stack_info:
+            record.stack_info = self.registry.redact(record.stack_info)
         return True
 
-# הוסיפו את הפילטר ל־root logger
-root_logger = logging.getLogger()
-root_logger.addFilter(RedactTokenFilter(TOKEN))
+# ─────────────────────────────────────────────────────────────
+# 3. QueueHandler בלי format בצד הקורא: הרשומה נכנסת לתור כמו שהיא.
+#    ארגומנטים שעלולים להשתנות עד שה־listener מגיע – מעובדים מיד
+# ─────────────────────────────────────────────────────────────
+_IMMUTABLE = (str, int, float, bool, bytes, type(None))
+
+class LazyQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args
+        if args:
+            values = args.values() if isinstance(args, dict) else args
+            if not all(isinstance(value, _IMMUTABLE) for value in values):
+                record.msg, record.args = record.getMessage(), None
+        return record
+
+# ─────────────────────────────────────────────────────────────
+# 4. setup(): root → LazyQueueHandler → QueueListener → StreamHandler
+# ─────────────────────────────────────────────────────────────
+_listener: QueueListener | None = None
+
+def setup(level: str = LOG_LEVEL) -> QueueListener:
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    target = logging.StreamHandler()
+    target.setFormatter(logging.Formatter(LOG_FORMAT))
+    target.addFilter(RedactTokenFilter())
+
+    log_queue = queue.SimpleQueue()
+    root_logger = logging.getLogger()
+    root_logger.handlers[:] = [LazyQueueHandler(log_queue)]
+    root_logger.setLevel(level)
+
+    # השביתו לוגינג HTTP של ה־telegram-wrapper
+    for lg in ("telegram._request", "telegram.ext.updater", "telegram.bot", "httpx"):
+        logging.getLogger(lg).setLevel(logging.WARNING)
 
-# -- עכשיו אפשר להמשיך בטעינת שאר הקוד שלכם --
+    register_secret(TOKEN)
+    _listener = QueueListener(log_queue, target, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
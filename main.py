@@ -1,5 +1,4 @@
 import os
-import json
 import logging
 import asyncio
 from datetime import datetime
@@ -21,18 +20,24 @@ from telegram.ext import (
 )
 
 import bot_manager   # וודאו שיש bot_manager.py באותה תיקיה
+from storage import storage
+from image_store import image_store
+import conversation_store
+import outbound
+import http_pool
+import logging_config
+from logging_config import register_secret
+from conversation_store import ConversationStore
 
 # ─────────────────────────────────────────────────────────────
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO,
-)
+logging_config.setup()
 logger = logging.getLogger(__name__)
 
 # ─────────────────────────────────────────────────────────────
 load_dotenv()
 TOKEN    = os.getenv("TELEGRAM_TOKEN")
 ADMIN_ID = int(os.getenv("TELEGRAM_ADMIN_ID", "0"))
+register_secret(TOKEN)
 REG_ROOT = "registrations"
 
 if not TOKEN or not ADMIN_ID:
@@ -40,10 +45,7 @@ if not TOKEN or not ADMIN_ID:
     exit(1)
 
 CONTACT, BOT_TOKEN, IMG1, TITLE1, PRICE1 = range(5)
-sessions: dict[int, dict] = {}
-
-def ensure_dirs(path: str):
-    os.makedirs(path, exist_ok=True)
+sessions = ConversationStore("registration", backend=conversation_store.backend())
 
 def user_dir(uid: int, bot_token: str) -> str:
     return os.path.join(REG_ROOT, str(uid), bot_token)
@@ -63,29 +65,39 @@ async def contact(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         if update.message.contact
         else update.message.text
     )
-    sessions[uid] = {"contact": contact}
+    await sessions.set(uid, {"contact": contact})
     await update.message.reply_text(
         "הדבק כאן את טוקן ה-Shop Bot שקיבלת:",
         reply_markup=ReplyKeyboardRemove()
     )
     return BOT_TOKEN
 
+async def session_expired(update: Update):
+    # הסשן פג (TTL) או נזרק (תקרה) – אין טעם להמשיך לשאול שאלות
+    await update.message.reply_text("⌛ פג תוקף ההרשמה, שלחו /start כדי להתחיל מחדש.")
+    return ConversationHandler.END
+
 async def bot_token(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
     token = update.message.text.strip()
-    sessions[uid]["bot_token"] = token
+    register_secret(token)
+    if await sessions.update(uid, bot_token=token) is None:
+        return await session_expired(update)
     await update.message.reply_text("העלה תמונה אחת של החנות שלך:")
     return IMG1
 
 async def img1(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
-    sessions[uid]["file_id"] = update.message.photo[-1].file_id
+    photo = update.message.photo[-1]
+    if await sessions.update(uid, file_id=photo.file_id, file_unique_id=photo.file_unique_id) is None:
+        return await session_expired(update)
     await update.message.reply_text("הכנס כותרת לתמונה:")
     return TITLE1
 
 async def title1(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
-    sessions[uid]["title"] = update.message.text.strip()
+    if await sessions.update(uid, title=update.message.text.strip()) is None:
+        return await session_expired(update)
     await update.message.reply_text("הכנס מחיר (₪) לתמונה:")
     return PRICE1
 
@@ -97,24 +109,24 @@ async def price1(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     except ValueError:
         return await update.message.reply_text("❗ מחיר לא חוקי, נסה שוב:")
 
-    data = sessions.pop(uid)
+    data = await sessions.pop(uid)
+    if data is None:
+        return await session_expired(update)
     bot_token_value = data["bot_token"]
     folder = user_dir(uid, bot_token_value)
-    ensure_dirs(os.path.join(folder, "images"))
+    await storage.makedirs(folder)
 
-    file = await ctx.bot.get_file(data["file_id"])
-    img_path = os.path.join(folder, "images", "1.jpg")
-    await file.download_to_drive(img_path)
+    img_path = await image_store.fetch(ctx.bot, data["file_id"], data["file_unique_id"])
 
     meta = {
         "contact":  data["contact"],
         "title":    data["title"],
         "price":    price,
+        "image":    img_path,
+        "file_id":  data["file_id"],
         "timestamp": datetime.now().isoformat()
     }
-    os.makedirs(folder, exist_ok=True)
-    with open(os.path.join(folder, "meta.json"), "w", encoding="utf-8") as fp:
-        json.dump(meta, fp, ensure_ascii=False, indent=2)
+    await storage.dump_json(os.path.join(folder, "meta.json"), meta)
 
     await ctx.bot.send_message(
         chat_id=ADMIN_ID,
@@ -124,17 +136,31 @@ async def price1(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
             f"• טוקן בוט: `{bot_token_value}`\n"
             f"• פרטי קשר: {data['contact']}"
         ),
-        parse_mode="Markdown"
+        parse_mode="Markdown",
+        rate_limit_args=outbound.lane_args(ctx.bot, outbound.NOTIFY),
     )
 
-    asyncio.create_task(bot_manager.launch_bot(bot_token_value))
+    asyncio.create_task(bot_manager.add_bot(bot_token_value))
 
     await update.message.reply_text("🎉 הרשמת בהצלחה! בוט החנות שלך עולה כעת.")
     return ConversationHandler.END
 
 def main():
-    app = ApplicationBuilder().token(TOKEN).build()
+    builder = ApplicationBuilder().token(TOKEN).rate_limiter(outbound.scheduler.limiter_for(TOKEN))
+    # אותו pool HTTP כמו בוטי החנויות שרצים בתהליך הזה
+    builder = http_pool.with_shared_pool(builder, TOKEN)
+    if bot_manager.SHOP_BOT_SHARDS:
+        # בוטי החנויות (קיימים + חדשים) ב־workers נפרדים
+        builder = builder.post_init(lambda app: bot_manager.start_shards())
+        builder = builder.post_shutdown(lambda app: bot_manager.stop_shards())
+    persistence = conversation_store.conversation_persistence()
+    if persistence is not None:
+        builder = builder.persistence(persistence)
+    app = builder.build()
+    register_handlers(app)
+    app.run_polling()
 
+def register_handlers(app):
     conv = ConversationHandler(
         entry_points=[CommandHandler("start", start)],
         states={
@@ -145,10 +171,11 @@ def main():
             PRICE1:    [MessageHandler(filters.TEXT & ~filters.COMMAND, price1)],
         },
         fallbacks=[CommandHandler("cancel", lambda u, c: c.bot.send_message(u.effective_chat.id, "מבוטל."))],
+        name="registration",
+        persistent=app.persistence is not None,
     )
 
     app.add_handler(conv)
-    app.run_polling()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,210 @@
+import re
+import time
+import bisect
+import functools
+
+# ─────────────────────────────────────────────────────────────
+# Registry מינימלי בפורמט הטקסט של Prometheus (בלי תלות חיצונית).
+# כל מטריקה נרשמת ב־REGISTRY ביצירתה; render() מייצר את כל הפלט
+# ─────────────────────────────────────────────────────────────
+CONTENT_TYPE = "text/plain; version=0.0.4"
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRY: list = []
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), fn=None):
+        # fn: ערך שנקרא רק ב־render – מספר, או dict של label values → מספר
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.fn = fn
+        self._values: dict[tuple, float] = {}
+        REGISTRY.append(self)
+
+    def _series(self) -> dict[tuple, float]:
+        if self.fn is None:
+            return self._values
+        value = self.fn()
+        if not isinstance(value, dict):
+            return {(): value}
+        return {k if isinstance(k, tuple) else (k,): v for k, v in value.items()}
+
+    def lines(self) -> list[str]:
+        return [f"{self.name}{_labels(self.labels, key)} {_number(value)}"
+                for key, value in sorted(self._series().items())]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels):
+        self._values[labels] = value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values → [ספירה לכל bucket (לא מצטברת, האחרון = +Inf), sum]
+        self._hist: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        series = self._hist.get(labels)
+        if series is None:
+            series = self._hist[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def lines(self) -> list[str]:
+        out = []
+        for key, (counts, total) in sorted(self._hist.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                out.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {cumulative}")
+            out.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(total)}")
+            out.append(f"{self.name}_count{_labels(self.labels, key)} {cumulative}")
+        return out
+
+def render(remote: dict[str, list[str]] | None = None) -> str:
+    # remote: משפחות מתהליכים אחרים (relabel) – הסדרות שלהן אחרי המקומיות, תחת אותו HELP/TYPE
+    remote = dict(remote or {})
+    out = []
+    for metric in REGISTRY:
+        out.append(f"# HELP {metric.name} {metric.help}")
+        out.append(f"# TYPE {metric.name} {metric.kind}")
+        out.extend(metric.lines())
+        out.extend(remote.pop(metric.name, [None, None])[2:])
+    for family in remote.values():
+        out.extend(family)
+    return "\n".join(out) + "\n"
+
+# ─────────────────────────────────────────────────────────────
+# מטריקות מתהליכים אחרים (workers של sharding): כל מקור הוא async fn
+# שמחזירה [(label value, פלט render())]; render_all() ממזג עם label
+# נוסף לכל סדרה, כך ש־/metrics אחד מציג את כל התהליכים
+# ─────────────────────────────────────────────────────────────
+SOURCES: list = []
+
+def relabel(families: dict[str, list[str]], text: str, label: str):
+    # families: name → [# HELP, # TYPE, samples…]
+    family = None
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            name = line.split(" ", 3)[2]
+            family = families.get(name)
+            if family is None:
+                family = families[name] = [line, None]
+        elif line.startswith("# TYPE "):
+            family[1] = family[1] or line
+        elif line and family is not None:
+            end = line.rfind("} ")
+            if end == -1:
+                name, value = line.split(" ", 1)
+                family.append(f"{name}{{{label}}} {value}")
+            else:
+                family.append(f"{line[:end]},{label}{line[end:]}")
+
+async def render_all() -> str:
+    remote: dict[str, list[str]] = {}
+    for source in SOURCES:
+        for value, text in await source():
+            relabel(remote, text, f'shard="{_escape(value)}"')
+    return render(remote)
+
+# ─────────────────────────────────────────────────────────────
+# Handlers: latency לפי prefix של callback_data (buy_, browse_, admin_lb…).
+# ה־label הוא תמיד אחד מה־prefixes הידועים, כך ש־id/שם חנות לא
+# מנפחים את מספר הסדרות
+# ─────────────────────────────────────────────────────────────
+HANDLER_SECONDS = Histogram("bot_handler_seconds", "Callback handler latency by callback_data prefix",
+                            ("bot", "handler"))
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Callback handlers that raised", ("bot", "handler"))
+
+def timed_callback(bot: str, prefixes: tuple):
+    ordered = sorted(prefixes, key=len, reverse=True)
+
+    @functools.lru_cache(maxsize=4096)
+    def label_for(data: str) -> str:
+        return next((p for p in ordered if data.startswith(p)), "other")
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(update, ctx):
+            query = update.callback_query
+            label = label_for(query.data or "") if query is not None else "other"
+            started = time.perf_counter()
+            try:
+                return await handler(update, ctx)
+            except Exception:
+                HANDLER_ERRORS.inc(bot, label)
+                raise
+            finally:
+                HANDLER_SECONDS.observe(time.perf_counter() - started, bot, label)
+        return wrapper
+    return decorator
+
+# code object משותף לכל ה־wrappers: profiling מזהה לפיו איזה handler רץ
+HANDLER_CODE = timed_callback("", ())(lambda update, ctx: None).__code__
+
+# ─────────────────────────────────────────────────────────────
+# SQLAlchemy: זמן לכל statement, לפי פעולה וטבלה ראשית
+# ─────────────────────────────────────────────────────────────
+DB_QUERY_SECONDS = Histogram("db_query_seconds", "Database statement latency", ("op", "table"))
+DB_QUERY_ERRORS = Counter("db_query_errors_total", "Database statements that raised", ("op", "table"))
+
+_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE)\s+"?(\w+)', re.IGNORECASE)
+_DML = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH"}
+
+@functools.lru_cache(maxsize=1024)
+def classify(statement: str) -> tuple[str, str]:
+    # DDL/PRAGMA בלי טבלה: רק DML מקבל label של טבלה
+    words = statement.split(None, 1)
+    op = words[0].upper() if words else "?"
+    table = _TABLE.search(statement) if op in _DML else None
+    return op, table.group(1) if table else "-"
+
+def instrument_engine(sync_engine):
+    from sqlalchemy import event
+
+    # conn.info: מחסנית זמני התחלה (executemany/nested באותו connection)
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        DB_QUERY_SECONDS.observe(time.perf_counter() - started, *classify(statement))
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        stack = context.connection.info.get("query_started") if context.connection is not None else None
+        if stack:
+            stack.pop()
+        if context.statement:
+            DB_QUERY_ERRORS.inc(*classify(context.statement))
@@ -1,5 +1,5 @@
 from sqlalchemy import (
-    Column, Integer, String, Float, DateTime, ForeignKey, Boolean
+    Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Index, MetaData, Table
 )
 from sqlalchemy.orm import relationship, declarative_base
 from datetime import datetime
@@ -17,7 +17,7 @@ class User(Base):
 class Shop(Base):
     __tablename__ = "shops"
     id         = Column(Integer, primary_key=True)
-    owner_id   = Column(Integer, ForeignKey("users.id"), nullable=False)
+    owner_id   = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     name       = Column(String, unique=True, nullable=False)
     full       = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -26,7 +26,7 @@ class Shop(Base):
 class Card(Base):
     __tablename__ = "cards"
     id         = Column(Integer, primary_key=True)
-    shop_id    = Column(Integer, ForeignKey("shops.id"), nullable=False)
+    shop_id    = Column(Integer, ForeignKey("shops.id"), nullable=False, index=True)
     title      = Column(String, nullable=False)
     image_path = Column(String, nullable=False)
     price      = Column(Float, nullable=False)
@@ -37,11 +37,32 @@ class Purchase(Base):
     __tablename__ = "purchases"
     id         = Column(Integer, primary_key=True)
     user_id    = Column(Integer, ForeignKey("users.id"), nullable=False)
-    card_id    = Column(Integer, ForeignKey("cards.id"), nullable=False)
+    card_id    = Column(Integer, ForeignKey("cards.id"), nullable=False, index=True)
     token      = Column(String, unique=True, nullable=False)
     amount     = Column(Float, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # cust_tokens מסנן לפי user_id; הזוג משרת גם חיפוש (user, card)
+    __table_args__ = (
+        Index("ix_purchases_user_id_card_id", "user_id", "card_id"),
+    )
+
+class UserSpend(Base):
+    __tablename__ = "user_spend"
+    user_id     = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    total_spent = Column(Float, nullable=False, default=0.0, index=True)
+    purchases   = Column(Integer, nullable=False, default=0)
+    updated_at  = Column(DateTime, default=datetime.utcnow)
+
+class ExportWatermark(Base):
+    # "מאז הייצוא הקודם": עד איזה Purchase.id כבר יצא, לכל צרכן בשמו
+    __tablename__ = "export_watermarks"
+    name            = Column(String, primary_key=True)
+    last_id         = Column(Integer, nullable=False, default=0)
+    last_created_at = Column(DateTime, nullable=True)
+    rows            = Column(Integer, nullable=False, default=0)
+    updated_at      = Column(DateTime, default=datetime.utcnow)
+
 class Score(Base):
     __tablename__ = "scores"
     id         = Column(Integer, primary_key=True)
@@ -49,3 +70,16 @@ class Score(Base):
     kisses     = Column(Integer, default=0)
     hugs       = Column(Integer, default=0)
     contracts  = Column(Integer, default=0)
+
+    # שורה אחת למשתמש: ה־flush של score_counter מוסיף דלתות ב־ON CONFLICT (user_id)
+    __table_args__ = (
+        Index("ux_scores_user_id", "user_id", unique=True),
+    )
+
+# ─────────────────────────────────────────────────────────────
+# אינדקס החיפוש (FTS5 ב־SQLite) – נוצר ב־search.create_index,
+# לא דרך Base.metadata (create_all לא יודע ליצור virtual tables)
+# ─────────────────────────────────────────────────────────────
+fts_metadata = MetaData()
+cards_fts = Table("cards_fts", fts_metadata, Column("rowid", Integer), Column("title", String), Column("rank", Float))
+shops_fts = Table("shops_fts", fts_metadata, Column("rowid", Integer), Column("name", String), Column("rank", Float))
@@ -0,0 +1,242 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+from itertools import count
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+import metrics
+
+logger = logging.getLogger("outbound")
+
+# ─────────────────────────────────────────────────────────────
+# מגבלות Telegram (ברירות מחדל שמרניות), ניתנות לשינוי מה־env
+# ─────────────────────────────────────────────────────────────
+OUTBOUND_BOT_RATE    = float(os.getenv("OUTBOUND_BOT_RATE", "30"))          # הודעות/שנייה לבוט
+OUTBOUND_CHAT_RATE   = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))          # הודעות/שנייה לצ'אט פרטי
+OUTBOUND_GROUP_RATE  = float(os.getenv("OUTBOUND_GROUP_RATE", str(20 / 60)))  # 20 לדקה בקבוצה
+OUTBOUND_CHAT_BURST  = float(os.getenv("OUTBOUND_CHAT_BURST", "3"))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
+OUTBOUND_MAX_GATES   = int(os.getenv("OUTBOUND_MAX_GATES", "10000"))        # מעבר לזה מנקים buckets מלאים
+
+# נתיבי עדיפות: תשובה למשתמש שמחכה קודמת להתראות
+INTERACTIVE = "interactive"
+NOTIFY      = "notify"
+_PRIORITY   = {INTERACTIVE: 0, NOTIFY: 1}
+
+def lane_args(bot, lane: str) -> dict | None:
+    # rate_limit_args מותר רק לבוט שיש לו limiter
+    return {"lane": lane} if getattr(bot, "rate_limiter", None) else None
+
+# ─────────────────────────────────────────────────────────────
+# Token bucket + תור ממתינים לפי (עדיפות, סדר הגעה)
+# ─────────────────────────────────────────────────────────────
+class _Gate:
+    __slots__ = ("rate", "capacity", "tokens", "updated", "paused_until", "waiters", "drainer")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waiters: list[tuple[int, int, asyncio.Future]] = []
+        self.drainer: asyncio.Task | None = None
+
+    def _wait_time(self, now: float) -> float:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.paused_until:
+            return self.paused_until - now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def idle(self) -> bool:
+        return not self.waiters and self._wait_time(time.monotonic()) == 0 and self.tokens >= self.capacity
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, priority: int, seq: int):
+        if not self.waiters and self._wait_time(time.monotonic()) == 0:
+            self.tokens -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, seq, future))
+        if self.drainer is None:
+            self.drainer = asyncio.create_task(self._drain())
+        await future
+
+    async def _drain(self):
+        try:
+            while self.waiters:
+                delay = self._wait_time(time.monotonic())
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+                _, _, future = heapq.heappop(self.waiters)
+                if not future.done():   # ממתין שבוטל לא צורך טוקן
+                    self.tokens -= 1
+                    future.set_result(None)
+        finally:
+            self.drainer = None
+
+# ─────────────────────────────────────────────────────────────
+# בקשה יוצאת. ב־edit_message_text שממתין לתור: עריכה חדשה לאותה
+# הודעה מחליפה את התוכן, וכל הקוראים מקבלים את תוצאת השליחה האחת
+# ─────────────────────────────────────────────────────────────
+class _Outgoing:
+    __slots__ = ("args", "kwargs", "waiters")
+
+    def __init__(self, args, kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        self.waiters: list[asyncio.Future] = []
+
+    def resolve(self, result):
+        for future in self.waiters:
+            if not future.done():
+                future.set_result(result)
+
+    def fail(self, exc: BaseException):
+        for future in self.waiters:
+            if future.done():
+                continue
+            if isinstance(exc, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(exc)
+                future.exception()
+
+# ─────────────────────────────────────────────────────────────
+# Scheduler אחד לכל הבוטים בתהליך: bucket לכל בוט ולכל צ'אט,
+# נתיבי עדיפות, איחוד עריכות וכיבוד retry_after
+# ─────────────────────────────────────────────────────────────
+class OutboundScheduler:
+    def __init__(self, bot_rate: float = OUTBOUND_BOT_RATE, chat_rate: float = OUTBOUND_CHAT_RATE,
+                 group_rate: float = OUTBOUND_GROUP_RATE, chat_burst: float = OUTBOUND_CHAT_BURST,
+                 max_retries: int = OUTBOUND_MAX_RETRIES):
+        self.bot_rate = bot_rate
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.sent = 0
+        self.coalesced = 0
+        self.retried = 0
+        self._bots: dict[str, _Gate] = {}
+        self._chats: dict[tuple[str, object], _Gate] = {}
+        self._edits: dict[tuple, _Outgoing] = {}
+        self._seq = count()
+
+    def limiter_for(self, token: str) -> "BotRateLimiter":
+        return BotRateLimiter(self, token.split(":", 1)[0])
+
+    def stats(self) -> dict:
+        return {"sent": self.sent, "coalesced": self.coalesced, "retried": self.retried,
+                "chats": len(self._chats), "pending_edits": len(self._edits)}
+
+    def _bot_gate(self, bot_key: str) -> _Gate:
+        gate = self._bots.get(bot_key)
+        if gate is None:
+            gate = self._bots[bot_key] = _Gate(self.bot_rate, self.bot_rate)
+        return gate
+
+    def _chat_gate(self, bot_key: str, chat_id) -> _Gate:
+        key = (bot_key, chat_id)
+        gate = self._chats.get(key)
+        if gate is None:
+            if len(self._chats) >= OUTBOUND_MAX_GATES:
+                for idle in [k for k, g in self._chats.items() if g.idle()]:
+                    del self._chats[idle]
+            # chat_id שלילי או @username → קבוצה/ערוץ
+            is_group = not isinstance(chat_id, int) or chat_id < 0
+            gate = self._chats[key] = _Gate(self.group_rate if is_group else self.chat_rate, self.chat_burst)
+        return gate
+
+    async def acquire(self, bot_key: str, lane: str = INTERACTIVE):
+        # קריאות שלא עוברות דרך Application (בדיקות של בוטים רדומים) – אותו bucket של הבוט
+        await self._acquire(bot_key, None, _PRIORITY.get(lane, 0))
+
+    async def _acquire(self, bot_key: str, chat_id, priority: int):
+        seq = next(self._seq)
+        if chat_id is not None:
+            await self._chat_gate(bot_key, chat_id).acquire(priority, seq)
+        await self._bot_gate(bot_key).acquire(priority, seq)
+
+    async def process(self, bot_key: str, callback, args, kwargs, endpoint: str, data: dict, rate_limit_args):
+        chat_id = data.get("chat_id")
+        if chat_id is None and "inline_message_id" not in data:
+            # getMe / getFile / answerCallbackQuery וכו' – לא הודעות, לא מוגבלים
+            return await callback(*args, **kwargs)
+        if isinstance(chat_id, str) and chat_id.lstrip("-").isdigit():
+            chat_id = int(chat_id)
+        lane = rate_limit_args.get("lane") if isinstance(rate_limit_args, dict) else None
+        priority = _PRIORITY.get(lane, 0)
+
+        if endpoint != "editMessageText":
+            return await self._send(bot_key, chat_id, priority, callback, _Outgoing(args, kwargs))
+
+        key = (bot_key, chat_id, data.get("message_id"), data.get("inline_message_id"))
+        pending = self._edits.get(key)
+        if pending is not None:
+            pending.args, pending.kwargs = args, kwargs
+            future = asyncio.get_running_loop().create_future()
+            pending.waiters.append(future)
+            self.coalesced += 1
+            return await future
+        pending = self._edits[key] = _Outgoing(args, kwargs)
+        try:
+            result = await self._send(bot_key, chat_id, priority, callback, pending, key)
+        except BaseException as exc:
+            if self._edits.get(key) is pending:
+                del self._edits[key]
+            pending.fail(exc)
+            raise
+        pending.resolve(result)
+        return result
+
+    async def _send(self, bot_key: str, chat_id, priority: int, callback, request: _Outgoing, edit_key=None):
+        attempt = 0
+        while True:
+            await self._acquire(bot_key, chat_id, priority)
+            if edit_key is not None:
+                # מכאן נשלח התוכן האחרון; עריכה חדשה פותחת משבצת חדשה
+                del self._edits[edit_key]
+                edit_key = None
+            try:
+                result = await callback(*request.args, **request.kwargs)
+            except RetryAfter as exc:
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.retried += 1
+                logger.warning(f"Flood limit for bot {bot_key}, chat {chat_id}: retry after {exc.retry_after}s")
+                self._bot_gate(bot_key).pause(exc.retry_after)
+                continue
+            self.sent += 1
+            return result
+
+# ─────────────────────────────────────────────────────────────
+# BaseRateLimiter לכל Application – כולם מאצילים ל־scheduler המשותף
+# ─────────────────────────────────────────────────────────────
+class BotRateLimiter(BaseRateLimiter):
+    def __init__(self, scheduler: OutboundScheduler, bot_key: str):
+        self.scheduler = scheduler
+        self.bot_key = bot_key
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        return await self.scheduler.process(self.bot_key, callback, args, kwargs, endpoint, data, rate_limit_args)
+
+scheduler = OutboundScheduler()
+
+metrics.Counter("outbound_requests_total", "Outbound Bot API requests by outcome", ("outcome",),
+                fn=lambda: {k: v for k, v in scheduler.stats().items() if k in ("sent", "coalesced", "retried")})
@@ -0,0 +1,174 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+from collections import Counter, deque
+
+import metrics
+
+logger = logging.getLogger("profiling")
+
+PROFILE_INTERVAL    = float(os.getenv("PROFILE_INTERVAL", "0.005"))   # שניות בין דגימות
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+LOOP_LAG_INTERVAL   = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))
+LOOP_LAG_THRESHOLD  = float(os.getenv("LOOP_LAG_THRESHOLD", "0.25"))   # מעל זה נרשם כ־stall
+MAX_DEPTH = 128
+
+LOOP_LAG = metrics.Histogram("event_loop_lag_seconds", "Delay of the loop heartbeat past its schedule")
+LOOP_STALLS = metrics.Counter("event_loop_stalls_total", "Loop stalls above LOOP_LAG_THRESHOLD by handler",
+                              ("handler",))
+
+# ─────────────────────────────────────────────────────────────
+# Stacks מתוך frame: root → leaf, בפורמט collapsed (flamegraph.pl / speedscope)
+# ─────────────────────────────────────────────────────────────
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _stack(frame) -> list[str]:
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    names.reverse()
+    return names
+
+def current_handler(frame) -> str | None:
+    # ה־wrapper של metrics.timed_callback על ה־stack → איזה callback רץ כרגע
+    while frame is not None:
+        if frame.f_code is metrics.HANDLER_CODE:
+            local = frame.f_locals
+            return f"{local.get('bot')}:{local.get('label')}"
+        frame = frame.f_back
+    return None
+
+class Profile:
+    def __init__(self, stacks: Counter, seconds: float):
+        self.stacks = stacks
+        self.seconds = seconds
+
+    @property
+    def samples(self) -> int:
+        return sum(self.stacks.values())
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top(self, n: int = 10) -> list[tuple[str, int]]:
+        # frame עלה (self time) – מה באמת תפס את ה־thread
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return leaves.most_common(n)
+
+# ─────────────────────────────────────────────────────────────
+# Sampling profiler לפי דרישה: thread שדוגם sys._current_frames()
+# למשך N שניות ונעלם. כשלא רץ פרופיל – אין שום thread ואין עלות
+# ─────────────────────────────────────────────────────────────
+class SamplingProfiler:
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self._busy = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._busy.locked()
+
+    def sample(self, seconds: float, thread_id: int | None = None) -> Counter:
+        stacks = Counter()
+        me = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for tid, frame in sys._current_frames().items():
+                if tid == me or (thread_id is not None and tid != thread_id):
+                    continue
+                stacks[";".join(_stack(frame))] += 1
+            time.sleep(self.interval)
+        return stacks
+
+    async def profile(self, seconds: float, all_threads: bool = False) -> Profile:
+        if not self._busy.acquire(blocking=False):
+            raise RuntimeError("a profile is already running")
+        seconds = min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+        target = None if all_threads else threading.get_ident()
+
+        def run():
+            try:
+                result = self.sample(seconds, target)
+            except BaseException as e:
+                loop.call_soon_threadsafe(done.set_exception, e)
+            else:
+                loop.call_soon_threadsafe(done.set_result, result)
+            finally:
+                self._busy.release()
+
+        # thread ייעודי: לא תופס worker ב־executor של storage למשך הפרופיל
+        threading.Thread(target=run, name="sampling-profiler", daemon=True).start()
+        return Profile(await done, seconds)
+
+profiler = SamplingProfiler()
+
+# ─────────────────────────────────────────────────────────────
+# ניטור lag רציף: heartbeat בלולאה + watchdog thread שמצלם את ה־stack
+# של הלולאה בזמן שהיא תקועה (כשהיא כבר חוזרת – ה־stack לא רלוונטי).
+# heartbeat כל LOOP_LAG_INTERVAL ו־watchdog כל רבע סף, בלי debug mode של asyncio
+# ─────────────────────────────────────────────────────────────
+class LoopMonitor:
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, threshold: float = LOOP_LAG_THRESHOLD, keep: int = 50):
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls: deque[dict] = deque(maxlen=keep)
+        self.last_lag = 0.0
+        self._due = 0.0
+        self._loop_thread: int | None = None
+        self._captured: tuple | None = None
+        self._task: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+
+    def start(self):
+        if self._task is not None and not self._task.done():
+            return
+        self._loop_thread = threading.get_ident()
+        self._due = time.monotonic() + self.interval
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        if self._watchdog is None or not self._watchdog.is_alive():
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _heartbeat(self):
+        while True:
+            self._due = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = self.last_lag = max(0.0, time.monotonic() - self._due)
+            LOOP_LAG.observe(lag)
+            if lag >= self.threshold:
+                self._report(lag)
+            self._captured = None
+
+    def _watch(self):
+        # מצלם כבר בחצי הסף, כדי שגם stall קצר יגיע עם stack
+        while self._task is not None:
+            time.sleep(self.threshold / 4)
+            if self._captured is None and time.monotonic() > self._due + self.threshold / 2:
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is not None:
+                    self._captured = (current_handler(frame), _stack(frame))
+
+    def _report(self, lag: float):
+        handler, stack = self._captured or (None, [])
+        handler = handler or "-"
+        LOOP_STALLS.inc(handler)
+        self.stalls.append({"at": time.time(), "lag_ms": round(lag * 1000, 1), "handler": handler,
+                            "stack": stack[-12:]})
+        logger.warning("Event loop blocked for %.0f ms (handler %s)\n  %s",
+                       lag * 1000, handler, "\n  ".join(stack[-12:]) or "<no sample>")
+
+monitor = LoopMonitor()
@@ -0,0 +1,178 @@
+import os
+import sys
+import fcntl
+import asyncio
+import logging
+from contextlib import contextmanager
+
+from storage import storage
+
+logger = logging.getLogger(__name__)
+
+SHOPS_ROOT = "shops"
+LOG_NAME   = "purchases.log"   # שורה לכל רכישה: uid \t card_id \t token
+LOCK_NAME  = "purchases.lock"  # flock: append = shared, backfill = exclusive
+
+# ─────────────────────────────────────────────────────────────
+# אינדקס רכישות: לוג append-only לכל חנות + מפה בזיכרון
+#   user → {(shop, card): token}, shop → מספר מכירות
+# תהליך יחיד: טעינה פעם אחת, ואחריה רק ה־record של התהליך עצמו.
+# follow (workers של SHOP_BOT_SHARDS – כמה תהליכים כותבים לאותם
+# לוגים): כל קריאה ממשיכה מה־offset האחרון של כל לוג, כך שרכישות
+# מ־workers אחרים נראות מיד. backfill מחליף את הלוג בקובץ חדש (os.replace),
+# כך ש־inode אחר (או לוג קצר מה־offset) = טעינה מאפס
+# ─────────────────────────────────────────────────────────────
+Offsets = dict[str, tuple[int, int]]   # shop → (inode, בתים מהלוג שכבר הוחלו)
+
+def _read_tails(root: str, offsets: Offsets) -> tuple[bool, list[str], dict[str, tuple[int, int, list[str]]]]:
+    # ב־thread pool: רק I/O, המפות מתעדכנות בלולאה. שורה חלקית (כתיבה
+    # שעוד לא הסתיימה) נשארת ל־refresh הבא
+    shops, tails = [], {}
+    if not os.path.isdir(root):
+        return False, shops, tails
+    for shop in os.listdir(root):
+        if not os.path.isdir(os.path.join(root, shop)):
+            continue
+        shops.append(shop)
+        path = os.path.join(root, shop, LOG_NAME)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        inode, offset = offsets.get(shop, (st.st_ino, 0))
+        if st.st_ino != inode or st.st_size < offset:
+            return True, shops, {}
+        if st.st_size == offset:
+            continue
+        with open(path, "rb") as fp:
+            # הוחלף בין ה־stat ל־open
+            if os.fstat(fp.fileno()).st_ino != inode:
+                return True, shops, {}
+            fp.seek(offset)
+            data = fp.read(st.st_size - offset)
+        end = data.rfind(b"\n") + 1
+        if end:
+            tails[shop] = (inode, offset + end, data[:end].decode("utf-8").splitlines())
+    return False, shops, tails
+
+@contextmanager
+def _log_lock(folder: str, exclusive: bool):
+    # backfill קורא את ה־tokens ומחליף את הלוג תחת נעילה בלעדית; append
+    # מחכה לו, כך ששורה לא נכתבת לקובץ הישן אחרי שה־backfill כבר קרא אותו
+    with open(os.path.join(folder, LOCK_NAME), "a") as fp:
+        fcntl.flock(fp, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+
+class PurchaseIndex:
+    def __init__(self, root: str = SHOPS_ROOT):
+        self.root = root
+        self._by_user: dict[int, dict[tuple[str, str], str]] = {}
+        self._sales: dict[str, int] = {}
+        self._offsets: Offsets = {}
+        self._loaded = False
+        self.follow = False
+        self._refresh_lock = asyncio.Lock()
+
+    def log_path(self, shop: str) -> str:
+        return os.path.join(self.root, shop, LOG_NAME)
+
+    def _reset(self):
+        self._by_user.clear()
+        self._sales.clear()
+        self._offsets.clear()
+
+    def _merge(self, shops: list[str], tails: dict[str, tuple[int, int, list[str]]]):
+        for shop in shops:
+            self._sales.setdefault(shop, 0)
+        for shop, (inode, offset, lines) in tails.items():
+            for line in lines:
+                uid, card, token = line.split("\t")
+                self._apply(shop, card, int(uid), token)
+            self._offsets[shop] = (inode, offset)
+
+    def load(self):
+        self._reset()
+        _, shops, tails = _read_tails(self.root, {})
+        self._merge(shops, tails)
+        self._loaded = True
+
+    async def _refresh(self):
+        if self._loaded and not self.follow:
+            return
+        async with self._refresh_lock:
+            if self._loaded and not self.follow:
+                return
+            rewritten, shops, tails = await storage.run("index_tail", _read_tails, self.root, dict(self._offsets))
+            if rewritten:
+                self._reset()
+                _, shops, tails = await storage.run("index_load", _read_tails, self.root, {})
+            self._merge(shops, tails)
+            self._loaded = True
+
+    def _apply(self, shop: str, card: str, uid: int, token: str):
+        owned = self._by_user.setdefault(uid, {})
+        # כמו בעץ: קנייה חוזרת של אותו קלף מחליפה את הטוקן, לא מוסיפה מכירה
+        if (shop, card) not in owned:
+            self._sales[shop] = self._sales.get(shop, 0) + 1
+        owned[(shop, card)] = token
+
+    async def record(self, shop: str, card: str, uid: int, token: str):
+        # ה־apply המיידי רק מקדים את ה־refresh הבא, שיקרא את אותה שורה
+        # מהלוג – החלה כפולה של אותה שורה לא משנה את המפות
+        await storage.run("index_append", self._append, shop, f"{uid}\t{card}\t{token}\n")
+        self._apply(shop, card, uid, token)
+
+    def _append(self, shop: str, line: str):
+        folder = os.path.join(self.root, shop)
+        os.makedirs(folder, exist_ok=True)
+        with _log_lock(folder, exclusive=False), open(self.log_path(shop), "a", encoding="utf-8") as fp:
+            fp.write(line)
+
+    async def tokens_for(self, uid: int) -> list[tuple[str, str, str]]:
+        await self._refresh()
+        owned = self._by_user.get(uid, {})
+        return [(shop, card, token) for (shop, card), token in owned.items()]
+
+    async def sales(self) -> dict[str, int]:
+        await self._refresh()
+        return dict(self._sales)
+
+    # ─────────────────────────────────────────────────────────
+    # Migration: בניית הלוגים מתוך shops/*/purchases/*/<uid>.token.
+    # בטוח גם כשהבוטים רצים: ה־.token נכתב לפני ה־append, וה־append
+    # מחכה לנעילה – רכישה נמצאת בקריאת ה־tokens או נכתבת ללוג החדש
+    # ─────────────────────────────────────────────────────────
+    def backfill(self) -> int:
+        total = 0
+        if not os.path.isdir(self.root):
+            return total
+        for shop in os.listdir(self.root):
+            sales_root = os.path.join(self.root, shop, "purchases")
+            if not os.path.isdir(sales_root):
+                continue
+            tmp_path = self.log_path(shop) + ".tmp"
+            with _log_lock(os.path.join(self.root, shop), exclusive=True):
+                with open(tmp_path, "w", encoding="utf-8") as out:
+                    for card in os.listdir(sales_root):
+                        folder = os.path.join(sales_root, card)
+                        for name in os.listdir(folder):
+                            if not name.endswith(".token"):
+                                continue
+                            with open(os.path.join(folder, name)) as fp:
+                                token = fp.read().strip()
+                            out.write(f"{name[:-len('.token')]}\t{card}\t{token}\n")
+                            total += 1
+                os.replace(tmp_path, self.log_path(shop))
+            logger.info(f"Backfilled purchase index for shop {shop}")
+        self.load()
+        return total
+
+purchase_index = PurchaseIndex()
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["backfill"]:
+        sys.exit("usage: python purchase_index.py backfill")
+    logging.basicConfig(level=logging.INFO)
+    print(f"✅ purchase index backfilled: {purchase_index.backfill()} purchases")
+    # workers של SHOP_BOT_SHARDS רואים את הלוג החדש לבד (inode); תהליך יחיד טוען פעם אחת
+    print("ℹ️ shop bots without SHOP_BOT_SHARDS load the index once: restart them to pick up the rebuilt logs")
@@ -0,0 +1,184 @@
+import uuid
+import asyncio
+import logging
+from datetime import datetime
+from collections import defaultdict
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError, NoResultFound
+
+from config import settings
+from database import AsyncSessionLocal
+from models import Purchase
+import leaderboard
+import queries
+
+logger = logging.getLogger("purchase_writer")
+
+class _Pending:
+    __slots__ = ("user_id", "card_id", "future")
+
+    def __init__(self, user_id: int, card_id: int, future: asyncio.Future):
+        self.user_id = user_id
+        self.card_id = card_id
+        self.future = future
+
+# ─────────────────────────────────────────────────────────────
+# Group commit: רכישות ממתינות נאספות לטרנזקציה אחת כל
+# PURCHASE_FLUSH_MS או PURCHASE_BATCH_SIZE פריטים – commit (fsync) אחד
+# ─────────────────────────────────────────────────────────────
+class PurchaseWriter:
+    def __init__(self, batch_size: int, flush_ms: float):
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self.batches = 0
+        self.written = 0
+        self._queue: asyncio.Queue[_Pending | None] | None = None
+        self._task: asyncio.Task | None = None
+        self._stopping: asyncio.Task | None = None   # writer שמתרוקן אחרי stop()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        # None מסמן סוף: מה שכבר בתור נכתב לפני העצירה; submit שמגיע
+        # בינתיים לא נכנס לתור הזה (אחרי ה־None אף אחד לא היה קורא אותו)
+        task = self._stopping = self._task
+        try:
+            self._queue.put_nowait(None)
+            await task
+        finally:
+            self._stopping = None
+            if self._task is task:
+                self._task = None
+
+    async def submit(self, user_id: int, card_id: int) -> str:
+        if self._stopping is not None:
+            # stop() באמצע: מחכים שהתור הישן יתרוקן, ואז writer חדש
+            await asyncio.wait([self._stopping])
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_Pending(user_id, card_id, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        closing = False
+        batch: list[_Pending] = []
+        try:
+            while not closing:
+                item = await self._queue.get()
+                if item is None:
+                    return
+                batch = [item]
+                deadline = loop.time() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    try:
+                        item = self._queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        timeout = deadline - loop.time()
+                        if timeout <= 0:
+                            break
+                        try:
+                            item = await asyncio.wait_for(self._queue.get(), timeout)
+                        except asyncio.TimeoutError:
+                            break
+                    if item is None:
+                        closing = True
+                        break
+                    batch.append(item)
+                await self._flush(batch)
+                batch = []
+        except BaseException:
+            # writer שבוטל (או נפל) לא משאיר handler מחכה ל־future שלא ייפתר:
+            # האצווה הנוכחית (גם באמצע _flush) ומה שעוד בתור מבוטלים
+            self._abandon(batch)
+            raise
+
+    def _abandon(self, batch: list[_Pending]):
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            if item is not None:
+                batch.append(item)
+        for p in batch:
+            p.future.cancel()
+
+    async def _flush(self, batch: list[_Pending]):
+        if len(batch) == 1:
+            results = await self._write_one(batch[0])
+        else:
+            try:
+                results = await self._write(batch)
+            except IntegrityError:
+                # שורה אחת שבורה (למשל user_id שלא קיים, FK ב־Postgres) לא מפילה
+                # את הרכישות שסתם נאספו איתה: טרנזקציה לכל רכישה, רק היא נכשלת
+                logger.warning(f"Purchase batch of {len(batch)} hit an integrity error; writing one by one")
+                results = []
+                for p in batch:
+                    results += await self._write_one(p)
+            except Exception as exc:
+                logger.exception(f"Purchase batch of {len(batch)} failed")
+                results = [(p, exc) for p in batch]
+
+        for p, result in results:
+            if p.future.done():
+                continue
+            if isinstance(result, Exception):
+                p.future.set_exception(result)
+            else:
+                p.future.set_result(result)
+
+    async def _write_one(self, p: _Pending) -> list[tuple[_Pending, object]]:
+        try:
+            return await self._write([p])
+        except IntegrityError as exc:
+            logger.error(f"Purchase user_id={p.user_id} card_id={p.card_id} rejected: {exc.orig}")
+            return [(p, exc)]
+        except Exception as exc:
+            logger.exception(f"Purchase user_id={p.user_id} card_id={p.card_id} failed")
+            return [(p, exc)]
+
+    async def _write(self, batch: list[_Pending]) -> list[tuple[_Pending, object]]:
+        # טרנזקציה אחת לכל האצווה; מחזיר token או שגיאה לכל רכישה
+        async with AsyncSessionLocal() as session:
+            card_ids = {p.card_id for p in batch}
+            prices = dict((await session.execute(queries.card_prices(card_ids))).all())
+
+            rows, results = [], []
+            spent = defaultdict(float)
+            counts = defaultdict(int)
+            now = datetime.utcnow()
+            for p in batch:
+                if p.card_id not in prices:
+                    results.append((p, NoResultFound(f"card {p.card_id} not found")))
+                    continue
+                token = str(uuid.uuid4())
+                amount = prices[p.card_id]
+                rows.append({
+                    "user_id":    p.user_id,
+                    "card_id":    p.card_id,
+                    "token":      token,
+                    "amount":     amount,
+                    "created_at": now,
+                })
+                spent[p.user_id] += amount
+                counts[p.user_id] += 1
+                results.append((p, token))
+
+            if rows:
+                await session.execute(insert(Purchase), rows)
+                for user_id, amount in spent.items():
+                    await leaderboard.record_purchase(session, user_id, amount, counts[user_id])
+                await session.commit()
+        self.batches += 1
+        self.written += len(rows)
+        return results
+
+purchase_writer = PurchaseWriter(settings.PURCHASE_BATCH_SIZE, settings.PURCHASE_FLUSH_MS)
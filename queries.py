@@ -0,0 +1,154 @@
+from sqlalchemy import func
+from sqlalchemy.future import select
+
+from database import upsert
+from models import User, Shop, Card, Purchase, UserSpend, Score, ExportWatermark, cards_fts, shops_fts
+
+SCORE_FIELDS = ("kisses", "hugs", "contracts")
+
+# ─────────────────────────────────────────────────────────────
+# כל השאילתות שהבוטים וה־dashboard מריצים, במקום אחד –
+# benchmarks/check_query_plans.py מריץ EXPLAIN QUERY PLAN על כל אחת
+# ─────────────────────────────────────────────────────────────
+def user_identity(telegram_id: int):
+    return select(User.id, User.is_admin).where(User.telegram_id == telegram_id)
+
+def shops_by_owner(owner_id: int):
+    return select(Shop).where(Shop.owner_id == owner_id)
+
+def shops_before(before_id: int):
+    return (
+        select(Shop.id, Shop.name, Shop.owner_id)
+        .where(Shop.id < before_id)
+        .order_by(Shop.id.desc())
+    )
+
+def cards_after(shop_id: int, after_id: int):
+    return (
+        select(Card.id, Card.title, Card.price)
+        .where(Card.shop_id == shop_id, Card.id > after_id)
+        .order_by(Card.id)
+    )
+
+def cards_before(shop_id: int, before_id: int):
+    return (
+        select(Card.id, Card.title, Card.price)
+        .where(Card.shop_id == shop_id, Card.id < before_id)
+        .order_by(Card.id.desc())
+    )
+
+def card_prices(card_ids):
+    return select(Card.id, Card.price).where(Card.id.in_(card_ids))
+
+def purchases_by_user(user_id: int):
+    return select(Purchase).where(Purchase.user_id == user_id)
+
+def score_for(user_id: int):
+    return select(Score.kisses, Score.hugs, Score.contracts).where(Score.user_id == user_id)
+
+def score_add():
+    # executemany של score_counter: שורה לכל משתמש, הדלתות מתווספות לקיים
+    stmt = upsert(Score)
+    return stmt.on_conflict_do_update(
+        index_elements=[Score.user_id],
+        set_={field: getattr(Score, field) + getattr(stmt.excluded, field) for field in SCORE_FIELDS},
+    )
+
+def top_spenders(limit: int):
+    return (
+        select(UserSpend.user_id, User.telegram_id, UserSpend.total_spent)
+        .join(User, User.id == UserSpend.user_id)
+        .order_by(UserSpend.total_spent.desc())
+        .limit(limit)
+    )
+
+def shops_after(after_id: int):
+    return (
+        select(Shop.id, Shop.name, Shop.owner_id)
+        .where(Shop.id > after_id)
+        .order_by(Shop.id)
+    )
+
+def purchases_after(after_id: int):
+    return (
+        select(Purchase.id, Purchase.user_id, Purchase.card_id, Purchase.token, Purchase.amount)
+        .where(Purchase.id > after_id)
+        .order_by(Purchase.id)
+    )
+
+# סכומים לכל משתמש ל־leaderboard.rebuild – מעבר מלא על purchases במכוון
+def spend_totals():
+    return (
+        select(
+            Purchase.user_id,
+            func.sum(Purchase.amount),
+            func.count(Purchase.id),
+            func.max(Purchase.created_at),
+        )
+        .group_by(Purchase.user_id)
+    )
+
+# ─────────────────────────────────────────────────────────────
+# importer: id לפי המפתח הטבעי, chunk של IMPORT_BATCH ערכים בכל פעם
+# ─────────────────────────────────────────────────────────────
+def user_ids_by_telegram(telegram_ids):
+    return select(User.telegram_id, User.id).where(User.telegram_id.in_(telegram_ids))
+
+def shop_ids_by_name(names):
+    return select(Shop.name, Shop.id).where(Shop.name.in_(names))
+
+def cards_in_shops(shop_ids):
+    return select(Card.shop_id, Card.title, Card.id, Card.price).where(Card.shop_id.in_(shop_ids))
+
+# ─────────────────────────────────────────────────────────────
+# ייצוא: רכישות עם הקלף והחנות, בטווח id סגור (snapshot לפי max id)
+# ─────────────────────────────────────────────────────────────
+def purchases_max_id():
+    return select(func.max(Purchase.id))
+
+def purchases_export(after_id: int, upto_id: int):
+    return (
+        select(
+            Purchase.id, Purchase.created_at, Purchase.user_id, Purchase.card_id,
+            Card.title.label("card_title"), Card.shop_id, Shop.name.label("shop_name"), Purchase.amount,
+        )
+        .join(Card, Card.id == Purchase.card_id)
+        .join(Shop, Shop.id == Card.shop_id)
+        .where(Purchase.id > after_id, Purchase.id <= upto_id)
+        .order_by(Purchase.id)
+    )
+
+def export_watermarks():
+    return select(ExportWatermark).order_by(ExportWatermark.name)
+
+# ─────────────────────────────────────────────────────────────
+# /search: FTS5 ב־SQLite; *_like הם ה־fallback ל־Postgres
+# ─────────────────────────────────────────────────────────────
+def search_shops(match: str, limit: int):
+    return (
+        select(Shop.id, Shop.name)
+        .join(shops_fts, shops_fts.c.rowid == Shop.id)
+        .where(shops_fts.c.name.match(match))
+        .order_by(shops_fts.c.rank)
+        .limit(limit)
+    )
+
+def search_cards(match: str, limit: int):
+    return (
+        select(Card.id, Card.title, Card.price)
+        .join(cards_fts, cards_fts.c.rowid == Card.id)
+        .where(cards_fts.c.title.match(match))
+        .order_by(cards_fts.c.rank)
+        .limit(limit)
+    )
+
+def search_shops_like(pattern: str, limit: int):
+    return select(Shop.id, Shop.name).where(Shop.name.ilike(pattern)).order_by(Shop.id).limit(limit)
+
+def search_cards_like(pattern: str, limit: int):
+    return (
+        select(Card.id, Card.title, Card.price)
+        .where(Card.title.ilike(pattern))
+        .order_by(Card.id)
+        .limit(limit)
+    )
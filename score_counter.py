@@ -0,0 +1,157 @@
+import asyncio
+import logging
+
+from sqlalchemy.exc import IntegrityError
+
+from config import settings
+from database import AsyncSessionLocal
+import metrics
+import queries
+
+logger = logging.getLogger("score_counter")
+
+FIELDS = queries.SCORE_FIELDS
+
+# ─────────────────────────────────────────────────────────────
+# Write-behind ל־Score: הגדלות מצטברות בזיכרון לכל משתמש ונכתבות
+# כל SCORE_FLUSH_MS (או כשיש SCORE_MAX_PENDING משתמשים ממתינים)
+# ב־executemany אחד: INSERT … ON CONFLICT (user_id) DO UPDATE
+# SET kisses = kisses + ?, … – שורה לכל משתמש, commit אחד לכל flush.
+# קריאה = השורה ב־DB + הדלתות שעוד לא נכתבו (ממתינות + באמצע flush)
+# ─────────────────────────────────────────────────────────────
+class ScoreCounter:
+    def __init__(self, flush_ms: float, max_pending: int):
+        self.flush_interval = flush_ms / 1000
+        self.max_pending = max_pending
+        self.flushes = 0
+        self.written = 0
+        self.dropped = 0
+        self.increments = 0
+        self._pending: dict[int, list[int]] = {}    # user_id → [kisses, hugs, contracts]
+        self._flushing: dict[int, list[int]] = {}   # באמצע flush: עדיין נספר בקריאות
+        # seqlock מול קריאות: אי־זוגי = commit בדרך, ה־DB עשוי לכלול את _flushing או לא
+        self._generation = 0
+        self._lock = asyncio.Lock()                 # flush אחד בכל רגע
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # הלולאה מסיימת את ה־flush הנוכחי (לא מבוטלת באמצעו), ומה שנשאר נכתב לפני היציאה
+        if self._task is not None:
+            self._stopping = True
+            self._wake.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def incr(self, user_id: int, field: str, amount: int = 1):
+        deltas = self._pending.get(user_id)
+        if deltas is None:
+            deltas = self._pending[user_id] = [0] * len(FIELDS)
+        deltas[FIELDS.index(field)] += amount
+        self.increments += 1
+        if not self._stopping:
+            self.start()
+        if len(self._pending) >= self.max_pending:
+            self._wake.set()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    def _requeue(self, deltas: dict[int, list[int]]):
+        for user_id, values in deltas.items():
+            pending = self._pending.setdefault(user_id, [0] * len(FIELDS))
+            for i, delta in enumerate(values):
+                pending[i] += delta
+
+    async def _write_rows(self, rows: list[dict]):
+        # אחרי IntegrityError של האצווה: שורה לכל טרנזקציה, מה שנכשל (user_id בלי
+        # users, FK ב־Postgres) נזרק במקום לחזור לתור לנצח. כל שורה שהוכרעה
+        # יוצאת מ־_flushing, כך ששגיאה אחרת באמצע לא תכתוב אותה פעמיים
+        for row in rows:
+            try:
+                async with AsyncSessionLocal() as session:
+                    await session.execute(queries.score_add(), [row])
+                    await session.commit()
+                self.written += 1
+            except IntegrityError as e:
+                self.dropped += 1
+                logger.error(f"Dropping score deltas for user_id={row['user_id']}: {e.orig}")
+            del self._flushing[row["user_id"]]
+
+    async def flush(self):
+        async with self._lock:
+            if not self._pending:
+                return
+            self._flushing, self._pending = self._pending, {}
+            rows = [{"user_id": user_id, **dict(zip(FIELDS, deltas))} for user_id, deltas in self._flushing.items()]
+            self._generation += 1
+            try:
+                try:
+                    async with AsyncSessionLocal() as session:
+                        await session.execute(queries.score_add(), rows)
+                        await session.commit()
+                    self.written += len(rows)
+                except IntegrityError:
+                    logger.warning(f"Score flush of {len(rows)} users hit an integrity error; writing row by row")
+                    await self._write_rows(rows)
+            except Exception:
+                # הדלתות חוזרות לתור ונכתבות ב־flush הבא
+                logger.exception(f"Score flush of {len(self._flushing)} users failed; retrying next interval")
+                self._requeue(self._flushing)
+                return
+            except BaseException:
+                # ביטול באמצע (shutdown של הלולאה) – לא מאבדים את האצווה
+                self._requeue(self._flushing)
+                raise
+            finally:
+                self._flushing = {}
+                self._generation += 1
+            self.flushes += 1
+
+    async def get(self, user_id: int) -> dict[str, int]:
+        # בלי נעילה: קריאות לא מחכות זו לזו ולא ל־flush. אם commit התחיל או
+        # הסתיים בזמן הקריאה (generation זז) – ה־DB והצילום לא תואמים, קוראים שוב
+        for _ in range(3):
+            generation = self._generation
+            if generation % 2 == 0:
+                unflushed = [list(self._pending.get(user_id, ())), list(self._flushing.get(user_id, ()))]
+                async with AsyncSessionLocal() as session:
+                    row = (await session.execute(queries.score_for(user_id))).first()
+                if self._generation == generation:
+                    return self._merge(row, unflushed)
+            await asyncio.sleep(0)
+        async with self._lock:
+            unflushed = [self._pending.get(user_id)]
+            async with AsyncSessionLocal() as session:
+                row = (await session.execute(queries.score_for(user_id))).first()
+            return self._merge(row, unflushed)
+
+    @staticmethod
+    def _merge(row, unflushed: list) -> dict[str, int]:
+        totals = [value or 0 for value in row] if row is not None else [0] * len(FIELDS)
+        for deltas in unflushed:
+            for i, delta in enumerate(deltas or ()):
+                totals[i] += delta
+        return dict(zip(FIELDS, totals))
+
+score_counter = ScoreCounter(settings.SCORE_FLUSH_MS, settings.SCORE_MAX_PENDING)
+
+metrics.Gauge("score_pending_users", "Users with score increments not yet flushed",
+              fn=lambda: len(score_counter._pending))
+metrics.Counter("score_flushes_total", "Write-behind score flushes committed",
+                fn=lambda: score_counter.flushes)
+metrics.Counter("score_dropped_total", "Score rows dropped after an integrity error (e.g. unknown user_id)",
+                fn=lambda: score_counter.dropped)
@@ -0,0 +1,64 @@
+import re
+
+import queries
+
+# ─────────────────────────────────────────────────────────────
+# אינדקס FTS5 (SQLite) על Card.title ו־Shop.name.
+# external content: הטקסט נשאר בטבלאות המקור, triggers מסנכרנים
+# ─────────────────────────────────────────────────────────────
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS cards_fts USING fts5(title, content='cards', content_rowid='id')",
+    """CREATE TRIGGER IF NOT EXISTS cards_fts_ai AFTER INSERT ON cards BEGIN
+           INSERT INTO cards_fts(rowid, title) VALUES (new.id, new.title);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS cards_fts_ad AFTER DELETE ON cards BEGIN
+           INSERT INTO cards_fts(cards_fts, rowid, title) VALUES ('delete', old.id, old.title);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS cards_fts_au AFTER UPDATE OF title ON cards BEGIN
+           INSERT INTO cards_fts(cards_fts, rowid, title) VALUES ('delete', old.id, old.title);
+           INSERT INTO cards_fts(rowid, title) VALUES (new.id, new.title);
+       END""",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS shops_fts USING fts5(name, content='shops', content_rowid='id')",
+    """CREATE TRIGGER IF NOT EXISTS shops_fts_ai AFTER INSERT ON shops BEGIN
+           INSERT INTO shops_fts(rowid, name) VALUES (new.id, new.name);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS shops_fts_ad AFTER DELETE ON shops BEGIN
+           INSERT INTO shops_fts(shops_fts, rowid, name) VALUES ('delete', old.id, old.name);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS shops_fts_au AFTER UPDATE OF name ON shops BEGIN
+           INSERT INTO shops_fts(shops_fts, rowid, name) VALUES ('delete', old.id, old.name);
+           INSERT INTO shops_fts(rowid, name) VALUES (new.id, new.name);
+       END""",
+]
+
+def create_index(conn):
+    # נקרא מ־init_db; ב־Postgres אין FTS5 – search() נופל ל־ILIKE
+    if conn.dialect.name != "sqlite":
+        return
+    existed = conn.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'cards_fts'").first()
+    for ddl in SQLITE_DDL:
+        conn.exec_driver_sql(ddl)
+    if existed is None:
+        # DB קיים: אינדוקס השורות שנכתבו לפני שה־triggers היו
+        conn.exec_driver_sql("INSERT INTO cards_fts(cards_fts) VALUES ('rebuild')")
+        conn.exec_driver_sql("INSERT INTO shops_fts(shops_fts) VALUES ('rebuild')")
+
+MAX_TERMS = 8
+
+def match_expression(text: str) -> str | None:
+    # כל מילה כ־prefix במרכאות: קלט משתמש לא מתפרש כתחביר FTS
+    terms = re.findall(r"\w+", text)[:MAX_TERMS]
+    return " ".join(f'"{term}"*' for term in terms) or None
+
+async def search(session, text: str, limit: int) -> tuple[list, list]:
+    match = match_expression(text)
+    if match is None:
+        return [], []
+    if session.bind.dialect.name == "sqlite":
+        shops_stmt, cards_stmt = queries.search_shops(match, limit), queries.search_cards(match, limit)
+    else:
+        pattern = "%" + " ".join(re.findall(r"\w+", text)[:MAX_TERMS]) + "%"
+        shops_stmt, cards_stmt = queries.search_shops_like(pattern, limit), queries.search_cards_like(pattern, limit)
+    shops = (await session.execute(shops_stmt)).all()
+    cards = (await session.execute(cards_stmt)).all()
+    return shops, cards
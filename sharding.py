@@ -0,0 +1,320 @@
+import os
+import time
+import bisect
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+from collections import defaultdict
+
+import metrics
+import profiling
+
+logger = logging.getLogger("sharding")
+
+# ─────────────────────────────────────────────────────────────
+# הגדרות מה־env
+# ─────────────────────────────────────────────────────────────
+SHARD_VNODES        = int(os.getenv("SHARD_VNODES", "64"))          # נקודות לכל worker על הטבעת
+SHARD_HEARTBEAT     = float(os.getenv("SHARD_HEARTBEAT", "2"))
+SHARD_TIMEOUT       = float(os.getenv("SHARD_TIMEOUT", "10"))       # בלי heartbeat → worker מת
+SHARD_START_TIMEOUT = float(os.getenv("SHARD_START_TIMEOUT", "60"))
+
+# ─────────────────────────────────────────────────────────────
+# Consistent hashing: worker שנוסף/נופל מזיז רק את החלק שלו מהטוקנים
+# ─────────────────────────────────────────────────────────────
+class HashRing:
+    def __init__(self, vnodes: int = SHARD_VNODES):
+        self.vnodes = vnodes
+        self._points: list[int] = []
+        self._owners: list[int] = []
+        self.nodes: set[int] = set()
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+    def add(self, node: int):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for replica in range(self.vnodes):
+            point = self._hash(f"shard-{node}#{replica}")
+            i = bisect.bisect(self._points, point)
+            self._points.insert(i, point)
+            self._owners.insert(i, node)
+
+    def remove(self, node: int):
+        self.nodes.discard(node)
+        kept = [(p, n) for p, n in zip(self._points, self._owners) if n != node]
+        self._points = [p for p, _ in kept]
+        self._owners = [n for _, n in kept]
+
+    def node_for(self, key: str) -> int | None:
+        if not self._points:
+            return None
+        i = bisect.bisect(self._points, self._hash(key)) % len(self._points)
+        return self._owners[i]
+
+# ─────────────────────────────────────────────────────────────
+# Worker: תהליך עם לולאה ו־supervisor משלו. פקודות מה־Pipe:
+#   assign / release / stop;  בחזרה: health (heartbeat + עומס), released
+# ─────────────────────────────────────────────────────────────
+def worker_main(index: int, conn):
+    asyncio.run(_worker(index, conn))
+
+async def _heartbeat(index: int, conn, supervisor):
+    wall, cpu, updates = time.monotonic(), time.process_time(), supervisor.updates
+    while True:
+        now_wall, now_cpu = time.monotonic(), time.process_time()
+        elapsed = max(now_wall - wall, 1e-6)
+        conn.send({
+            "op": "health", "index": index, "pid": os.getpid(), "bots": supervisor.counts(),
+            "cpu": (now_cpu - cpu) / elapsed,
+            "updates_per_s": (supervisor.updates - updates) / elapsed,
+            "loop_lag_ms": profiling.monitor.last_lag * 1000,
+        })
+        wall, cpu, updates = now_wall, now_cpu, supervisor.updates
+        await asyncio.sleep(SHARD_HEARTBEAT)
+
+async def _worker(index: int, conn):
+    import bot_manager
+    bot_manager.DASHBOARD_PORT = 0   # ה־dashboard רץ בתהליך האב; /metrics שלו שואל את ה־workers (op=metrics)
+    # workers אחרים מוסיפים לאותם purchases.log – האינדקס קורא את הזנב בכל קריאה
+    from purchase_index import purchase_index
+    purchase_index.follow = True
+    supervisor = bot_manager.supervisor
+    profiling.monitor.start()
+
+    loop = asyncio.get_running_loop()
+    inbox: asyncio.Queue = asyncio.Queue()
+
+    def readable():
+        try:
+            inbox.put_nowait(conn.recv())
+        except (EOFError, OSError):
+            # האב נעלם – אין מי שינהל את הטוקנים, יוצאים
+            loop.remove_reader(conn.fileno())
+            inbox.put_nowait({"op": "stop"})
+
+    loop.add_reader(conn.fileno(), readable)
+    heartbeat = asyncio.create_task(_heartbeat(index, conn, supervisor))
+    starting: set[asyncio.Task] = set()
+    while True:
+        message = await inbox.get()
+        op = message["op"]
+        if op == "assign":
+            task = asyncio.create_task(supervisor.run(message["tokens"]))
+            starting.add(task)
+            task.add_done_callback(starting.discard)
+        elif op == "release":
+            await asyncio.gather(*(supervisor.remove(t) for t in message["tokens"]), return_exceptions=True)
+            conn.send({"op": "released", "tokens": message["tokens"]})
+        elif op == "metrics":
+            conn.send({"op": "metrics", "text": metrics.render()})
+        elif op == "stop":
+            break
+    heartbeat.cancel()
+    await asyncio.gather(*(supervisor.remove(t) for t in list(supervisor.state)), return_exceptions=True)
+
+# ─────────────────────────────────────────────────────────────
+# Parent: מריץ N workers, מחלק טוקנים לפי הטבעת ומאזן מחדש
+# כשה־worker נופל/חוזר או כשנרשם בוט חדש. טוקן שעובר worker
+# משוחרר קודם (ack) ורק אז מוקצה – שני getUpdates מקבילים = Conflict
+# ─────────────────────────────────────────────────────────────
+class _Worker:
+    __slots__ = ("index", "process", "conn", "last_seen", "ready", "health", "scrape")
+
+    def __init__(self, index: int, process, conn):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.last_seen = time.monotonic()
+        self.ready = False
+        self.health: dict = {}
+        self.scrape: asyncio.Future | None = None   # תשובה ל־op=metrics שעוד לא הגיעה
+
+class ShardRunner:
+    def __init__(self, size: int, mode: str = "polling"):
+        if mode == "webhook":
+            # כל worker היה צריך פורט ו־URL משלו; ה־gateway משרת תהליך אחד
+            raise RuntimeError("SHOP_BOT_SHARDS requires SHOP_BOT_MODE=polling")
+        self.size = size
+        self.tokens: set[str] = set()
+        self.owner: dict[str, int] = {}     # token → worker שמריץ אותו
+        self._moving: dict[str, int] = {}   # token → worker יעד, מחכה ל־released
+        self.workers: dict[int, _Worker] = {}
+        self.ring = HashRing()
+        self.restarts = 0
+        self._context = multiprocessing.get_context("spawn")
+        self._watchdog: asyncio.Task | None = None
+        self._booted = asyncio.Event()
+
+    async def start(self, tokens: list[str]):
+        self.tokens.update(tokens)
+        for index in range(self.size):
+            self._spawn(index)
+        self._watchdog = asyncio.create_task(self._watch())
+        metrics.SOURCES.append(self.scrape)
+        # חלוקה ראשונה רק כשכולם עלו – אחרת הראשון מקבל הכל ומשחרר אחר כך
+        try:
+            await asyncio.wait_for(self._booted.wait(), SHARD_START_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Not all shard workers came up in time; starting with "
+                           f"{len(self.ring.nodes)}/{self.size}")
+            self._booted.set()
+        self._rebalance()
+        logger.info(f"Sharded runner: {self.size} workers, {len(self.tokens)} shop bots")
+
+    def add(self, token: str):
+        self.tokens.add(token)
+        self._rebalance()
+
+    async def stop(self):
+        if self.scrape in metrics.SOURCES:
+            metrics.SOURCES.remove(self.scrape)
+        if self._watchdog is not None:
+            self._watchdog.cancel()
+        for worker in self.workers.values():
+            self._send(worker, {"op": "stop"})
+        for worker in self.workers.values():
+            await asyncio.to_thread(worker.process.join, SHARD_HEARTBEAT * 2)
+            if worker.process.is_alive():
+                worker.process.kill()
+
+    async def scrape(self) -> list[tuple[str, str]]:
+        # render() של כל worker חי; scrapes מקבילים חולקים את אותה בקשה,
+        # ו־worker שלא ענה תוך SHARD_HEARTBEAT פשוט חסר בפלט הזה
+        loop = asyncio.get_running_loop()
+        waiting = {}
+        for worker in self.workers.values():
+            if not worker.ready or not worker.process.is_alive():
+                continue
+            if worker.scrape is None or worker.scrape.done():
+                worker.scrape = loop.create_future()
+                self._send(worker, {"op": "metrics"})
+            waiting[worker.index] = worker.scrape
+        if not waiting:
+            return []
+        await asyncio.wait(waiting.values(), timeout=SHARD_HEARTBEAT)
+        return [(str(index), scrape.result()) for index, scrape in waiting.items() if scrape.done()]
+
+    # ── תהליכים ─────────────────────────────────────────────
+    def _spawn(self, index: int):
+        parent, child = self._context.Pipe()
+        process = self._context.Process(target=worker_main, args=(index, child),
+                                        name=f"shop-shard-{index}", daemon=True)
+        process.start()
+        child.close()
+        worker = self.workers[index] = _Worker(index, process, parent)
+        asyncio.get_running_loop().add_reader(parent.fileno(), self._readable, worker)
+
+    def _send(self, worker: _Worker, message: dict):
+        try:
+            worker.conn.send(message)
+        except (BrokenPipeError, OSError):
+            pass   # ה־watchdog יזהה את הנפילה
+
+    def _readable(self, worker: _Worker):
+        try:
+            message = worker.conn.recv()
+        except (EOFError, OSError):
+            asyncio.get_running_loop().remove_reader(worker.conn.fileno())
+            return
+        worker.last_seen = time.monotonic()
+        if message["op"] == "health":
+            worker.health = message
+            if not worker.ready:
+                worker.ready = True
+                self.ring.add(worker.index)
+                if self._booted.is_set():
+                    self._rebalance()
+                elif len(self.ring.nodes) == self.size:
+                    self._booted.set()
+        elif message["op"] == "released":
+            self._released(worker, message["tokens"])
+        elif message["op"] == "metrics":
+            if worker.scrape is not None and not worker.scrape.done():
+                worker.scrape.set_result(message["text"])
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(SHARD_HEARTBEAT)
+            now = time.monotonic()
+            for worker in list(self.workers.values()):
+                silent = now - worker.last_seen > (SHARD_TIMEOUT if worker.ready else SHARD_START_TIMEOUT)
+                if not worker.process.is_alive() or silent:
+                    self._failed(worker)
+
+    def _failed(self, worker: _Worker):
+        logger.warning(f"Shard worker {worker.index} (pid {worker.process.pid}) is down "
+                       f"(exit code {worker.process.exitcode}); rebalancing")
+        try:
+            asyncio.get_running_loop().remove_reader(worker.conn.fileno())
+        except (ValueError, OSError):
+            pass
+        if worker.process.is_alive():
+            worker.process.kill()
+        worker.conn.close()
+        self.ring.remove(worker.index)
+        # הטוקנים שלו (כולל כאלה שחיכו לשחרור) פנויים מיד
+        for token in [t for t, owner in self.owner.items() if owner == worker.index]:
+            del self.owner[token]
+            self._moving.pop(token, None)
+        self._rebalance()
+        self.restarts += 1
+        self._spawn(worker.index)
+
+    # ── חלוקה ───────────────────────────────────────────────
+    def _rebalance(self):
+        assign, release = defaultdict(list), defaultdict(list)
+        for token in self.tokens:
+            target = self.ring.node_for(token)
+            current = self.owner.get(token)
+            if target is None or current == target:
+                self._moving.pop(token, None)
+                continue
+            if current is None:
+                self.owner[token] = target
+                assign[target].append(token)
+            elif token in self._moving:
+                self._moving[token] = target   # release כבר נשלח
+            else:
+                self._moving[token] = target
+                release[current].append(token)
+        for index, tokens in release.items():
+            self._send(self.workers[index], {"op": "release", "tokens": tokens})
+        for index, tokens in assign.items():
+            self._send(self.workers[index], {"op": "assign", "tokens": tokens})
+
+    def _released(self, worker: _Worker, tokens: list[str]):
+        assign = defaultdict(list)
+        for token in tokens:
+            if self.owner.get(token) == worker.index:
+                del self.owner[token]
+            target = self._moving.pop(token, None)
+            if target is not None and target in self.ring.nodes:
+                self.owner[token] = target
+                assign[target].append(token)
+        for index, batch in assign.items():
+            self._send(self.workers[index], {"op": "assign", "tokens": batch})
+        if any(token not in self.owner for token in tokens):
+            self._rebalance()
+
+    def worker_health(self, field: str) -> dict:
+        return {str(i): w.health.get(field, 0) for i, w in self.workers.items() if w.health}
+
+    def stats(self) -> dict:
+        per_worker = defaultdict(int)
+        for owner in self.owner.values():
+            per_worker[owner] += 1
+        return {
+            "workers": {
+                index: {"pid": w.process.pid, "alive": w.process.is_alive(), "ready": w.ready,
+                        "assigned": per_worker[index], **{k: v for k, v in w.health.items() if k not in ("op", "index")}}
+                for index, w in self.workers.items()
+            },
+            "tokens": len(self.tokens),
+            "moving": len(self._moving),
+            "restarts": self.restarts,
+        }
@@ -19,14 +19,19 @@ from telegram.ext import (
     ContextTypes
 )
 
+from purchase_index import purchase_index
+from storage import storage
+from shop_catalog import shop_catalog, parse_offset
+import conversation_store
+import logging_config
+import metrics
+from conversation_store import ConversationStore
+from idempotency import SingleFlight
+
 # ─────────────────────────────────────────────────────────────
 # הגדרות וסידור לוגים
 # ─────────────────────────────────────────────────────────────
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO,
-    handlers=[logging.StreamHandler()],
-)
+logging_config.setup()
 logger = logging.getLogger(__name__)
 
 # ─────────────────────────────────────────────────────────────
@@ -46,15 +51,12 @@ ADMIN_ID = int(os.getenv("TELEGRAM_ADMIN_ID", "0"))
     PURCHASE_WAIT
 ) = range(6)
 
-# In-memory storage זמני לרישומי Upload
-_upload_sessions: dict[int, dict] = {}
+# מצב זמני לרישומי Upload (TTL + תקרה, אופציונלית על SQLite)
+_upload_sessions = ConversationStore("upload", backend=conversation_store.backend())
 
 # ─────────────────────────────────────────────────────────────
 # Helpers ליצירת ספריות
 # ─────────────────────────────────────────────────────────────
-def ensure_dirs(path: str):
-    os.makedirs(path, exist_ok=True)
-
 def shop_dir(name: str) -> str:
     return os.path.join("shops", name)
 
@@ -64,6 +66,14 @@ def card_dir(shop: str) -> str:
 def purchases_dir(shop: str, card_id: str) -> str:
     return os.path.join(shop_dir(shop), "purchases", card_id)
 
+async def write_purchase(shop: str, card_id: str, uid: int) -> str:
+    token = str(uuid.uuid4())
+    folder = purchases_dir(shop, card_id)
+    await storage.makedirs(folder)
+    await storage.write_text(os.path.join(folder, f"{uid}.token"), token)
+    await purchase_index.record(shop, card_id, uid, token)
+    return token
+
 # ─────────────────────────────────────────────────────────────
 # תפריט ראשי דינמי (Admin vs Customer)
 # ─────────────────────────────────────────────────────────────
@@ -96,6 +106,14 @@ async def show_menu(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 # ─────────────────────────────────────────────────────────────
 # Callback לניווט בתפריטים ולביצוע פעולות
 # ─────────────────────────────────────────────────────────────
+CALLBACK_PREFIXES = (
+    "switch_admin", "switch_customer", "admin_launch", "admin_sales", "cust_browse",
+    "sp:", "cp:", "shop_", "buy_", "cust_tokens",
+)
+
+purchase_flight = SingleFlight("shop", "buy")
+
+@metrics.timed_callback("shop", CALLBACK_PREFIXES)
 async def callback_menu(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -112,65 +130,48 @@ async def callback_menu(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     # Admin: השקה מחדש של כל ה־Shop Bots
     if key == "admin_launch" and is_admin:
         # פה אפשר להתקשר ל־bot_manager.main() במידת הצורך
+        shop_catalog.invalidate()   # חנויות/קלפים שנוספו לעץ מופיעים מיד
         return await query.edit_message_text("✅ All Shop Bots launched.")
 
     # Admin: סיכום מכירות לכל חנות
     if key == "admin_sales" and is_admin:
-        lines = []
-        root = "shops"
-        if os.path.isdir(root):
-            for shop in os.listdir(root):
-                sales_root = os.path.join(root, shop, "purchases")
-                count = 0
-                if os.path.isdir(sales_root):
-                    for card in os.listdir(sales_root):
-                        folder = os.path.join(sales_root, card)
-                        count += len(os.listdir(folder))
-                lines.append(f"{shop}: {count} sales")
+        lines = [f"{shop}: {count} sales" for shop, count in (await purchase_index.sales()).items()]
         text = "\n".join(lines) or "אין מכירות עדיין."
         return await query.edit_message_text(text)
 
     # Customer: גלישה בחנויות
     if key == "cust_browse":
-        buttons = []
-        for shop in os.listdir("shops"):
-            buttons.append([InlineKeyboardButton(shop, callback_data=f"shop_{shop}")])
-        kb = InlineKeyboardMarkup(buttons)
+        return await query.edit_message_text("בחר חנות:", reply_markup=await shop_catalog.shops_keyboard())
+
+    # דפדוף בין עמודים: sp:<offset> חנויות, cp:<offset>:<shop> קלפים
+    if key.startswith("sp:"):
+        kb = await shop_catalog.shops_keyboard(parse_offset(key[3:]))
         return await query.edit_message_text("בחר חנות:", reply_markup=kb)
+    if key.startswith("cp:") and key.count(":") >= 2:
+        _, offset, shop = key.split(":", 2)
+        kb = await shop_catalog.cards_keyboard(shop, parse_offset(offset))
+        return await query.edit_message_text(f"📋 קלפים ב־{shop}:", reply_markup=kb)
 
     # Customer: הצגת קלפים בחנות
     if key.startswith("shop_"):
         shop = key.split("_",1)[1]
-        cards = os.listdir(card_dir(shop))
-        buttons = [[InlineKeyboardButton(c.split(".")[0], callback_data=f"buy_{shop}_{c.split('.')[0]}")] for c in cards]
-        kb = InlineKeyboardMarkup(buttons)
-        return await query.edit_message_text(f"📋 קלפים ב־{shop}:", reply_markup=kb)
+        return await query.edit_message_text(f"📋 קלפים ב־{shop}:", reply_markup=await shop_catalog.cards_keyboard(shop))
 
     # Customer: רכישת קלף ויצירת NFT Token
     if key.startswith("buy_"):
         _, shop, card_id = key.split("_",2)
-        token = str(uuid.uuid4())
-        folder = purchases_dir(shop, card_id)
-        ensure_dirs(folder)
-        token_path = os.path.join(folder, f"{uid}.token")
-        with open(token_path, "w") as f:
-            f.write(token)
+        # כל הבוטים חולקים את shops/ ואת ה־flight; message_id ייחודי רק בצ'אט של בוט אחד
+        message = query.message.message_id if query.message else query.inline_message_id
+        token, first = await purchase_flight.run((ctx.bot.id, uid, shop, card_id, message),
+                                                 lambda: write_purchase(shop, card_id, uid))
+        if not first:
+            return   # הלחיצה הראשונה כבר מעדכנת את ההודעה
         text = f"✅ רכישה בוצעה!\nYour NFT-Token: `{token}`"
         return await query.edit_message_text(text, parse_mode="Markdown")
 
     # Customer: הצגת ה־Tokens שברשותו
     if key == "cust_tokens":
-        lines = []
-        root = "shops"
-        for shop in os.listdir(root):
-            sales_root = os.path.join(root, shop, "purchases")
-            if not os.path.isdir(sales_root):
-                continue
-            for card in os.listdir(sales_root):
-                tf = os.path.join(sales_root, card, f"{uid}.token")
-                if os.path.isfile(tf):
-                    token = open(tf).read().strip()
-                    lines.append(f"{shop}/{card}: `{token}`")
+        lines = [f"{shop}/{card}: `{token}`" for shop, card, token in await purchase_index.tokens_for(uid)]
         text = "\n".join(lines) or "אין לך NFT-Tokens."
         return await query.edit_message_text(text, parse_mode="Markdown")
 
@@ -0,0 +1,112 @@
+import os
+import time
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from catalog import PAGE_SIZE, b36, parse_id
+from storage import storage
+import metrics
+
+SHOPS_ROOT  = "shops"
+CATALOG_TTL = float(os.getenv("CATALOG_TTL", "60"))   # העץ יכול להשתנות גם מבחוץ (העתקת קבצים)
+
+# ─────────────────────────────────────────────────────────────
+# Snapshot של תיקייה אחת בעץ shops/: רשימה ממוינת + מקלדת לכל עמוד
+# (נבנית בפעם הראשונה שמבקשים אותה)
+# ─────────────────────────────────────────────────────────────
+class _Listing:
+    __slots__ = ("names", "pages", "expires")
+
+    def __init__(self, names: list[str], ttl: float):
+        self.names = sorted(names)
+        self.pages: dict[int, InlineKeyboardMarkup] = {}
+        self.expires = time.monotonic() + ttl
+
+def _nav_row(names: list[str], offset: int, callback) -> list[list[InlineKeyboardButton]]:
+    # callback_data: sp:<offset> / cp:<offset>:<shop>, offset ב־base36
+    nav = []
+    if offset > 0:
+        nav.append(InlineKeyboardButton("◀️", callback_data=callback(max(0, offset - PAGE_SIZE))))
+    if offset + PAGE_SIZE < len(names):
+        nav.append(InlineKeyboardButton("▶️", callback_data=callback(offset + PAGE_SIZE)))
+    return [nav] if nav else []
+
+def parse_offset(text: str) -> int:
+    return parse_id(text) or 0
+
+def _page(listing: _Listing, offset: int) -> int:
+    # offset מ־callback_data: רק תחילת עמוד קיים נשמרת ב־pages (אחרת כל offset = מקלדת חדשה)
+    if offset < 0 or offset >= len(listing.names) or offset % PAGE_SIZE:
+        return 0
+    return offset
+
+# ─────────────────────────────────────────────────────────────
+# Snapshot של עץ shops/ עם מקלדות מוכנות: רשימת חנויות + קלפים לכל חנות.
+# invalidate() פוסל חנות אחת או הכול; TTL מכסה שינויים מחוץ לתהליך
+# ─────────────────────────────────────────────────────────────
+class ShopCatalog:
+    def __init__(self, root: str = SHOPS_ROOT, ttl: float = CATALOG_TTL):
+        self.root = root
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._shops: _Listing | None = None
+        self._cards: dict[str, _Listing] = {}
+        self._generation = 0
+
+    def _fresh(self, listing: _Listing | None) -> _Listing | None:
+        if listing is not None and listing.expires >= time.monotonic():
+            self.hits += 1
+            return listing
+        self.misses += 1
+        return None
+
+    async def shops_keyboard(self, offset: int = 0) -> InlineKeyboardMarkup:
+        listing = self._fresh(self._shops)
+        if listing is None:
+            generation = self._generation
+            listing = _Listing(await storage.listdir(self.root), self.ttl)
+            if generation == self._generation:
+                self._shops = listing
+        offset = _page(listing, offset)
+        kb = listing.pages.get(offset)
+        if kb is None:
+            kb = listing.pages[offset] = InlineKeyboardMarkup([
+                *[[InlineKeyboardButton(shop, callback_data=f"shop_{shop}")]
+                  for shop in listing.names[offset:offset + PAGE_SIZE]],
+                *_nav_row(listing.names, offset, lambda o: f"sp:{b36(o)}"),
+            ])
+        return kb
+
+    async def cards_keyboard(self, shop: str, offset: int = 0) -> InlineKeyboardMarkup:
+        listing = self._fresh(self._cards.get(shop))
+        if listing is None:
+            generation = self._generation
+            listing = _Listing(await storage.listdir(os.path.join(self.root, shop, "cards")), self.ttl)
+            if generation == self._generation:
+                self._cards[shop] = listing
+        offset = _page(listing, offset)
+        kb = listing.pages.get(offset)
+        if kb is None:
+            cards = [c.split(".")[0] for c in listing.names[offset:offset + PAGE_SIZE]]
+            kb = listing.pages[offset] = InlineKeyboardMarkup([
+                *[[InlineKeyboardButton(c, callback_data=f"buy_{shop}_{c}")] for c in cards],
+                *_nav_row(listing.names, offset, lambda o: f"cp:{b36(o)}:{shop}"),
+            ])
+        return kb
+
+    def invalidate(self, shop: str | None = None):
+        self._generation += 1
+        self._shops = None
+        if shop is None:
+            self._cards.clear()
+        else:
+            self._cards.pop(shop, None)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "shops": len(self._cards)}
+
+shop_catalog = ShopCatalog()
+
+metrics.Counter("shop_catalog_cache_requests_total", "shops/ tree listing lookups by result", ("result",),
+                fn=lambda: {"hit": shop_catalog.hits, "miss": shop_catalog.misses})
@@ -0,0 +1,103 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("storage")
+
+STORAGE_WORKERS = int(os.getenv("STORAGE_WORKERS", "8"))
+STORAGE_SLOW_MS = float(os.getenv("STORAGE_SLOW_MS", "200"))
+
+# ─────────────────────────────────────────────────────────────
+# סטטיסטיקת latency לכל סוג פעולה (כולל המתנה בתור ה־pool)
+# ─────────────────────────────────────────────────────────────
+class OpStats:
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def as_dict(self) -> dict:
+        avg = self.total / self.count if self.count else 0.0
+        return {"count": self.count, "avg_ms": avg * 1000, "max_ms": self.max * 1000}
+
+# ─────────────────────────────────────────────────────────────
+# I/O חוסם של מערכת הקבצים → thread pool חסום בגודלו,
+# כך שדיסק איטי לא עוצר את הלולאה המשותפת לכל הבוטים
+# ─────────────────────────────────────────────────────────────
+class AsyncStorage:
+    def __init__(self, workers: int):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="storage")
+        self.stats: dict[str, OpStats] = {}
+
+    async def run(self, op: str, fn, *args):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stats.setdefault(op, OpStats()).add(elapsed)
+            if elapsed * 1000 > STORAGE_SLOW_MS:
+                logger.warning(f"Slow storage op {op}: {elapsed * 1000:.0f}ms")
+
+    async def listdir(self, path: str) -> list[str]:
+        return await self.run("listdir", os.listdir, path)
+
+    async def isdir(self, path: str) -> bool:
+        return await self.run("isdir", os.path.isdir, path)
+
+    async def isfile(self, path: str) -> bool:
+        return await self.run("isfile", os.path.isfile, path)
+
+    async def makedirs(self, path: str):
+        await self.run("makedirs", _makedirs, path)
+
+    async def read_text(self, path: str) -> str:
+        return await self.run("read", _read_text, path)
+
+    async def write_text(self, path: str, text: str):
+        await self.run("write", _write, path, "w", text)
+
+    async def append_text(self, path: str, text: str):
+        await self.run("append", _write, path, "a", text)
+
+    async def write_bytes(self, path: str, data: bytes):
+        await self.run("write", _write, path, "wb", data)
+
+    async def dump_json(self, path: str, obj):
+        await self.run("dump_json", _dump_json, path, obj)
+
+    def report(self) -> dict[str, dict]:
+        return {op: stats.as_dict() for op, stats in self.stats.items()}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+def _makedirs(path: str):
+    os.makedirs(path, exist_ok=True)
+
+def _read_text(path: str) -> str:
+    with open(path, encoding="utf-8") as fp:
+        return fp.read()
+
+def _write(path: str, mode: str, data):
+    encoding = None if "b" in mode else "utf-8"
+    with open(path, mode, encoding=encoding) as fp:
+        fp.write(data)
+
+def _dump_json(path: str, obj):
+    with open(path, "w", encoding="utf-8") as fp:
+        json.dump(obj, fp, ensure_ascii=False, indent=2)
+
+storage = AsyncStorage(STORAGE_WORKERS)
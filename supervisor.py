@@ -0,0 +1,280 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+
+import httpx
+from telegram import Update
+from telegram.ext import TypeHandler
+
+from storage import storage
+from http_pool import pool
+from outbound import scheduler, NOTIFY
+import metrics
+
+logger = logging.getLogger("supervisor")
+
+# ─────────────────────────────────────────────────────────────
+# הגדרות מה־env
+# ─────────────────────────────────────────────────────────────
+BOT_START_CONCURRENCY = int(os.getenv("BOT_START_CONCURRENCY", "20"))       # launch במקביל באתחול
+BOT_IDLE_HIBERNATE    = float(os.getenv("BOT_IDLE_HIBERNATE", "259200"))    # שניות בלי עדכון; 0 = אף פעם
+BOT_IDLE_SWEEP        = float(os.getenv("BOT_IDLE_SWEEP", "300"))
+# polling: getWebhookInfo לבוטים רדומים – כל BOT_WAKE_SWEEP שניות לבוט שנרדם עכשיו,
+# המרווח מוכפל בכל בדיקה ריקה עד BOT_WAKE_MAX_INTERVAL; לכל התהליך לכל היותר
+# BOT_WAKE_RATE בדיקות לשנייה (1,000 בוטים רדומים ≠ 66 בקשות/שנייה לנצח)
+BOT_WAKE_SWEEP        = float(os.getenv("BOT_WAKE_SWEEP", "15"))
+BOT_WAKE_MAX_INTERVAL = float(os.getenv("BOT_WAKE_MAX_INTERVAL", "300"))
+BOT_WAKE_RATE         = float(os.getenv("BOT_WAKE_RATE", "20"))
+BOT_WAKE_CONCURRENCY  = int(os.getenv("BOT_WAKE_CONCURRENCY", "20"))
+
+PENDING, STARTING, ACTIVE, HIBERNATING, FAILED = "pending", "starting", "active", "hibernating", "failed"
+STATES = (PENDING, STARTING, ACTIVE, HIBERNATING, FAILED)
+
+def _merge_json(path: str, entries: dict):
+    try:
+        with open(path, encoding="utf-8") as fp:
+            merged = json.load(fp)
+    except (OSError, ValueError):
+        merged = {}
+    merged.update(entries)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fp:
+        json.dump(merged, fp)
+    os.replace(tmp, path)
+
+HIBERNATIONS = metrics.Counter("shop_bot_hibernations_total", "Shop bots stopped for inactivity")
+WAKES = metrics.Counter("shop_bot_wakes_total", "Hibernated shop bots reactivated")
+WAKE_CHECKS = metrics.Counter("shop_bot_wake_checks_total", "getWebhookInfo checks of hibernated shop bots",
+                              ("outcome",))
+
+# ─────────────────────────────────────────────────────────────
+# Supervisor לבוטי החנויות:
+#   • אתחול ב־Semaphore (לא gather על כולם) + דיווח מוכנות
+#   • בוט בלי עדכונים מעבר לסף נכבה (hibernate) ומשחרר חיבורים וזיכרון
+#   • התעוררות: webhook – ה־gateway מעיר בעדכון הראשון;
+#     polling – סריקת getWebhookInfo (pending_update_count) לבוטים רדומים
+# launch/stop מוזרקים מ־bot_manager (אין כאן ידע על Application)
+# ─────────────────────────────────────────────────────────────
+class ShopBotSupervisor:
+    def __init__(self, launch, stop, mode: str, api_url: str, activity_path: str):
+        self._launch = launch   # async (token, wake) → Application
+        self._stop = stop       # async (token) → None
+        self.mode = mode
+        self.api_url = api_url
+        self.activity_path = activity_path
+        self.state: dict[str, str] = {}
+        self.last_active: dict[str, float] = {}
+        self.errors: dict[str, str] = {}
+        self.updates = 0
+        self.boot_seconds: float | None = None
+        self.first_ready: float | None = None
+        self._boot_started = 0.0
+        self._waking: dict[str, asyncio.Task] = {}
+        self._sweepers: list[asyncio.Task] = []
+        self._wake_due: dict[str, tuple[float, float]] = {}   # token → (בדיקה הבאה, מרווח נוכחי)
+
+    # ── מעקב פעילות ─────────────────────────────────────────
+    def track(self, app, token: str):
+        async def touched(update, ctx):
+            self.last_active[token] = time.time()
+            self.updates += 1
+        # group נפרד: רץ לפני ה־handlers הרגילים ולא עוצר אותם
+        app.add_handler(TypeHandler(Update, touched), group=-1)
+
+    def _idle(self, token: str, now: float) -> bool:
+        return bool(BOT_IDLE_HIBERNATE) and now - self.last_active.setdefault(token, now) > BOT_IDLE_HIBERNATE
+
+    async def _load_activity(self):
+        if self._boot_started:
+            return
+        try:
+            self.last_active.update(json.loads(await storage.read_text(self.activity_path)))
+        except (OSError, ValueError):
+            pass
+
+    async def _save_activity(self):
+        # כמה workers (sharding) כותבים לאותו קובץ: מיזוג, כל אחד מעדכן רק את שלו
+        await storage.run("activity_save", _merge_json, self.activity_path, dict(self.last_active))
+
+    # ── אתחול ───────────────────────────────────────────────
+    async def run(self, tokens: list[str]):
+        # אפשר לקרוא שוב עם אצווה נוספת (worker ב־sharding מקבל tokens בהמשך)
+        await self._load_activity()
+        now = time.time()
+        self._boot_started = time.monotonic()
+        pending = []
+        for token in tokens:
+            if self._idle(token, now):
+                await self._hibernate_at_boot(token)
+            else:
+                self.state[token] = PENDING
+                pending.append(token)
+
+        gate = asyncio.Semaphore(BOT_START_CONCURRENCY)
+        await asyncio.gather(*(self._start(token, gate, len(pending)) for token in pending))
+        self.boot_seconds = time.monotonic() - self._boot_started
+        counts = self.counts()
+        logger.info(f"Shop bots ready in {self.boot_seconds:.1f}s: {counts[ACTIVE]} active, "
+                    f"{counts[HIBERNATING]} hibernating, {counts[FAILED]} failed")
+        await self._save_activity()
+        self.ensure_sweepers()
+
+    async def _start(self, token: str, gate: asyncio.Semaphore, total: int):
+        async with gate:
+            if token not in self.state:
+                return   # remove() בזמן שחיכה בתור
+            self.state[token] = STARTING
+            try:
+                await self._launch(token, False)
+            except Exception as e:
+                self.state[token] = FAILED
+                self.errors[token] = repr(e)
+                logger.warning(f"Shop bot {token[:8]}… failed to start: {e!r}")
+                return
+            if token not in self.state:
+                # remove() הגיע באמצע ה־launch (הטוקן עבר worker)
+                await self._stop(token)
+                return
+            self.state[token] = ACTIVE
+            if self.first_ready is None:
+                self.first_ready = time.monotonic() - self._boot_started
+            done = sum(1 for s in self.state.values() if s in (ACTIVE, FAILED))
+            if total >= 10 and done % (total // 10) == 0:
+                logger.info(f"Shop bots starting: {done}/{total}")
+
+    async def _hibernate_at_boot(self, token: str):
+        self.state[token] = HIBERNATING
+        self._schedule_check(token, BOT_WAKE_SWEEP, jitter=True)
+        if self.mode == "webhook":
+            # ה־webhook כבר רשום אצל Telegram מהריצה הקודמת – רק route רדום
+            await self._stop(token)
+
+    async def add(self, token: str):
+        # הרשמה חדשה: עולה מיד, בלי לחכות בתור האתחול
+        self.last_active[token] = time.time()
+        self.state[token] = PENDING
+        await self._start(token, asyncio.Semaphore(1), 1)
+        self.ensure_sweepers()
+
+    async def remove(self, token: str):
+        # הבוט עובר ל־worker אחר: עוצרים בלי לסמן כרדום
+        self._waking.pop(token, None)
+        self._wake_due.pop(token, None)
+        self.last_active.pop(token, None)
+        if self.state.pop(token, None) is not None:
+            await self._stop(token)
+
+    def counts(self) -> dict[str, int]:
+        counts = dict.fromkeys(STATES, 0)
+        for state in self.state.values():
+            counts[state] += 1
+        return counts
+
+    def readiness(self) -> dict:
+        counts = self.counts()
+        return {
+            "ready": not counts[PENDING] and not counts[STARTING] and self.boot_seconds is not None,
+            "boot_seconds": self.boot_seconds,
+            "first_ready_seconds": self.first_ready,
+            **counts,
+            "failed_tokens": {token[:8]: error for token, error in self.errors.items()},
+        }
+
+    # ── hibernate / wake ────────────────────────────────────
+    async def hibernate(self, token: str):
+        self.state[token] = HIBERNATING
+        self._schedule_check(token, BOT_WAKE_SWEEP)
+        try:
+            await self._stop(token)
+        except Exception as e:
+            logger.warning(f"Shop bot {token[:8]}… did not stop cleanly: {e!r}")
+        HIBERNATIONS.inc()
+        logger.info(f"Shop bot {token[:8]}… hibernated")
+
+    async def wake(self, token: str):
+        # כמה עדכונים בבת אחת → launch אחד
+        task = self._waking.get(token)
+        if task is None:
+            task = self._waking[token] = asyncio.create_task(self._wake(token))
+            task.add_done_callback(lambda _: self._waking.pop(token, None))
+        return await asyncio.shield(task)
+
+    async def _wake(self, token: str):
+        started = time.monotonic()
+        self.state[token] = STARTING
+        try:
+            app = await self._launch(token, True)
+        except Exception:
+            self.state[token] = HIBERNATING
+            raise
+        self.state[token] = ACTIVE
+        self.last_active[token] = time.time()
+        self._wake_due.pop(token, None)
+        WAKES.inc()
+        logger.info(f"Shop bot {token[:8]}… woke in {(time.monotonic() - started) * 1000:.0f} ms")
+        return app
+
+    # ── סריקות רקע ──────────────────────────────────────────
+    def ensure_sweepers(self):
+        if any(not task.done() for task in self._sweepers):
+            return
+        self._sweepers = [asyncio.create_task(self._idle_sweep())]
+        if self.mode != "webhook":
+            self._sweepers.append(asyncio.create_task(self._wake_sweep()))
+
+    async def _idle_sweep(self):
+        while True:
+            await asyncio.sleep(BOT_IDLE_SWEEP)
+            now = time.time()
+            for token in [t for t, s in self.state.items() if s == ACTIVE and self._idle(t, now)]:
+                await self.hibernate(token)
+            await self._save_activity()
+
+    def _schedule_check(self, token: str, interval: float, jitter: bool = False):
+        # jitter: הרבה בוטים שנרדמו יחד (אתחול) לא נבדקים באותה שנייה
+        delay = random.uniform(0, interval) if jitter else interval
+        self._wake_due[token] = (time.monotonic() + delay, interval)
+
+    async def _check(self, token: str, gate: asyncio.Semaphore):
+        async with gate:
+            # דרך ה־scheduler היוצא (bucket של הבוט, נתיב notify) וה־pool המשותף של http_pool
+            await scheduler.acquire(token.split(":", 1)[0], NOTIFY)
+            try:
+                response = await pool.request("POST", f"{self.api_url}{token}/getWebhookInfo", timeout=10)
+                pending = int(response.json()["result"].get("pending_update_count", 0))
+                outcome = "pending" if pending else "idle"
+            except (httpx.HTTPError, ValueError, KeyError):
+                pending, outcome = 0, "error"
+        WAKE_CHECKS.inc(outcome)
+        if self.state.get(token) != HIBERNATING:
+            return   # remove() / wake בזמן הבדיקה
+        if not pending:
+            _, interval = self._wake_due.get(token, (0, BOT_WAKE_SWEEP))
+            self._schedule_check(token, min(interval * 2, BOT_WAKE_MAX_INTERVAL))
+            return
+        # מעירים מיד, בלי לחכות לסוף הסבב
+        try:
+            await self.wake(token)
+        except Exception as e:
+            logger.warning(f"Shop bot {token[:8]}… failed to wake: {e!r}")
+            self._schedule_check(token, BOT_WAKE_SWEEP)
+
+    async def _wake_sweep(self):
+        # בקשה קצרה אחת לבוט רדום שהגיע תורו – במקום long-poll פתוח לכל אחד.
+        # כל שנייה: לכל היותר BOT_WAKE_RATE בדיקות, המאחרות ביותר קודם
+        gate = asyncio.Semaphore(BOT_WAKE_CONCURRENCY)
+        checks: set[asyncio.Task] = set()
+        while True:
+            await asyncio.sleep(1.0)
+            now = time.monotonic()
+            due = sorted((when, token) for token, (when, _) in self._wake_due.items()
+                         if when <= now and self.state.get(token) == HIBERNATING)
+            for _, token in due[:max(1, int(BOT_WAKE_RATE))]:
+                # עד שהבדיקה חוזרת הבוט לא נבחר שוב
+                self._wake_due[token] = (float("inf"), self._wake_due[token][1])
+                task = asyncio.create_task(self._check(token, gate))
+                checks.add(task)
+                task.add_done_callback(checks.discard)
@@ -0,0 +1,123 @@
+import os
+import hmac
+import asyncio
+import hashlib
+import logging
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from telegram import Update
+
+from logging_config import register_secret
+import metrics
+
+logger = logging.getLogger("webhook_gateway")
+
+# ─────────────────────────────────────────────────────────────
+# הגדרות ה־gateway מה־env
+# ─────────────────────────────────────────────────────────────
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "").rstrip("/")
+WEBHOOK_HOST     = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT     = int(os.getenv("WEBHOOK_PORT", "8443"))
+
+# route key → (Application, secret_token); בוטים רדומים: route key → (wake, secret_token)
+_routes: dict[str, tuple] = {}
+_parked: dict[str, tuple] = {}
+_server_task: asyncio.Task | None = None
+
+app = FastAPI(title="NFTII Shop Bots Gateway")
+
+metrics.Gauge("webhook_bots_attached", "Shop bots routed through the webhook gateway", fn=lambda: len(_routes))
+metrics.Gauge("webhook_bots_parked", "Hibernated shop bots waiting for their next update", fn=lambda: len(_parked))
+
+# ─────────────────────────────────────────────────────────────
+# Helpers: נתיב וסוד לכל טוקן (הטוקן עצמו לא מופיע ב־URL)
+# ─────────────────────────────────────────────────────────────
+def route_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()[:32]
+
+def webhook_path(token: str) -> str:
+    return f"/tg/{route_key(token)}"
+
+def secret_token(token: str) -> str:
+    return hmac.new(token.encode(), b"webhook", hashlib.sha256).hexdigest()
+
+# ─────────────────────────────────────────────────────────────
+# קבלת עדכון → העברה ל־update_queue של הבוט המתאים
+# ─────────────────────────────────────────────────────────────
+@app.post("/tg/{key}")
+async def receive_update(key: str, request: Request):
+    route = _routes.get(key)
+    parked = _parked.get(key) if route is None else None
+    if route is None and parked is None:
+        return Response(status_code=404)
+    secret = (route or parked)[1]
+    header = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not hmac.compare_digest(header, secret):
+        return Response(status_code=403)
+    # גוף שאינו JSON / אובייקט → 400 (500 גורם ל־Telegram לשלוח את אותו עדכון שוב ושוב)
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        logger.warning(f"Dropping webhook update for route {key}: body is not a JSON object")
+        return Response(status_code=400)
+    # בוט רדום: מעירים אותו (attach מחזיר את ה־route) ואז מעבירים את העדכון
+    bot_app = route[0] if route is not None else await parked[0]()
+
+    try:
+        update = Update.de_json(data, bot_app.bot)
+    except Exception as e:   # שדה בטיפוס לא צפוי נכשל עמוק ב־PTB (TypeError/AttributeError/…)
+        logger.warning(f"Dropping malformed webhook update for route {key}: {e!r}")
+        return Response(status_code=400)
+    await bot_app.update_queue.put(update)
+    return Response(status_code=200)
+
+# ─────────────────────────────────────────────────────────────
+# רישום בוט ב־gateway והגדרת ה־webhook מול Telegram
+# ─────────────────────────────────────────────────────────────
+async def attach(bot_app, token: str, set_webhook: bool = True):
+    if not WEBHOOK_BASE_URL:
+        raise RuntimeError("WEBHOOK_BASE_URL is required in webhook mode")
+    ensure_server()
+    secret = secret_token(token)
+    register_secret(secret)
+    _routes[route_key(token)] = (bot_app, secret)
+    _parked.pop(route_key(token), None)
+    if not set_webhook:
+        return
+    await bot_app.bot.set_webhook(
+        url=f"{WEBHOOK_BASE_URL}{webhook_path(token)}",
+        secret_token=secret,
+        allowed_updates=Update.ALL_TYPES,
+    )
+
+async def detach(bot_app, token: str):
+    _routes.pop(route_key(token), None)
+    await bot_app.bot.delete_webhook()
+
+def park(token: str, wake):
+    # ה־webhook נשאר אצל Telegram; העדכון הבא קורא ל־wake() שמחזיר Application
+    ensure_server()
+    secret = secret_token(token)
+    register_secret(secret)
+    _routes.pop(route_key(token), None)
+    _parked[route_key(token)] = (wake, secret)
+
+def attached() -> int:
+    return len(_routes)
+
+# ─────────────────────────────────────────────────────────────
+# שרת HTTP אחד לכל הבוטים, עולה פעם אחת בתוך הלולאה הקיימת
+# ─────────────────────────────────────────────────────────────
+async def serve():
+    config = uvicorn.Config(app, host=WEBHOOK_HOST, port=WEBHOOK_PORT, log_level="warning")
+    server = uvicorn.Server(config)
+    logger.info(f"Webhook gateway listening on {WEBHOOK_HOST}:{WEBHOOK_PORT}")
+    await server.serve()
+
+def ensure_server():
+    global _server_task
+    if _server_task is None or _server_task.done():
+        _server_task = asyncio.create_task(serve())